@@ -0,0 +1,63 @@
+# The AsyncInterpreter runs a Brewin program inside an asyncio event loop. It drives a
+# StackMachine in slices of steps: between slices it hands each new output line to an
+# async sink and yields to the loop, and when inputi/inputs needs a line it awaits the
+# async input source. One event loop can thus host thousands of interactive sessions
+# that mostly sit waiting for their users, without a thread per session.
+
+import asyncio
+
+from stack_machine import MachineStatus, StackMachine
+
+
+class AsyncInterpreter:
+    SLICE_STEPS = 1000
+
+    # input_source is an async function returning the next line of input, and
+    # output_sink an async function taking one line of output; slice_steps is about how
+    # many steps run before the session lets other tasks run
+    def __init__(
+        self,
+        input_source,
+        output_sink,
+        optimize=True,
+        max_steps=None,
+        slice_steps=SLICE_STEPS,
+    ):
+        self.input_source = input_source
+        self.output_sink = output_sink
+        self.slice_steps = slice_steps
+        self.machine = StackMachine(
+            console_output=False,
+            optimize=optimize,
+            max_steps=max_steps,
+            pause_on_input=True,
+        )
+
+    # run program to its end; errors are raised like Interpreter.run raises them, after
+    # the output produced before the error has reached the sink
+    async def run(self, program):
+        machine = self.machine
+        machine.start(program)
+        while True:
+            try:
+                status = machine.resume(self.slice_steps)
+            finally:
+                await self.__flush_output()
+            if status == MachineStatus.DONE:
+                return
+            if status == MachineStatus.WAITING_INPUT:
+                machine.feed_input(await self.input_source())
+            else:
+                await asyncio.sleep(0)
+
+    def get_error_type_and_line(self):
+        return self.machine.get_error_type_and_line()
+
+    # hand the lines output since the last flush to the sink; they are dropped from the
+    # machine's log so a long session does not keep all of its output
+    async def __flush_output(self):
+        log = self.machine.output_log
+        lines = log[:]
+        del log[:]
+        for line in lines:
+            await self.output_sink(str(line))
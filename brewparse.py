@@ -14,6 +14,14 @@ precedence = (
     ("right", "UMINUS", "NOT"),
 )
 
+# record the line and column of the symbol at p[index] on the element
+def set_position(p, elem, index=1):
+    lexpos = p.lexpos(index)
+    line_start = p.lexer.lexdata.rfind("\n", 0, lexpos)
+    elem.set_position(p.lineno(index), lexpos - line_start)
+    return elem
+
+
 def collapse_items(p, group_index, singleton_index):
     if len(p) == 2:
         p[0] = [p[1]]
@@ -29,6 +37,7 @@ def p_program(p):
         p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=[], functions=p[1])
     else:
         p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=p[1], functions=p[2])
+    set_position(p, p[0], 1)
 
 def p_structs(p):
     """structs : structs struct
@@ -38,6 +47,7 @@ def p_structs(p):
 def p_struct(p):
    "struct : STRUCT NAME LBRACE fields RBRACE"
    p[0] = Element(InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4])
+   set_position(p, p[0], 1)
 
 def p_fields(p):
    """fields : fields field
@@ -47,6 +57,7 @@ def p_fields(p):
 def p_field(p):
   "field : NAME COLON NAME SEMI"  # field_name: type
   p[0] = Element(InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3])
+  set_position(p, p[0], 1)
 
 def p_funcs(p):
     """funcs : funcs func
@@ -61,6 +72,7 @@ def p_func(p):
         p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9])
     else:  # handle no formal args
         p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8])
+    set_position(p, p[0], 1)
 
 def p_func2(p):
     """func : FUNC NAME LPAREN formal_args RPAREN LBRACE statements RBRACE
@@ -69,6 +81,7 @@ def p_func2(p):
         p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7])
     else:  # handle no formal args
         p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6])
+    set_position(p, p[0], 1)
 
 def p_formal_args(p):
     """formal_args : formal_args COMMA formal_arg
@@ -83,6 +96,7 @@ def p_formal_arg(p):
       p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = None)
     else:
       p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = p[3])
+    set_position(p, p[0], 1)
 
 def p_statements(p):
     """statements : statements statement
@@ -97,6 +111,7 @@ def p_statement___assign(p):
 def p_assign(p):
     "assign : variable_w_dot ASSIGN expression"
     p[0] = Element("=", name=p[1], expression=p[3])
+    set_position(p, p[0], 1)
 
 def p_statement___var(p):
     """statement : VAR variable COLON NAME SEMI
@@ -105,6 +120,7 @@ def p_statement___var(p):
       p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4])
     else:
       p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None)
+    set_position(p, p[0], 1)
 
 def p_variable(p):
     "variable : NAME"
@@ -136,10 +152,12 @@ def p_statement_if(p):
             statements=p[6],
             else_statements=p[10],
         )
+    set_position(p, p[0], 1)
 
 def p_statement_try(p):
     """statement : TRY LBRACE statements RBRACE catchers"""
     p[0] = Element(InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5])
+    set_position(p, p[0], 1)
 
 def p_catches(p):
     """catchers : catchers catch
@@ -149,14 +167,17 @@ def p_catches(p):
 def p_catch(p):
     "catch : CATCH STRING LBRACE statements RBRACE"
     p[0] = Element(InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4])
+    set_position(p, p[0], 1)
 
 def p_statement_for(p):
     "statement : FOR LPAREN assign SEMI expression SEMI assign RPAREN LBRACE statements RBRACE"
     p[0] = Element(InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10])
+    set_position(p, p[0], 1)
 
 def p_statement_raise(p):
     "statement : RAISE expression SEMI"
     p[0] = Element(InterpreterBase.RAISE_NODE, exception_type=p[2])
+    set_position(p, p[0], 1)
 
 def p_statement_expr(p):
     "statement : expression SEMI"
@@ -171,20 +192,24 @@ def p_statement_return(p):
     else:
         expr = None
     p[0] = Element(InterpreterBase.RETURN_NODE, expression=expr)
+    set_position(p, p[0], 1)
 
 
 def p_expression_not(p):
     "expression : NOT expression"
     p[0] = Element(InterpreterBase.NOT_NODE, op1=p[2])
+    set_position(p, p[0], 1)
 
 
 def p_expression_uminus(p):
     "expression : MINUS expression %prec UMINUS"
     p[0] = Element(InterpreterBase.NEG_NODE, op1=p[2])
+    set_position(p, p[0], 1)
 
 def p_expression_new(p):
     "expression : NEW NAME"
     p[0] = Element(InterpreterBase.NEW_NODE, var_type=p[2])
+    set_position(p, p[0], 1)
 
 
 def p_arith_expression_binop(p):
@@ -199,6 +224,7 @@ def p_arith_expression_binop(p):
     | expression MULTIPLY expression
     | expression DIVIDE expression"""
     p[0] = Element(p[2], op1=p[1], op2=p[3])
+    set_position(p, p[0], 2)
 
 
 def p_expression_group(p):
@@ -210,11 +236,13 @@ def p_expression_and_or(p):
     """expression : expression OR expression
     | expression AND expression"""
     p[0] = Element(p[2], op1=p[1], op2=p[3])
+    set_position(p, p[0], 2)
 
 
 def p_expression_number(p):
     "expression : NUMBER"
     p[0] = Element(InterpreterBase.INT_NODE, val=p[1])
+    set_position(p, p[0], 1)
 
 
 def p_expression_bool(p):
@@ -222,21 +250,25 @@ def p_expression_bool(p):
     | FALSE"""
     bool_val = p[1] == InterpreterBase.TRUE_DEF
     p[0] = Element(InterpreterBase.BOOL_NODE, val=bool_val)
+    set_position(p, p[0], 1)
 
 
 def p_expression_nil(p):
     "expression : NIL"
     p[0] = Element(InterpreterBase.NIL_NODE)
+    set_position(p, p[0], 1)
 
 
 def p_expression_string(p):
     "expression : STRING"
     p[0] = Element(InterpreterBase.STRING_NODE, val=p[1])
+    set_position(p, p[0], 1)
 
 
 def p_expression_variable(p):
     "expression : variable_w_dot"
     p[0] = Element(InterpreterBase.VAR_NODE, name=p[1])
+    set_position(p, p[0], 1)
 
 
 def p_func_call(p):
@@ -246,6 +278,7 @@ def p_func_call(p):
         p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=p[3])
     else:
         p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=[])
+    set_position(p, p[0], 1)
 
 
 def p_expression_args(p):
@@ -264,7 +297,7 @@ def p_error(p):
 # exported function
 def parse_program(program):
     reset_lineno()
-    ast = yacc.parse(program)
+    ast = yacc.parse(program, tracking=True)
     if ast is None:
         raise SyntaxError("Syntax error")
     return ast
@@ -1,7 +1,16 @@
 class Element:
+    # slots keep every node compact; line_num/col_num are filled in by the parser and
+    # cache is free for the interpreter to remember per-node decisions. field_reads is
+    # set on an expression a thunk is made of when it reads struct fields (structs.py)
+    __slots__ = ("elem_type", "dict", "line_num", "col_num", "cache", "field_reads")
+
     def __init__(self, elem_type, **kwargs):
         self.elem_type = elem_type
         self.dict = {}
+        self.line_num = None
+        self.col_num = None
+        self.cache = None
+        self.field_reads = None
         for key, value in kwargs.items():
             self.dict[key] = value
 
@@ -10,6 +19,12 @@ class Element:
             return None
         return self.dict[key]
 
+    # copy the source position of another node (used when a node is rewritten)
+    def set_position(self, line_num, col_num=None):
+        self.line_num = line_num
+        self.col_num = col_num
+        return self
+
     def __str__(self):
         s = f"{self.elem_type}: "
         for key, value in self.dict.items():
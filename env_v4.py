@@ -7,7 +7,8 @@ class EnvironmentManager:
     def __init__(self):
         self.environment = []
         self.curr_env_ptr = self.environment
-        self.nested_trys = 0
+        # catch indexes (exception type -> catch node) of the try statements being run
+        self.handlers = []
 
     # returns a VariableDef object
     def get(self, symbol):
@@ -6,6 +6,8 @@ class ErrorType(Enum):
     TYPE_ERROR = 1
     NAME_ERROR = 2  # if a variable or function name can't be found
     FAULT_ERROR = 3  # used if an object reference is null and used to make a call
+    TIMEOUT_ERROR = 4  # used if a program exceeds its step budget or time limit
+    MEMORY_ERROR = 5  # used if a program exceeds its memory quota
     # Add others here
 
 
@@ -1,15 +1,30 @@
 # document that we won't have a return inside the init/update of a for loop
 
 import copy
+import functools
+import sys
+import time
 from enum import Enum
 
 from brewparse import parse_program
+from element import Element
 from env_v4 import EnvironmentManager
 from intbase import InterpreterBase, ErrorType
+from memory_meter import MemoryMeter
+from natives import NATIVES, NativeError
+from optimizer import Optimizer
+from speculation import Speculator
+from structs import FieldPath, bind_field_reads, build_layouts, capture_fields
+from thunk_stats import ThunkStats
+from trace_hooks import TraceHooks, print_event
+from type_inference import TypeInference
 from type_valuev4 import (
     Type,
+    PRINT_FORMATTERS,
     Value,
     Thunk,
+    StringRope,
+    concat_strings,
     create_value,
     get_printable,
     # get_printable_debug,
@@ -28,31 +43,252 @@ from type_valuev4 import (
 class ExecStatus(Enum):
     CONTINUE = 1
     RETURN = 2
-    RAISE = 3  # Add a status to raise an error
+
+
+# carries a raised exception straight to the try statement whose catch handles it;
+# handler_depth is that try's position on the handler stack
+class RaiseSignal(Exception):
+    def __init__(self, value_obj, handler_depth, line_num=None):
+        super().__init__()
+        self.value_obj = value_obj
+        self.handler_depth = handler_depth
+        self.line_num = line_num
 
 
 # Main interpreter class
 class Interpreter(InterpreterBase):
     # constants
     NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
+    # what a division by zero raises, from the division's line
+    DIV0_VALUE = Value(Type.STRING, "div0")
     TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    LITERAL_NODES = {
+        InterpreterBase.INT_NODE,
+        InterpreterBase.STRING_NODE,
+        InterpreterBase.BOOL_NODE,
+    }
+    EQUALITY_OPS = frozenset(["==", "!="])
+    # unary operator -> (operand type, function on the raw operand)
+    UNARY_OPS = {
+        InterpreterBase.NEG_NODE: (Type.INT, lambda x: -x),
+        InterpreterBase.NOT_NODE: (Type.BOOL, lambda x: not x),
+    }
+    # an operator node that keeps seeing new operand types stops specializing
+    MAX_OP_DEOPTS = 4
+    GENERIC_OP = (None, None, None, None, MAX_OP_DEOPTS)
+    # stands for an argument whose value is not known at a call
+    UNPROBED = object()
+    # how many unforced variables deep __probe looks for an argument's value
+    PROBE_DEPTH = 8
+    # raw Python value class -> Brewin type, for run_function's arguments
+    RAW_TYPES = {
+        int: Type.INT,
+        bool: Type.BOOL,
+        str: Type.STRING,
+        StringRope: Type.STRING,
+        type(None): Type.NIL,
+    }
+    # how many steps run between checks of the wall-clock deadline
+    STEP_CHECK_INTERVAL = 1024
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    # optimize runs the Optimizer over the ast between parsing and execution;
+    # max_steps bounds the statements executed plus expressions evaluated by one run,
+    # timeout bounds its wall-clock time in seconds and memory_quota the approximate
+    # bytes its values, snapshots, frames and output may hold; all default to unlimited.
+    # tier_up_threshold turns on tier-up (see tier_up.py): a function called that many
+    # times runs as compiled Python from then on. Compiled code counts no steps and
+    # reports no trace events, so tier-up stays off in runs with limits or hooks.
+    # speculation_workers starts that many worker processes to evaluate calls of pure,
+    # expensive functions in parallel (see speculation.py); off in the same runs. The
+    # workers outlive a run so later runs reuse them; close() stops them, as does
+    # leaving a with block over the interpreter.
+    # trace_output installs a hook that prints every trace event (see trace_hooks.py);
+    # the optimizer inlines no function in runs with hooks, so every call is reported.
+    # CPython keeps up to 29 instance attributes in its fast shared layout; state the
+    # hot paths do not need goes on helper objects like hooks to stay under that
+    def __init__(
+        self,
+        console_output=True,
+        inp=None,
+        trace_output=False,
+        thunk_stats=False,
+        optimize=True,
+        max_steps=None,
+        timeout=None,
+        memory_quota=None,
+        tier_up_threshold=None,
+        speculation_workers=None,
+    ):
         super().__init__(console_output, inp)
-        self.trace_output = trace_output
+        self.optimize = optimize
+        self.optimizer_stats = None
+        self.type_check_report = None
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.memory_quota = memory_quota
+        self.memory_meter = None
+        # replaced by a new ThunkStats at every run when collecting thunk stats
+        self.thunk_stats = ThunkStats() if thunk_stats else None
+        self.thunk_report = None
+        self.tier_up_threshold = tier_up_threshold
+        self.tier_up = None
+        self.tier_up_report = None
+        self.speculation = None
+        if speculation_workers:
+            self.speculation = Speculator(speculation_workers)
+        self.hooks = TraceHooks()
+        if trace_output:
+            for event in TraceHooks.EVENTS:
+                self.hooks.add(event, print_event)
         self.__setup_ops()
 
+    # register hook(event, function, line_num, data) for a TraceHooks event, only for
+    # the events of the named functions if functions is given; takes effect at the next
+    # run. Returns a handle for remove_hook()
+    def add_hook(self, event, hook, functions=None):
+        return self.hooks.add(event, hook, functions)
+
+    def remove_hook(self, handle):
+        self.hooks.remove(handle)
+
+    # stop the speculation workers, if any
+    def close(self):
+        if self.speculation is not None:
+            self.speculation.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     # run a program that's provided in a string
     # use the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     # @debug_logger
     def run(self, program):
+        self.__start(program)
+        try:
+            self.__call_func_aux("main", [])
+        finally:
+            self.__finish()
+
+    # run the function name of program instead of main, on args (raw values: int, bool,
+    # str or None), and return the Value it returns, forced
+    def run_function(self, program, name, args):
+        self.__start(program, (name, len(args)))
+        try:
+            func_ast = self.__get_func_by_name(name, len(args))
+            return self.__run_on_values(func_ast, args)
+        finally:
+            self.__finish()
+
+    # run the function name of program on every row of args, a list of NumPy arrays
+    # with one argument each, and return a NumPy array of what it returns (see
+    # vectorize.py). Rows the BatchEvaluator cannot evaluate as arrays run here, in
+    # order, one by one like run_function
+    def run_batch(self, program, name, args):
+        # imported here: NumPy is only needed for batches
+        from vectorize import BatchEvaluator
+
+        self.__start(program, (name, len(args)))
+        try:
+            func_ast = self.__get_func_by_name(name, len(args))
+            evaluator = BatchEvaluator(
+                self.func_name_to_ast, self.__can_leave_tree_walker()
+            )
+            return evaluator.run(
+                func_ast, args, lambda row: self.__run_on_values(func_ast, row)
+            )
+        finally:
+            self.__finish()
+
+    # run func_ast on raw argument values and return the Value it returns, forced
+    def __run_on_values(self, func_ast, args):
+        arg_values = {}
+        for index, (formal_ast, arg) in enumerate(zip(func_ast.get("args"), args)):
+            arg_type = Interpreter.RAW_TYPES.get(arg.__class__)
+            if arg_type is None:
+                super().error(
+                    ErrorType.TYPE_ERROR,
+                    f"Unsupported type {arg.__class__.__name__} for argument "
+                    f"{index + 1} of {func_ast.get('name')}",
+                )
+            arg_values[formal_ast.get("name")] = Value(arg_type, arg)
+        return_val = self.__run_body(func_ast, arg_values)
+        return self.__force_thunk_evaluation(return_val)
+
+    # parse program and set up everything a run needs; entry is the (name, number of
+    # args) of the function the run starts in when that is not main, whose parameters
+    # hold values the type inference cannot see
+    def __start(self, program, entry=None):
         ast = parse_program(program)
+        if self.optimize:
+            optimizer = Optimizer(self.op_to_lambda)
+            ast = optimizer.optimize(ast, inline=not self.hooks)
+            self.optimizer_stats = optimizer.stats
+            inference = TypeInference(self.find_quick_op)
+            param_types = None
+            if entry is not None:
+                param_types = {entry: [None] * entry[1]}
+            inference.annotate(ast, param_types)
+            self.type_check_report = inference.report
         self.__set_up_function_table(ast)
+        self.__resolve_sites(ast)
         self.env = EnvironmentManager()
-        self.__call_func_aux("main", [])
+        if self.thunk_stats is not None:
+            self.thunk_stats = ThunkStats()
+        self.__start_step_limits()
+        if self.memory_quota is not None:
+            self.memory_meter = MemoryMeter(self.memory_quota)
+        self.hooks.prepare()
+        self.tier_up = None
+        if self.tier_up_threshold is not None and self.__can_leave_tree_walker():
+            # imported here: the transpiler builds on this module
+            from tier_up import TierUp
+
+            self.tier_up = TierUp(
+                program,
+                self.optimize,
+                self.tier_up_threshold,
+                self,
+                lambda exception_type, line_num: self.__raise(
+                    Value(Type.STRING, exception_type), line_num
+                ),
+                self.__force_thunk_evaluation,
+            )
+        if self.speculation is not None and self.__can_leave_tree_walker():
+            self.speculation.start(program, self.optimize)
+            for call_ast, later_calls in self.speculation.plan(
+                ast, self.func_name_to_ast
+            ):
+                call_ast.cache = functools.partial(
+                    Interpreter.__call_speculating,
+                    call_ast=call_ast,
+                    func_ast=call_ast.cache,
+                    later_calls=later_calls,
+                )
+
+    # the reports are also produced when the program ends with an error
+    def __finish(self):
+        if self.thunk_stats is not None:
+            self.thunk_report = self.thunk_stats.report()
+        if self.tier_up is not None:
+            self.tier_up_report = self.tier_up.report()
+        if self.speculation is not None:
+            self.speculation.finish()
+
+    # whether code may run outside the tree walker, which counts steps, time and memory
+    # and reports trace events
+    def __can_leave_tree_walker(self):
+        return (
+            self.max_steps is None
+            and self.timeout is None
+            and self.memory_quota is None
+            and not self.hooks
+        )
 
     # @debug_logger
     def __set_up_function_table(self, ast):
@@ -64,30 +300,124 @@ class Interpreter(InterpreterBase):
                 self.func_name_to_ast[func_name] = {}
             self.func_name_to_ast[func_name][num_params] = func_def
 
+    # bind every call site whose target is known to it ahead of time, and record the
+    # ones that name no builtin or function (they fail only if they actually run).
+    # Struct sites are bound too (see structs.py): a new node to its type's layout, or
+    # None for an unknown type, a dotted name read or assigned to its FieldPath, and an
+    # expression a thunk is made of to the fields it reads
+    def __resolve_sites(self, ast):
+        self.unresolved_calls = []
+        layouts = build_layouts(ast)
+        pending = [ast]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(node)
+            elif isinstance(node, Element):
+                if node.elem_type == InterpreterBase.FCALL_NODE:
+                    name = node.get("name")
+                    num_args = len(node.get("args"))
+                    node.cache = self.__find_call_target(name, num_args)
+                    if node.cache is None:
+                        self.unresolved_calls.append((name, num_args, node.line_num))
+                elif node.elem_type == InterpreterBase.NEW_NODE:
+                    node.cache = layouts.get(node.get("var_type"))
+                elif node.elem_type in (InterpreterBase.VAR_NODE, "="):
+                    if "." in node.get("name"):
+                        node.cache = FieldPath(node.get("name"), layouts.values())
+                pending.extend(node.dict.values())
+        if layouts:
+            bind_field_reads(ast)
+        self.unresolved_calls.sort(key=lambda call: call[2] or 0)
+
+    # a call target is either a builtin handler or a function's ast; a native builtin
+    # is only called when the program has no function of its name and arity
+    def __find_call_target(self, name, num_params):
+        if name in Interpreter.BUILTIN_FUNCS:
+            return Interpreter.BUILTIN_FUNCS[name]
+        func_ast = self.func_name_to_ast.get(name, {}).get(num_params)
+        if func_ast is None:
+            native = NATIVES.get(name, num_params)
+            if native is not None:
+                return functools.partial(Interpreter.__call_native, native=native)
+        return func_ast
+
     # @debug_logger
-    def __get_func_by_name(self, name, num_params):
+    def __get_func_by_name(self, name, num_params, line_num=None):
         if name not in self.func_name_to_ast:
-            super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
+            super().error(ErrorType.NAME_ERROR, f"Function {name} not found", line_num)
         candidate_funcs = self.func_name_to_ast[name]
         if num_params not in candidate_funcs:
             super().error(
                 ErrorType.NAME_ERROR,
                 f"Function {name} taking {num_params} params not found",
+                line_num,
             )
         return candidate_funcs[num_params]
 
+    # the step counter counts down to the next limit check, so the hot paths only pay
+    # for a decrement and a comparison
+    def __start_step_limits(self):
+        self.steps_taken = 0
+        self.__deadline = None
+        if self.timeout is not None:
+            self.__deadline = time.monotonic() + self.timeout
+        self.__reset_step_countdown()
+
+    def __reset_step_countdown(self):
+        self.__step_chunk = Interpreter.STEP_CHECK_INTERVAL
+        if self.max_steps is not None:
+            # land a check exactly on the first step past the budget
+            self.__step_chunk = max(
+                1, min(self.__step_chunk, self.max_steps - self.steps_taken + 1)
+            )
+        self.__steps_left = self.__step_chunk
+
+    def __check_step_limits(self):
+        self.steps_taken += self.__step_chunk
+        if self.max_steps is not None and self.steps_taken > self.max_steps:
+            super().error(
+                ErrorType.TIMEOUT_ERROR,
+                f"Step budget of {self.max_steps} steps exceeded",
+            )
+        if self.__deadline is not None and time.monotonic() > self.__deadline:
+            super().error(
+                ErrorType.TIMEOUT_ERROR,
+                f"Time limit of {self.timeout} seconds exceeded",
+            )
+        self.__reset_step_countdown()
+
+    def __charge_memory(self, num_bytes):
+        if not self.memory_meter.charge(num_bytes):
+            return
+        live = self.memory_meter.measure(
+            [self.env.environment, self.env.curr_env_ptr, self.output_log]
+        )
+        if live > self.memory_quota:
+            super().error(
+                ErrorType.MEMORY_ERROR,
+                f"Memory quota of {self.memory_quota} bytes exceeded",
+            )
+
     # @debug_logger
     def __run_statements(self, statements):
         self.env.push_block()
-        for statement in statements:
-            if self.trace_output:
-                print(statement)
-            status, return_val = self.__run_statement(statement)
-            if status == ExecStatus.RETURN or status == ExecStatus.RAISE:
-                self.env.pop_block()
-                return (status, return_val)
-
-        self.env.pop_block()
+        on_statement = self.hooks.on_statement
+        # the block is also popped when a raise unwinds through it
+        try:
+            if self.memory_meter is not None:
+                self.__charge_memory(MemoryMeter.FRAME_BYTES)
+            for statement in statements:
+                self.__steps_left -= 1
+                if self.__steps_left <= 0:
+                    self.__check_step_limits()
+                if on_statement is not None:
+                    on_statement(self.hooks.function, statement.line_num, statement)
+                status, return_val = self.__run_statement(statement)
+                if status == ExecStatus.RETURN:
+                    return (status, return_val)
+        finally:
+            self.env.pop_block()
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
     # @debug_logger
@@ -95,10 +425,7 @@ class Interpreter(InterpreterBase):
         status = ExecStatus.CONTINUE
         return_val = None
         if statement.elem_type == InterpreterBase.FCALL_NODE:
-            func_status, func_return_val = self.__call_func(statement)
-            if func_status == ExecStatus.RAISE:
-                status = func_status
-                return_val = func_return_val
+            self.__call_func(statement)
         elif statement.elem_type == "=":
             self.__assign(statement)
         elif statement.elem_type == InterpreterBase.VAR_DEF_NODE:
@@ -112,94 +439,279 @@ class Interpreter(InterpreterBase):
         elif statement.elem_type == InterpreterBase.TRY_NODE:
             status, return_val = self.__do_try(statement)
         elif statement.elem_type == InterpreterBase.RAISE_NODE:
-            status, return_val = self.__do_raise(statement)
+            self.__do_raise(statement)
         return (status, return_val)
 
     # @debug_logger
     def __call_func(self, call_node):
-        func_name = call_node.get("name")
-        actual_args = call_node.get("args")
-        return self.__call_func_aux(func_name, actual_args)
+        target = call_node.cache
+        if target is None:
+            # unresolved call site: reports the missing function
+            return self.__call_func_aux(
+                call_node.get("name"), call_node.get("args"), call_node.line_num
+            )
+        if target.__class__ is Element:
+            return self.__run_func(target, call_node.get("args"), call_node.line_num)
+        return target(self, call_node.get("args"), call_node.line_num)
 
     # @debug_logger
-    def __call_func_aux(self, func_name, actual_args):
-        if func_name == "print":
-            status, result = self.__call_print(actual_args)
-            return status, result
-        if func_name == "inputi" or func_name == "inputs":
-            status, result = self.__call_input(func_name, actual_args)
-            return status, result
-
-        func_ast = self.__get_func_by_name(func_name, len(actual_args))
+    def __call_func_aux(self, func_name, actual_args, line_num=None):
+        if func_name in Interpreter.BUILTIN_FUNCS:
+            handler = Interpreter.BUILTIN_FUNCS[func_name]
+            return handler(self, actual_args, line_num)
+        func_ast = self.__get_func_by_name(func_name, len(actual_args), line_num)
+        return self.__run_func(func_ast, actual_args, line_num)
+
+    # run a user-defined function; lookup guarantees the argument counts match
+    def __run_func(self, func_ast, actual_args, line_num=None, tree_walk=False):
+        if self.hooks.active and not tree_walk:
+            return self.__run_traced(func_ast, actual_args, line_num)
+        if self.tier_up is not None and not tree_walk:
+            return self.__run_tiered(func_ast, actual_args, line_num)
         formal_args = func_ast.get("args")
-        if len(actual_args) != len(formal_args):
-            super().error(
-                ErrorType.NAME_ERROR,
-                f"Function {func_ast.get('name')} with {len(actual_args)} args not found",
-            )
 
         # first evaluate all of the actual parameters and associate them with the formal parameter names
         # pass actual parameters as a thunk object
         args = {}
         for formal_ast, actual_ast in zip(formal_args, actual_args):
             # enforce lazy evaluation by passing a thunk object
-            result = Value(Type.THUNK, Thunk(actual_ast, self.env.curr_env_ptr))
+            result = self.__make_thunk(
+                actual_ast, self.env.curr_env_ptr, ThunkStats.ARGUMENT_SITE
+            )
             arg_name = formal_ast.get("name")
             args[arg_name] = result
+        return self.__run_body(func_ast, args)
 
-        # then create the new activation record
+    # run a function's statements in a new activation record holding args, a dict of
+    # argument name -> Value
+    def __run_body(self, func_ast, args):
         self.env.push_func()
+        try:
+            if self.memory_meter is not None:
+                self.__charge_memory(MemoryMeter.FRAME_BYTES)
 
-        # and add the formal arguments to the activation record
-        for arg_name, value in args.items():
-            self.env.create(arg_name, value)
-        status, return_val = self.__run_statements(func_ast.get("statements"))
-        if self.env.nested_trys == 0 and status == ExecStatus.RAISE:
-            super().error(
-                ErrorType.FAULT_ERROR,
-                "Raise condition is not caught",
+            # and add the formal arguments to the activation record
+            for arg_name, value in args.items():
+                self.env.create(arg_name, value)
+            status, return_val = self.__run_statements(func_ast.get("statements"))
+        finally:
+            self.env.pop_func()
+        return return_val
+
+    # With hooks installed, every call of a user function comes here to report its call
+    # and return and to make it the running function while its body runs
+    def __run_traced(self, func_ast, actual_args, line_num):
+        hooks = self.hooks
+        name = func_ast.get("name")
+        if hooks.on_call is not None:
+            hooks.on_call(name, line_num, actual_args)
+        caller_name = hooks.function
+        hooks.function = name
+        try:
+            return_val = self.__run_func(
+                func_ast, actual_args, line_num, tree_walk=True
             )
-        self.env.pop_func()
-        return (status, return_val)
+        finally:
+            hooks.function = caller_name
+        if hooks.on_return is not None:
+            hooks.on_return(name, line_num, return_val)
+        return return_val
+
+    # A call of a pure, expensive function in a group (see speculation.py) first sends
+    # the later calls of its group whose arguments are known to the workers, then takes
+    # its own worker's result or runs the function here
+    def __call_speculating(
+        self, actual_args, line_num, call_ast, func_ast, later_calls
+    ):
+        speculation = self.speculation
+        for later_ast, later_func_ast in later_calls:
+            args = [self.__probe(arg_ast) for arg_ast in later_ast.get("args")]
+            if all(arg is not Interpreter.UNPROBED for arg in args):
+                speculation.submit(later_ast, later_func_ast, args)
+        args = [self.__probe(arg_ast) for arg_ast in actual_args]
+        if all(arg is not Interpreter.UNPROBED for arg in args):
+            value_obj = speculation.take(call_ast, args)
+            if value_obj is not None:
+                return value_obj
+        return self.__run_func(func_ast, actual_args, line_num)
+
+    # With tier-up on, every call of a user function comes here to be counted. Once the
+    # function has compiled code, a call whose arguments are already values of the
+    # types that code is specialized to runs it, passing the arguments it is not
+    # specialized on as thunks; any other call deopts to the tree walker
+    def __run_tiered(self, func_ast, actual_args, line_num):
+        tier_up = self.tier_up
+        profile = tier_up.profile(func_ast)
+        if profile.deoptimized:
+            return self.__run_func(func_ast, actual_args, line_num, tree_walk=True)
+        args = [self.__probe(arg_ast) for arg_ast in actual_args]
+        if profile.entry is None:
+            tier_up.record_call(profile, args)
+        elif profile.accepts(args):
+            for index, arg in enumerate(args):
+                if arg is Interpreter.UNPROBED:
+                    args[index] = tier_up.lazy_argument(
+                        self.__make_thunk(
+                            actual_args[index],
+                            self.env.curr_env_ptr,
+                            ThunkStats.ARGUMENT_SITE,
+                        )
+                    )
+            return tier_up.call(profile, args)
+        else:
+            tier_up.record_deopt(profile)
+        start = time.perf_counter()
+        compiled_runs = tier_up.compiled_runs
+        result = self.__run_func(func_ast, actual_args, line_num, tree_walk=True)
+        if tier_up.compiled_runs == compiled_runs:
+            profile.record_walked(time.perf_counter() - start)
+        return result
+
+    # the raw value of an argument if finding it runs nothing observable, else UNPROBED:
+    # it must be a literal, a variable, or an operator over those whose operand values
+    # have types it takes (for /, with a divisor other than 0). A variable that is not
+    # forced yet is probed through its thunk's expression, up to depth thunks deep
+    def __probe(self, expr_ast, depth=PROBE_DEPTH):
+        elem_type = expr_ast.elem_type
+        if elem_type in Interpreter.LITERAL_NODES:
+            return expr_ast.get("val")
+        if elem_type == InterpreterBase.NIL_NODE:
+            return None
+        if elem_type == InterpreterBase.VAR_NODE:
+            val = self.env.get(expr_ast.get("name"))
+            if val is None or val.type() == Type.STRUCT:
+                # structs are mutable, so only their own field reads may see them
+                return Interpreter.UNPROBED
+            if val.type() != Type.THUNK:
+                return val.value()
+            thunk = val.value()
+            if thunk.__class__ is not Thunk or depth == 0:
+                return Interpreter.UNPROBED
+            prev_env = self.env.curr_env_ptr
+            self.env.curr_env_ptr = thunk.env_snapshot()
+            try:
+                return self.__probe(thunk.expr(), depth - 1)
+            finally:
+                self.env.curr_env_ptr = prev_env
+        if elem_type in Interpreter.UNARY_OPS:
+            operand_type, f = Interpreter.UNARY_OPS[elem_type]
+            operand = self.__probe(expr_ast.get("op1"), depth)
+            if operand is Interpreter.UNPROBED:
+                return operand
+            if Interpreter.RAW_TYPES.get(operand.__class__) != operand_type:
+                return Interpreter.UNPROBED
+            return f(operand)
+        if elem_type not in Interpreter.BIN_OPS:
+            return Interpreter.UNPROBED
+        left = self.__probe(expr_ast.get("op1"), depth)
+        if left is Interpreter.UNPROBED:
+            return left
+        if elem_type == "&&" and left is False:
+            return False
+        if elem_type == "||" and left is True:
+            return True
+        right = self.__probe(expr_ast.get("op2"), depth)
+        if right is Interpreter.UNPROBED:
+            return right
+        quick = self.find_quick_op(
+            elem_type,
+            Interpreter.RAW_TYPES.get(left.__class__),
+            Interpreter.RAW_TYPES.get(right.__class__),
+        )
+        if quick is None or (elem_type == "/" and right == 0):
+            return Interpreter.UNPROBED
+        return quick[1](left, right)
 
     # @debug_logger
-    def __call_print(self, args):
-        output = ""
+    def __call_print(self, args, line_num=None):
+        # format each argument once and join the fragments in a single copy
+        fragments = []
         for arg in args:
             # result is a Value object
-            status, result = self.__eval_expr(arg)
-            if status == ExecStatus.RAISE:
-                return (ExecStatus.RAISE, result)
-
-            output = output + get_printable(result)
+            result = self.__eval_expr(arg)
+            formatter = PRINT_FORMATTERS.get(result.type())
+            if formatter is None:
+                super().error(
+                    ErrorType.TYPE_ERROR, f"Cannot print a {result.type()}", line_num
+                )
+            fragments.append(formatter(result.value()))
+        output = fragments[0] if len(fragments) == 1 else "".join(fragments)
+        if self.memory_meter is not None:
+            self.__charge_memory(sys.getsizeof(output))
         super().output(output)
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+        return Interpreter.NIL_VALUE
 
     # @debug_logger
-    def __call_input(self, name, args):
+    def __call_input(self, name, args, line_num=None):
         if args is not None and len(args) == 1:
-            status, result = self.__eval_expr(args[0])
-            if status == ExecStatus.RAISE:
-                return (ExecStatus.RAISE, result)
+            result = self.__eval_expr(args[0])
             super().output(get_printable(result))
         elif args is not None and len(args) > 1:
             super().error(
-                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
+                ErrorType.NAME_ERROR,
+                "No inputi() function that takes > 1 parameter",
+                line_num,
             )
         inp = super().get_input()
+        if self.memory_meter is not None and inp is not None:
+            self.__charge_memory(sys.getsizeof(inp))
         if name == "inputi":
-            return ExecStatus.CONTINUE, Value(Type.INT, int(inp))
+            return Value(Type.INT, int(inp))
         if name == "inputs":
-            return ExecStatus.CONTINUE, Value(Type.STRING, inp)
+            return Value(Type.STRING, inp)
+
+    def __call_inputi(self, args, line_num=None):
+        return self.__call_input("inputi", args, line_num)
+
+    def __call_inputs(self, args, line_num=None):
+        return self.__call_input("inputs", args, line_num)
+
+    # builtin name -> handler(self, args, line_num); builtins shadow user functions
+    BUILTIN_FUNCS = {
+        "print": __call_print,
+        "inputi": __call_inputi,
+        "inputs": __call_inputs,
+    }
+
+    # run a native builtin (see natives.py): a strict one on the values of its
+    # arguments, a lazy one on functions that force them
+    def __call_native(self, actual_args, line_num, native):
+        try:
+            if native.strict:
+                values = [self.__eval_expr(arg_ast) for arg_ast in actual_args]
+                native.check_types([value_obj.type() for value_obj in values])
+                result = native.call([value_obj.value() for value_obj in values])
+            else:
+                result = native.call(
+                    [self.__native_argument(arg_ast) for arg_ast in actual_args]
+                )
+        except NativeError as e:
+            super().error(e.error_type, e.message, line_num)
+        if self.memory_meter is not None and result.type() == Type.STRING:
+            self.__charge_memory(sys.getsizeof(result.value()))
+        return result
+
+    # a function that forces the argument (once) and returns its raw value
+    def __native_argument(self, arg_ast):
+        value_obj = self.__make_thunk(
+            arg_ast, self.env.curr_env_ptr, ThunkStats.ARGUMENT_SITE
+        )
+        return lambda: self.__force_thunk_evaluation(value_obj).value()
 
     # @debug_logger
     def __assign(self, assign_ast):
         var_name = assign_ast.get("name")
         expr_ast = assign_ast.get("expression")
-        value_obj = Value(Type.THUNK, Thunk(expr_ast, self.env.curr_env_ptr))
+        if assign_ast.cache is not None:
+            return self.__assign_field(assign_ast.cache, expr_ast, assign_ast.line_num)
+        value_obj = self.__make_thunk(
+            expr_ast, self.env.curr_env_ptr, ThunkStats.ASSIGN_SITE
+        )
         if not self.env.set(var_name, value_obj):
             super().error(
-                ErrorType.NAME_ERROR, f"Undefined variable {var_name} in assignment"
+                ErrorType.NAME_ERROR,
+                f"Undefined variable {var_name} in assignment",
+                assign_ast.line_num,
             )
 
     # @debug_logger
@@ -207,13 +719,17 @@ class Interpreter(InterpreterBase):
         var_name = var_ast.get("name")
         if not self.env.create(var_name, Interpreter.NIL_VALUE):
             super().error(
-                ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}"
+                ErrorType.NAME_ERROR,
+                f"Duplicate definition for variable {var_name}",
+                var_ast.line_num,
             )
 
     # @debug_logger
     def __eval_expr(self, expr_ast):
         # We want to guarentee that anytime __eval_expr is called, a non-thunk object is called
-        status = ExecStatus.CONTINUE
+        self.__steps_left -= 1
+        if self.__steps_left <= 0:
+            self.__check_step_limits()
         return_val = None
         if expr_ast.elem_type == InterpreterBase.NIL_NODE:
             return_val = Interpreter.NIL_VALUE
@@ -224,36 +740,126 @@ class Interpreter(InterpreterBase):
         elif expr_ast.elem_type == InterpreterBase.BOOL_NODE:
             return_val = Value(Type.BOOL, expr_ast.get("val"))
         elif expr_ast.elem_type == InterpreterBase.VAR_NODE:
+            if expr_ast.cache is not None:
+                # a field the running thunk captured when it was made
+                val = self.env.get(expr_ast.get("name"))
+                if val is not None:
+                    return self.__force_thunk_evaluation(val)
+                return self.__eval_field(expr_ast.cache, expr_ast.line_num)
             var_name = expr_ast.get("name")
             # searches appropriate environment (either global or captured one)
             val = self.env.get(var_name)
             if val is None:
-                super().error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
+                super().error(
+                    ErrorType.NAME_ERROR,
+                    f"Variable {var_name} not found",
+                    expr_ast.line_num,
+                )
             # debug(get_printable_debug(val))
             # Force thunk to evaluate
-            status, return_val = self.__force_thunk_evaluation(val)
-            if status == ExecStatus.RAISE:
-                return (ExecStatus.RAISE, return_val)
+            return_val = self.__force_thunk_evaluation(val)
             self.__check_if_thunk(return_val)
         elif expr_ast.elem_type == InterpreterBase.FCALL_NODE:
-            status, val = self.__call_func(expr_ast)
-            if status == ExecStatus.RAISE:
-                return (ExecStatus.RAISE, val)
-            status, return_val = self.__force_thunk_evaluation(val)
-            if status == ExecStatus.RAISE:
-                return (ExecStatus.RAISE, return_val)
+            val = self.__call_func(expr_ast)
+            return_val = self.__force_thunk_evaluation(val)
             self.__check_if_thunk(return_val)
         elif expr_ast.elem_type in Interpreter.BIN_OPS:
-            status, return_val = self.__eval_op(expr_ast)
+            quick = expr_ast.cache
+            if quick is not None and quick[4] is None:
+                # operand types proven ahead of time; the result is never a thunk
+                return Value(quick[2], self.__eval_raw_node(expr_ast))
+            return_val = self.__eval_op(expr_ast)
             self.__check_if_thunk(return_val)
-        elif expr_ast.elem_type == Interpreter.NEG_NODE:
-            status, return_val = self.__eval_unary(expr_ast, Type.INT, lambda x: -1 * x)
+        elif expr_ast.elem_type in Interpreter.UNARY_OPS:
+            t, f = Interpreter.UNARY_OPS[expr_ast.elem_type]
+            if expr_ast.cache is True:
+                return Value(t, self.__eval_raw_node(expr_ast))
+            return_val = self.__eval_unary(expr_ast, t, f)
             self.__check_if_thunk(return_val)
-        elif expr_ast.elem_type == Interpreter.NOT_NODE:
-            status, return_val = self.__eval_unary(expr_ast, Type.BOOL, lambda x: not x)
-            self.__check_if_thunk(return_val)
-        # debug(f"status: {status}")
-        return (status, return_val)
+        elif expr_ast.elem_type == InterpreterBase.NEW_NODE:
+            return_val = self.__new_struct(expr_ast)
+        return return_val
+
+    # Struct fields hold Values like variables do: assigning a field stores a thunk of
+    # the expression, and reading it forces the thunk in place
+
+    def __new_struct(self, new_ast):
+        layout = new_ast.cache
+        if layout is None:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Unknown struct type {new_ast.get('var_type')}",
+                new_ast.line_num,
+            )
+        struct = layout.new()
+        if self.memory_meter is not None:
+            self.__charge_memory(sys.getsizeof(struct) + sys.getsizeof(struct.fields))
+        return Value(Type.STRUCT, struct)
+
+    # read the last field of path, forcing every value along the way
+    def __eval_field(self, path, line_num):
+        struct = self.__field_owner(path, line_num)
+        offset = self.__field_offset(struct, path, len(path.names) - 1, line_num)
+        return self.__force_thunk_evaluation(struct.fields[offset])
+
+    def __assign_field(self, path, expr_ast, line_num):
+        struct = self.__field_owner(path, line_num)
+        offset = self.__field_offset(struct, path, len(path.names) - 1, line_num)
+        struct.fields[offset] = self.__make_thunk(
+            expr_ast, self.env.curr_env_ptr, ThunkStats.ASSIGN_SITE
+        )
+
+    # the struct holding the last field of path: the variable's value, followed through
+    # every field before the last
+    def __field_owner(self, path, line_num):
+        value_obj = self.env.get(path.variable)
+        if value_obj is None:
+            super().error(
+                ErrorType.NAME_ERROR, f"Variable {path.variable} not found", line_num
+            )
+        value_obj = self.__force_thunk_evaluation(value_obj)
+        last = len(path.names) - 1
+        for index in range(last):
+            struct = self.__as_struct(value_obj, path, index, line_num)
+            offset = self.__field_offset(struct, path, index, line_num)
+            value_obj = self.__force_thunk_evaluation(struct.fields[offset])
+        return self.__as_struct(value_obj, path, last, line_num)
+
+    # the struct value_obj holds, whose index-th field of path is accessed next
+    def __as_struct(self, value_obj, path, index, line_num):
+        if value_obj.type() == Type.STRUCT:
+            return value_obj.value()
+        if value_obj.type() == Type.NIL:
+            super().error(
+                ErrorType.FAULT_ERROR,
+                f"Dereference of nil {path.prefix(index)}",
+                line_num,
+            )
+        super().error(
+            ErrorType.TYPE_ERROR, f"{path.prefix(index)} is not a struct", line_num
+        )
+
+    def __field_offset(self, struct, path, index, line_num):
+        offset = path.offset(index, struct)
+        if offset is None:
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Struct {struct.layout.name} has no field {path.names[index]}",
+                line_num,
+            )
+        return offset
+
+    # create a thunk Value, recording where it was made when collecting thunk stats
+    def __make_thunk(self, expr_ast, env, site):
+        thunk = Thunk(expr_ast, env)
+        if expr_ast.field_reads is not None:
+            capture_fields(expr_ast.field_reads, thunk.env_snapshot())
+        value_obj = Value(Type.THUNK, thunk)
+        if self.thunk_stats is not None:
+            self.thunk_stats.record_create(site, value_obj)
+        if self.memory_meter is not None:
+            self.__charge_memory(value_obj.value().snapshot_bytes())
+        return value_obj
 
     def __check_if_thunk(self, ret_val):
         if ret_val.type() == Type.THUNK:
@@ -265,23 +871,32 @@ class Interpreter(InterpreterBase):
     # @debug_logger
     def __force_thunk_evaluation(self, val):
         if val.type() == Type.THUNK:
-            # Set global searching environment to val.value().env_snapshot()
-            prev_env = self.env.curr_env_ptr
-            self.env.curr_env_ptr = val.value().env_snapshot()
-            status, value_obj = self.__eval_expr(val.value().expr())
-            # Reset global searching environment to self.env.environment
-            self.env.curr_env_ptr = prev_env
-            if status == ExecStatus.RAISE:
-                return (ExecStatus.RAISE, value_obj)
+            if val.value().__class__ is not Thunk:
+                # the lazy result of compiled code (see tier_up.py)
+                value_obj = self.tier_up.force(val.value())
+            else:
+                # Set global searching environment to val.value().env_snapshot()
+                prev_env = self.env.curr_env_ptr
+                self.env.curr_env_ptr = val.value().env_snapshot()
+                try:
+                    value_obj = self.__eval_expr(val.value().expr())
+                finally:
+                    # Reset global searching environment to self.env.environment
+                    self.env.curr_env_ptr = prev_env
+            if self.hooks.on_force is not None:
+                line_num = val.value().expr().line_num
+                self.hooks.on_force(self.hooks.function, line_num, value_obj)
             val.set_value_type(value_obj.value(), value_obj.type())
-        return (ExecStatus.CONTINUE, val)
+            if self.thunk_stats is not None:
+                self.thunk_stats.record_force(val)
+        elif self.thunk_stats is not None:
+            self.thunk_stats.record_read(val)
+        return val
 
     # @debug_logger
     def __eval_op(self, arith_ast):
         operator = arith_ast.elem_type
-        left_status, left_value_obj = self.__eval_expr(arith_ast.get("op1"))
-        if left_status == ExecStatus.RAISE:
-            return (ExecStatus.RAISE, left_value_obj)
+        left_value_obj = self.__eval_expr(arith_ast.get("op1"))
 
         # short_circuit
         if (
@@ -289,50 +904,153 @@ class Interpreter(InterpreterBase):
             and left_value_obj.type() == Type.BOOL
             and left_value_obj.value() == False
         ):
-            return ExecStatus.CONTINUE, Value(Type.BOOL, False)
+            return Value(Type.BOOL, False)
         # short_circuit
         if (
             operator == "||"
             and left_value_obj.type() == Type.BOOL
             and left_value_obj.value() == True
         ):
-            return ExecStatus.CONTINUE, Value(Type.BOOL, True)
-        right_status, right_value_obj = self.__eval_expr(arith_ast.get("op2"))
+            return Value(Type.BOOL, True)
+        right_value_obj = self.__eval_expr(arith_ast.get("op2"))
+
+        # fast path: the node has specialized itself to these operand types
+        quick = arith_ast.cache
+        if (
+            quick is not None
+            and quick[0] == left_value_obj.type()
+            and quick[1] == right_value_obj.type()
+        ):
+            try:
+                raw = quick[3](left_value_obj.value(), right_value_obj.value())
+            except ZeroDivisionError:
+                self.__raise(Interpreter.DIV0_VALUE, arith_ast.line_num)
+            result = Value(quick[2], raw)
+            if self.memory_meter is not None and quick[2] == Type.STRING:
+                self.__charge_memory(sys.getsizeof(result.value()))
+            return result
+        self.__quicken_op(arith_ast, left_value_obj.type(), right_value_obj.type())
 
-        if right_status == ExecStatus.RAISE:
-            return (ExecStatus.RAISE, right_value_obj)
         if not self.__compatible_types(operator, left_value_obj, right_value_obj):
             super().error(
                 ErrorType.TYPE_ERROR,
                 f"Incompatible types {left_value_obj.type()} {right_value_obj.type()} for {operator} operation",
+                arith_ast.line_num,
             )
 
         if operator not in self.op_to_lambda[left_value_obj.type()]:
             super().error(
                 ErrorType.TYPE_ERROR,
                 f"Incompatible operator {operator} for type {left_value_obj.type()}",
+                arith_ast.line_num,
             )
         f = self.op_to_lambda[left_value_obj.type()][operator]
-        return ExecStatus.CONTINUE, f(left_value_obj, right_value_obj)
+        try:
+            result = f(left_value_obj, right_value_obj)
+        except ZeroDivisionError:
+            self.__raise(Interpreter.DIV0_VALUE, arith_ast.line_num)
+        if self.memory_meter is not None and result.type() == Type.STRING:
+            self.__charge_memory(sys.getsizeof(result.value()))
+        return result
+
+    # Operators whose operand types TypeInference proved need no guards, so their
+    # whole subtree is evaluated on raw Python values: literals and proven operators
+    # in it never allocate a Value, and only the root's result is boxed
+
+    # evaluate expr_ast to a raw value, without boxing it when it is proven
+    def __eval_raw(self, expr_ast):
+        elem_type = expr_ast.elem_type
+        if elem_type in Interpreter.BIN_OPS:
+            quick = expr_ast.cache
+            proven = quick is not None and quick[4] is None
+        else:
+            proven = elem_type in Interpreter.LITERAL_NODES or (
+                elem_type in Interpreter.UNARY_OPS and expr_ast.cache is True
+            )
+        if not proven and elem_type != InterpreterBase.VAR_NODE:
+            return self.__eval_expr(expr_ast).value()
+        self.__steps_left -= 1
+        if self.__steps_left <= 0:
+            self.__check_step_limits()
+        if elem_type in Interpreter.LITERAL_NODES:
+            return expr_ast.get("val")
+        if elem_type == InterpreterBase.VAR_NODE:
+            # the variable's Value already exists, so reading it allocates nothing
+            val = self.env.get(expr_ast.get("name"))
+            if val is None:
+                super().error(
+                    ErrorType.NAME_ERROR,
+                    f"Variable {expr_ast.get('name')} not found",
+                    expr_ast.line_num,
+                )
+            return self.__force_thunk_evaluation(val).value()
+        return self.__eval_raw_node(expr_ast)
+
+    # evaluate a proven operator node to a raw value (its step is already counted)
+    def __eval_raw_node(self, expr_ast):
+        operator = expr_ast.elem_type
+        if operator in Interpreter.UNARY_OPS:
+            return Interpreter.UNARY_OPS[operator][1](
+                self.__eval_raw(expr_ast.get("op1"))
+            )
+        left = self.__eval_raw(expr_ast.get("op1"))
+        if operator == "&&" and not left:
+            return False
+        if operator == "||" and left:
+            return True
+        quick = expr_ast.cache
+        right = self.__eval_raw(expr_ast.get("op2"))
+        try:
+            result = quick[3](left, right)
+        except ZeroDivisionError:
+            self.__raise(Interpreter.DIV0_VALUE, expr_ast.line_num)
+        if self.memory_meter is not None and quick[2] == Type.STRING:
+            self.__charge_memory(sys.getsizeof(result))
+        return result
+
+    # specialize an operator node to the operand types it just saw. The cache holds
+    # (left type, right type, result type, function on raw values, deopt count); a
+    # guard failure (deopt) respecializes until the node proves polymorphic. Nodes
+    # proven by TypeInference have a deopt count of None and never get here
+    def __quicken_op(self, arith_ast, left_type, right_type):
+        deopts = 0
+        if arith_ast.cache is not None:
+            deopts = arith_ast.cache[4] + 1
+            if deopts >= Interpreter.MAX_OP_DEOPTS:
+                arith_ast.cache = Interpreter.GENERIC_OP
+                return
+        quick = self.find_quick_op(arith_ast.elem_type, left_type, right_type)
+        if quick is not None:
+            arith_ast.cache = (left_type, right_type, quick[0], quick[1], deopts)
+
+    # (result type, function on raw values) for an operation on operands of these
+    # types, or None if the operation is a type error
+    def find_quick_op(self, operator, left_type, right_type):
+        if left_type == right_type:
+            return self.quick_ops.get((left_type, operator))
+        if operator in Interpreter.EQUALITY_OPS and left_type in self.op_to_lambda:
+            # values of different types are never equal
+            result = operator == "!="
+            return (Type.BOOL, lambda x, y: result)
+        return None
 
     # @debug_logger
     def __compatible_types(self, oper, obj1, obj2):
         # DOCUMENT: allow comparisons ==/!= of anything against anything
-        if oper in ["==", "!="]:
+        if oper in Interpreter.EQUALITY_OPS:
             return True
         return obj1.type() == obj2.type()
 
     # @debug_logger
     def __eval_unary(self, arith_ast, t, f):
-        status, value_obj = self.__eval_expr(arith_ast.get("op1"))
-        if status == ExecStatus.RAISE:
-            return (ExecStatus.RAISE, value_obj)
+        value_obj = self.__eval_expr(arith_ast.get("op1"))
         if value_obj.type() != t:
             super().error(
                 ErrorType.TYPE_ERROR,
                 f"Incompatible type for {arith_ast.elem_type} operation",
+                arith_ast.line_num,
             )
-        return (ExecStatus.CONTINUE, Value(t, f(value_obj.value())))
+        return Value(t, f(value_obj.value()))
 
     # @debug_logger
     def __setup_ops(self):
@@ -372,7 +1090,7 @@ class Interpreter(InterpreterBase):
         #  set up operations on strings
         self.op_to_lambda[Type.STRING] = {}
         self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
+            x.type(), concat_strings(x.value(), y.value())
         )
         self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
             Type.BOOL, x.value() == y.value()
@@ -404,18 +1122,50 @@ class Interpreter(InterpreterBase):
             Type.BOOL, x.type() != y.type() or x.value() != y.value()
         )
 
+        #  set up operations on structs: two structs are equal if they are the same
+        self.op_to_lambda[Type.STRUCT] = {}
+        self.op_to_lambda[Type.STRUCT]["=="] = lambda x, y: Value(
+            Type.BOOL, x.value() is y.value()
+        )
+        self.op_to_lambda[Type.STRUCT]["!="] = lambda x, y: Value(
+            Type.BOOL, x.value() is not y.value()
+        )
+        self.__setup_quick_ops()
+
+    # (type, operator) -> (result type, function on raw values) for operands of the same
+    # type; these must agree with op_to_lambda, they only skip the Value accessors
+    def __setup_quick_ops(self):
+        self.quick_ops = {}
+        int_ops = {
+            "+": lambda x, y: x + y,
+            "-": lambda x, y: x - y,
+            "*": lambda x, y: x * y,
+            "/": lambda x, y: x // y,
+        }
+        for operator, f in int_ops.items():
+            self.quick_ops[(Type.INT, operator)] = (Type.INT, f)
+        comparisons = {
+            "==": lambda x, y: x == y,
+            "!=": lambda x, y: x != y,
+            "<": lambda x, y: x < y,
+            "<=": lambda x, y: x <= y,
+            ">": lambda x, y: x > y,
+            ">=": lambda x, y: x >= y,
+        }
+        for operator, f in comparisons.items():
+            self.quick_ops[(Type.INT, operator)] = (Type.BOOL, f)
+        for t in (Type.STRING, Type.BOOL, Type.NIL):
+            for operator in Interpreter.EQUALITY_OPS:
+                self.quick_ops[(t, operator)] = (Type.BOOL, comparisons[operator])
+        self.quick_ops[(Type.STRUCT, "==")] = (Type.BOOL, lambda x, y: x is y)
+        self.quick_ops[(Type.STRUCT, "!=")] = (Type.BOOL, lambda x, y: x is not y)
+        self.quick_ops[(Type.STRING, "+")] = (Type.STRING, concat_strings)
+        self.quick_ops[(Type.BOOL, "&&")] = (Type.BOOL, lambda x, y: x and y)
+        self.quick_ops[(Type.BOOL, "||")] = (Type.BOOL, lambda x, y: x or y)
+
     # @debug_logger
     def __do_if(self, if_ast):
-        cond_ast = if_ast.get("condition")
-        status, result = self.__eval_expr(cond_ast)
-        if status == ExecStatus.RAISE:
-            return (ExecStatus.RAISE, result)
-        if result.type() != Type.BOOL:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                "Incompatible type for if condition",
-            )
-        if result.value():
+        if self.__eval_condition(if_ast, "if"):
             statements = if_ast.get("statements")
             status, return_val = self.__run_statements(statements)
             return (status, return_val)
@@ -431,86 +1181,104 @@ class Interpreter(InterpreterBase):
     # @debug_logger
     def __do_for(self, for_ast):
         init_ast = for_ast.get("init")
-        cond_ast = for_ast.get("condition")
         update_ast = for_ast.get("update")
 
         self.__run_statement(init_ast)  # initialize counter variable
-        run_for = Interpreter.TRUE_VALUE
-        while run_for.value():
-            status, run_for = self.__eval_expr(cond_ast)  # check for-loop condition
-            if status == ExecStatus.RAISE:
-                return (ExecStatus.RAISE, run_for)
-            if run_for.type() != Type.BOOL:
-                super().error(
-                    ErrorType.TYPE_ERROR,
-                    "Incompatible type for for condition",
-                )
-            if run_for.value():
+        run_for = True
+        while run_for:
+            run_for = self.__eval_condition(for_ast, "for")  # check for-loop condition
+            if run_for:
                 statements = for_ast.get("statements")
                 status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.RETURN or status == ExecStatus.RAISE:
+                if status == ExecStatus.RETURN:
                     return (status, return_val)
                 # update is not eagerly evaluated
                 self.__run_statement(update_ast)  # update counter variable
 
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
+    # evaluate the condition of an if/for node to a raw bool; a cache of True means
+    # TypeInference proved the condition is a bool, so it is evaluated unboxed
+    def __eval_condition(self, node, statement_name):
+        cond_ast = node.get("condition")
+        if node.cache is True:
+            return self.__eval_raw(cond_ast)
+        result = self.__eval_expr(cond_ast)
+        if result.type() != Type.BOOL:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for {statement_name} condition",
+                cond_ast.line_num,
+            )
+        return result.value()
+
     # @debug_logger
     def __do_return(self, return_ast):
         expr_ast = return_ast.get("expression")
         if expr_ast is None:
             return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
         # value_obj = copy.copy(self.__eval_expr(expr_ast))
-        value_obj = Value(Type.THUNK, Thunk(expr_ast, self.env.environment))
+        value_obj = self.__make_thunk(
+            expr_ast, self.env.environment, ThunkStats.RETURN_SITE
+        )
         return (ExecStatus.RETURN, value_obj)
 
+    # Each try statement's catchers are indexed by exception type the first time it
+    # runs, and every running try pushes its index on the handler stack. A raise looks
+    # up the innermost handler for its exception type once, then unwinds directly to
+    # that try as a RaiseSignal; the blocks and frames it unwinds through are popped
+    # by their finally clauses
+
     # @debug_logger
     def __do_try(self, try_ast):
-        # Run the statements in the try block (either all run or run until error or until hit raise statement or until hit return)
-        self.env.nested_trys += 1
-        statements = try_ast.get("statements")
-        # don't need to worry about scoping as this is taking care of by __run_statements
+        catchers = try_ast.cache
+        if catchers is None:
+            catchers = try_ast.cache = self.__index_catchers(try_ast)
+        handlers = self.env.handlers
+        depth = len(handlers)
+        handlers.append(catchers)
         try:
-            status, return_val = self.__run_statements(statements)
-        except ZeroDivisionError:
-            status, return_val = ExecStatus.RAISE, Value(Type.STRING, "div0")
-        # If the status is RAISE, look through catchers to see if it matches any
-        if status == ExecStatus.RAISE:
-            # debug("Status is ExecStatus.RAISE")
-            catchers = try_ast.get("catchers")
-            for catch_ast in catchers:
-                # If the catch exception type is the same as the raised exception value, run the catch block, returning the status and return_val
-                if catch_ast.get("exception_type") == return_val.value():
-                    catch_statements = catch_ast.get("statements")
-                    status, return_val = self.__run_statements(catch_statements)
-                    return (status, return_val)
-            self.env.nested_trys -= 1
-            # No matching catch statement
-            if self.env.nested_trys == 0:
-                super().error(
-                    ErrorType.FAULT_ERROR,
-                    "Raise condition is not caught",
-                )
-        else:
-            self.env.nested_trys -= 1
-        # debug(f"status is {status}")
-        return (status, return_val)
+            return self.__run_statements(try_ast.get("statements"))
+        except RaiseSignal as signal:
+            if signal.handler_depth != depth:
+                raise
+            value_obj = signal.value_obj
+        finally:
+            del handlers[depth:]
+        catch_ast = catchers[str(value_obj.value())]
+        return self.__run_statements(catch_ast.get("statements"))
+
+    # exception type -> catch node; the first catch for a type wins
+    def __index_catchers(self, try_ast):
+        catchers = {}
+        for catch_ast in try_ast.get("catchers"):
+            catchers.setdefault(catch_ast.get("exception_type"), catch_ast)
+        return catchers
 
     # @debug_logger
     def __do_raise(self, raise_ast):
         # Eagerly evaluate the raise exception type
-        status, value_obj = self.__eval_expr(raise_ast.get("exception_type"))
-        if status == ExecStatus.RAISE:
-            return (ExecStatus.RAISE, value_obj)
+        value_obj = self.__eval_expr(raise_ast.get("exception_type"))
 
         # Make sure returned type is of string type
         if value_obj.type() != Type.STRING:
             super().error(
                 ErrorType.TYPE_ERROR,
                 "Raise condition does not evaluate to a string",
+                raise_ast.line_num,
             )
-        # Return that raise value with RAISE status
-        return (ExecStatus.RAISE, value_obj)
+        self.__raise(value_obj, raise_ast.line_num)
+
+    # send value_obj to the innermost try that catches it
+    def __raise(self, value_obj, line_num=None):
+        exception_type = str(value_obj.value())
+        if self.hooks.on_raise is not None:
+            self.hooks.on_raise(self.hooks.function, line_num, exception_type)
+        handlers = self.env.handlers
+        for depth in range(len(handlers) - 1, -1, -1):
+            if exception_type in handlers[depth]:
+                raise RaiseSignal(value_obj, depth, line_num)
+        super().error(ErrorType.FAULT_ERROR, "Raise condition is not caught", line_num)
 
 
 # if __name__ == "__main__":
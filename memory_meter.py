@@ -0,0 +1,58 @@
+# The MemoryMeter class enforces an approximate per-run memory quota. The interpreter
+# charges it for the memory it allocates (thunk snapshots, environment frames, strings,
+# structs, output lines); once the charges pass the quota, the meter measures what is
+# actually still reachable from the environment and the output log, much like a
+# garbage collector deciding whether a heap really is full.
+
+import sys
+
+from structs import Struct
+from type_valuev4 import StringRope, Thunk, Value
+
+
+class MemoryMeter:
+    # bytes charged for a new scope dictionary
+    FRAME_BYTES = sys.getsizeof({})
+
+    def __init__(self, quota):
+        self.quota = quota
+        self.allocated = 0  # live bytes at the last measurement plus charges since
+        self.peak_live = 0
+        self.__threshold = quota
+
+    # returns True when the charges suggest the quota may have been exceeded and the
+    # caller should measure the live heap
+    def charge(self, num_bytes):
+        self.allocated += num_bytes
+        return self.allocated > self.__threshold
+
+    # walk everything reachable from roots and return the number of live bytes
+    def measure(self, roots):
+        live = 0
+        seen = set()
+        pending = list(roots)
+        while pending:
+            obj = pending.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            live += sys.getsizeof(obj)
+            if isinstance(obj, Value):
+                pending.append(obj.value())
+            elif isinstance(obj, Thunk):
+                pending.append(obj.env_snapshot())
+            elif isinstance(obj, StringRope):
+                pending.append(obj.pieces())
+            elif isinstance(obj, Struct):
+                pending.append(obj.fields)
+            elif isinstance(obj, list):
+                pending.extend(obj)
+            elif isinstance(obj, dict):
+                pending.extend(obj.values())
+
+        self.peak_live = max(self.peak_live, live)
+        self.allocated = live
+        # leave some slack so a heap sitting just under the quota is not re-walked on
+        # every small allocation
+        self.__threshold = max(self.quota, live + self.quota // 16)
+        return live
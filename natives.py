@@ -0,0 +1,156 @@
+# Native builtins are helper functions written in Python that Brewin programs call like
+# user functions. Each one is registered in NATIVES under its name and parameter types,
+# which give its arity and the types its arguments must have (None takes any type),
+# along with its result type (None when it varies; type inference trusts it, so it must
+# be the type of every result) and two properties the optimizers rely on:
+#   strict  its arguments are forced before it runs, and it gets their raw values.
+#           A lazy native gets one function per argument instead, which forces the
+#           argument and returns its raw value, so it only forces what it needs. The
+#           StackMachine runs it again each time it needs an argument not forced yet
+#   pure    calling it does nothing but compute its result, so calls with literal
+#           arguments can be folded and it does not make its callers impure
+# A native returns a raw value (int, bool, str, None or a Struct) and reports an error
+# by raising NativeError. Calls are resolved after print, inputi and inputs and after
+# the user's functions, so a program that defines a function with a native's name and
+# arity keeps calling its own.
+
+from intbase import ErrorType
+from structs import Struct
+from type_valuev4 import PRINT_FORMATTERS, StringRope, Type, Value
+
+# raw result class -> Brewin type
+RESULT_TYPES = {
+    int: Type.INT,
+    bool: Type.BOOL,
+    str: Type.STRING,
+    StringRope: Type.STRING,
+    type(None): Type.NIL,
+    Struct: Type.STRUCT,
+}
+
+
+class NativeError(Exception):
+    def __init__(self, error_type, message):
+        super().__init__(message)
+        self.error_type = error_type
+        self.message = message
+
+
+class NativeFunction:
+    __slots__ = ("name", "param_types", "result_type", "fn", "strict", "pure")
+
+    def __init__(self, name, param_types, result_type, fn, strict, pure):
+        self.name = name
+        self.param_types = tuple(param_types)
+        self.result_type = result_type
+        self.fn = fn
+        self.strict = strict
+        self.pure = pure
+
+    def arity(self):
+        return len(self.param_types)
+
+    # raise a NativeError if arguments of these types cannot be passed to a strict
+    # native
+    def check_types(self, arg_types):
+        for index, (param_type, arg_type) in enumerate(
+            zip(self.param_types, arg_types)
+        ):
+            if param_type is not None and param_type != arg_type:
+                raise NativeError(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible type {arg_type} for argument {index + 1} of "
+                    f"{self.name}",
+                )
+
+    # call the native on raw argument values (or, for a lazy native, functions
+    # returning them) and return its result as a Value
+    def call(self, args):
+        if self.strict:
+            # ropes are flattened, so natives only ever see plain strings
+            args = [str(arg) if arg.__class__ is StringRope else arg for arg in args]
+        result = self.fn(*args)
+        return Value(RESULT_TYPES[result.__class__], result)
+
+
+class NativeRegistry:
+    def __init__(self):
+        self.__functions = {}  # (name, arity) -> NativeFunction
+
+    # decorator registering fn as a native; a later registration of the same name and
+    # arity replaces the earlier one
+    def register(self, name, param_types, result_type=None, strict=True, pure=True):
+        def add(fn):
+            native = NativeFunction(name, param_types, result_type, fn, strict, pure)
+            self.__functions[(name, native.arity())] = native
+            return fn
+
+        return add
+
+    def remove(self, name, arity):
+        self.__functions.pop((name, arity), None)
+
+    # the native called name taking arity arguments, or None
+    def get(self, name, arity):
+        return self.__functions.get((name, arity))
+
+    def __iter__(self):
+        return iter(self.__functions.values())
+
+
+NATIVES = NativeRegistry()
+
+
+@NATIVES.register("strlen", [Type.STRING], Type.INT)
+def strlen(s):
+    return len(s)
+
+
+# the characters of s from start up to (not including) end; indexes are clamped to the
+# string, so the result is "" when the range holds no characters
+@NATIVES.register("substr", [Type.STRING, Type.INT, Type.INT], Type.STRING)
+def substr(s, start, end):
+    return s[max(start, 0) : max(end, 0)]
+
+
+# position of the first sub in s, or -1
+@NATIVES.register("index_of", [Type.STRING, Type.STRING], Type.INT)
+def index_of(s, sub):
+    return s.find(sub)
+
+
+# the int s spells (digits with an optional leading -), or nil if it spells none
+@NATIVES.register("to_int", [Type.STRING])
+def to_int(s):
+    digits = s[1:] if s.startswith("-") else s
+    if not digits.isascii() or not digits.isdigit():
+        return None
+    return int(s)
+
+
+# x as print would show it
+@NATIVES.register("to_str", [None], Type.STRING)
+def to_str(x):
+    formatter = PRINT_FORMATTERS.get(RESULT_TYPES.get(x.__class__))
+    if formatter is None:
+        raise NativeError(ErrorType.TYPE_ERROR, "Incompatible type for to_str")
+    return formatter(x)
+
+
+@NATIVES.register("min", [Type.INT, Type.INT], Type.INT)
+def min_int(a, b):
+    return min(a, b)
+
+
+@NATIVES.register("max", [Type.INT, Type.INT], Type.INT)
+def max_int(a, b):
+    return max(a, b)
+
+
+# x, or default when x is nil; default is only forced then
+@NATIVES.register("coalesce", [None, None], strict=False)
+def coalesce(x, default):
+    value = x()
+    if value is None:
+        return default()
+    return value
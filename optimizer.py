@@ -0,0 +1,584 @@
+# The Optimizer rewrites the ast produced by parse_program before the interpreter runs
+# it. Every rewrite must be invisible to the program: anything that could raise an error
+# (a type mismatch, division by zero, an unknown name) is left for the interpreter to
+# report at runtime, and only when that code actually runs.
+
+from element import Element
+from intbase import InterpreterBase
+from natives import NATIVES, NativeError
+from type_valuev4 import Type, Value
+
+
+class Optimizer:
+    LITERAL_NODES = {
+        InterpreterBase.INT_NODE: Type.INT,
+        InterpreterBase.STRING_NODE: Type.STRING,
+        InterpreterBase.BOOL_NODE: Type.BOOL,
+        InterpreterBase.NIL_NODE: Type.NIL,
+    }
+    NODE_FOR_TYPE = {t: node for node, t in LITERAL_NODES.items()}
+    COMPARISON_OPS = {"==", "!=", ">", ">=", "<", "<="}
+    BOOL_OPS = {"&&", "||"}
+    ARITH_OPS = {"+", "-", "*", "/"}
+    BUILTIN_FUNCS = {"print", "inputi", "inputs"}
+    # largest return expression (in ast nodes) a function may have to be inlined
+    INLINE_MAX_NODES = 24
+    # largest argument expression that may be copied to several uses of a parameter
+    INLINE_MAX_DUPLICATED_ARG_NODES = 5
+
+    # op_to_lambda is the interpreter's operator table, so folded results are computed
+    # exactly the way the interpreter would compute them
+    def __init__(self, op_to_lambda):
+        self.op_to_lambda = op_to_lambda
+        self.stats = {"folded": 0, "removed": 0, "inlined": 0}
+        self.__user_functions = set()  # (name, number of args) of each user function
+
+    # inline=False keeps every call a call, for runs whose hooks report calls and
+    # returns (see trace_hooks.py)
+    def optimize(self, ast, inline=True):
+        self.__user_functions = {
+            (func_ast.get("name"), len(func_ast.get("args")))
+            for func_ast in ast.get("functions")
+        }
+        for func_ast in ast.get("functions"):
+            self.__rewrite_statements(func_ast.get("statements"), self.fold_expr)
+            self.__eliminate_dead_code(func_ast)
+        if inline:
+            self.__inline_functions(ast.get("functions"))
+        return ast
+
+    # replace every expression in statements by rewrite_expr(expression)
+    def __rewrite_statements(self, statements, rewrite_expr):
+        if statements is None:
+            return
+        for index, statement in enumerate(statements):
+            statements[index] = self.__rewrite_statement(statement, rewrite_expr)
+
+    def __rewrite_statement(self, statement, rewrite_expr):
+        elem_type = statement.elem_type
+        if elem_type == "=":
+            self.__rewrite_key(statement, "expression", rewrite_expr)
+        elif elem_type == InterpreterBase.RETURN_NODE:
+            self.__rewrite_key(statement, "expression", rewrite_expr)
+        elif elem_type == InterpreterBase.RAISE_NODE:
+            self.__rewrite_key(statement, "exception_type", rewrite_expr)
+        elif elem_type == InterpreterBase.IF_NODE:
+            self.__rewrite_key(statement, "condition", rewrite_expr)
+            self.__rewrite_statements(statement.get("statements"), rewrite_expr)
+            self.__rewrite_statements(statement.get("else_statements"), rewrite_expr)
+        elif elem_type == InterpreterBase.FOR_NODE:
+            self.__rewrite_statement(statement.get("init"), rewrite_expr)
+            self.__rewrite_key(statement, "condition", rewrite_expr)
+            self.__rewrite_statement(statement.get("update"), rewrite_expr)
+            self.__rewrite_statements(statement.get("statements"), rewrite_expr)
+        elif elem_type == InterpreterBase.TRY_NODE:
+            self.__rewrite_statements(statement.get("statements"), rewrite_expr)
+            for catch_ast in statement.get("catchers"):
+                self.__rewrite_statements(catch_ast.get("statements"), rewrite_expr)
+        elif elem_type == InterpreterBase.FCALL_NODE:
+            # a call statement discards its (lazy) result, so only its arguments are
+            # expressions in their own right
+            args = statement.get("args")
+            for index, arg in enumerate(args):
+                args[index] = rewrite_expr(arg)
+        elif elem_type != InterpreterBase.VAR_DEF_NODE:
+            # other expression statement
+            return rewrite_expr(statement)
+        return statement
+
+    def __rewrite_key(self, node, key, rewrite_expr):
+        if node.get(key) is not None:
+            node.dict[key] = rewrite_expr(node.get(key))
+
+    def __fold_key(self, node, key):
+        self.__rewrite_key(node, key, self.fold_expr)
+
+    # returns an equivalent expression, folding constant subexpressions
+    def fold_expr(self, expr_ast):
+        elem_type = expr_ast.elem_type
+        if elem_type == InterpreterBase.FCALL_NODE:
+            args = expr_ast.get("args")
+            for index, arg in enumerate(args):
+                args[index] = self.fold_expr(arg)
+            return self.__fold_native_call(expr_ast)
+        if elem_type in Optimizer.COMPARISON_OPS or elem_type in Optimizer.ARITH_OPS:
+            self.__fold_key(expr_ast, "op1")
+            self.__fold_key(expr_ast, "op2")
+            return self.__fold_binary(expr_ast)
+        if elem_type in Optimizer.BOOL_OPS:
+            self.__fold_key(expr_ast, "op1")
+            self.__fold_key(expr_ast, "op2")
+            return self.__fold_short_circuit(expr_ast)
+        if elem_type == InterpreterBase.NEG_NODE:
+            self.__fold_key(expr_ast, "op1")
+            op1 = expr_ast.get("op1")
+            if op1.elem_type == InterpreterBase.INT_NODE:
+                return self.__literal(Value(Type.INT, -op1.get("val")), expr_ast)
+            return expr_ast
+        if elem_type == InterpreterBase.NOT_NODE:
+            self.__fold_key(expr_ast, "op1")
+            op1 = expr_ast.get("op1")
+            if op1.elem_type == InterpreterBase.BOOL_NODE:
+                return self.__literal(Value(Type.BOOL, not op1.get("val")), expr_ast)
+            # !!x is x whenever x can only produce a bool (or fail the same way)
+            if op1.elem_type == InterpreterBase.NOT_NODE and self.is_bool_shaped(
+                op1.get("op1")
+            ):
+                self.stats["folded"] += 1
+                return op1.get("op1")
+            return expr_ast
+        return expr_ast
+
+    def __fold_binary(self, expr_ast):
+        left = self.constant_value(expr_ast.get("op1"))
+        right = self.constant_value(expr_ast.get("op2"))
+        if left is None or right is None:
+            return expr_ast
+        result = self.__apply(expr_ast.elem_type, left, right)
+        if result is None:
+            return expr_ast
+        return self.__literal(result, expr_ast)
+
+    def __fold_short_circuit(self, expr_ast):
+        operator = expr_ast.elem_type
+        op2 = expr_ast.get("op2")
+        left = self.constant_value(expr_ast.get("op1"))
+        if left is None or left.type() != Type.BOOL:
+            return expr_ast
+        # false && x and true || x never evaluate x
+        if left.value() == (operator == "||"):
+            return self.__literal(left, expr_ast)
+        # true && x and false || x produce x, provided x is a bool
+        if self.is_bool_shaped(op2):
+            self.stats["folded"] += 1
+            return op2
+        return expr_ast
+
+    # a call of a pure, strict native on literals is replaced by its result, unless the
+    # call would fail or a user function of that name and arity takes the call
+    def __fold_native_call(self, call_ast):
+        args = call_ast.get("args")
+        key = (call_ast.get("name"), len(args))
+        native = NATIVES.get(*key)
+        if native is None or not native.pure or not native.strict:
+            return call_ast
+        if key in self.__user_functions or key[0] in Optimizer.BUILTIN_FUNCS:
+            return call_ast
+        values = [self.constant_value(arg) for arg in args]
+        if any(value_obj is None for value_obj in values):
+            return call_ast
+        try:
+            native.check_types([value_obj.type() for value_obj in values])
+            result = native.call([value_obj.value() for value_obj in values])
+        except NativeError:
+            return call_ast
+        if result.type() not in Optimizer.NODE_FOR_TYPE:
+            return call_ast
+        return self.__literal(result, call_ast)
+
+    # computes operator(left, right) as the interpreter would, or returns None when
+    # the interpreter would raise an error instead
+    def __apply(self, operator, left, right):
+        if operator not in ("==", "!=") and left.type() != right.type():
+            return None
+        if operator not in self.op_to_lambda.get(left.type(), {}):
+            return None
+        if operator == "/" and right.value() == 0:
+            return None
+        return self.op_to_lambda[left.type()][operator](left, right)
+
+    # the Value of a literal node, or None if the node is not a literal
+    def constant_value(self, expr_ast):
+        t = Optimizer.LITERAL_NODES.get(expr_ast.elem_type)
+        if t is None:
+            return None
+        return Value(t, expr_ast.get("val"))
+
+    # true for expressions that either evaluate to a bool or fail
+    def is_bool_shaped(self, expr_ast):
+        elem_type = expr_ast.elem_type
+        return (
+            elem_type == InterpreterBase.BOOL_NODE
+            or elem_type == InterpreterBase.NOT_NODE
+            or elem_type in Optimizer.COMPARISON_OPS
+            or elem_type in Optimizer.BOOL_OPS
+        )
+
+    # removes unreachable statements, constant-condition branches and assignments to
+    # variables the function never reads; stats["removed"] counts the removed nodes
+    def __eliminate_dead_code(self, func_ast):
+        statements = self.__prune_statements(func_ast.get("statements"))
+        func_ast.dict["statements"] = statements
+
+        # variables are local to their function, so a variable that is never read in
+        # it can only be observed through the name error of an undefined assignment
+        reads = set()
+        self.__collect_reads(statements, reads)
+        params = {arg_ast.get("name") for arg_ast in func_ast.get("args")}
+        self.__drop_unused_assignments(statements, reads, params)
+
+        used = set(reads)
+        self.__collect_assigned(statements, used)
+        self.__drop_unused_var_defs(statements, used)
+
+    def __prune_statements(self, statements):
+        pruned = []
+        for index, statement in enumerate(statements):
+            for new_statement in self.__prune_statement(statement):
+                pruned.append(new_statement)
+                if self.always_exits(new_statement):
+                    # everything after a return or raise is unreachable
+                    for dead in statements[index + 1 :]:
+                        self.stats["removed"] += count_nodes(dead)
+                    return pruned
+        return pruned
+
+    # returns the list of statements that replace statement
+    def __prune_statement(self, statement):
+        elem_type = statement.elem_type
+        if elem_type == InterpreterBase.IF_NODE:
+            return self.__prune_if(statement)
+        if elem_type == InterpreterBase.FOR_NODE:
+            statement.dict["statements"] = self.__prune_statements(
+                statement.get("statements")
+            )
+            condition = statement.get("condition")
+            if condition.elem_type == InterpreterBase.BOOL_NODE and not condition.get(
+                "val"
+            ):
+                # the loop body never runs, only the init assignment does
+                init_ast = statement.get("init")
+                self.stats["removed"] += count_nodes(statement) - count_nodes(init_ast)
+                return [init_ast]
+        elif elem_type == InterpreterBase.TRY_NODE:
+            statement.dict["statements"] = self.__prune_statements(
+                statement.get("statements")
+            )
+            for catch_ast in statement.get("catchers"):
+                catch_ast.dict["statements"] = self.__prune_statements(
+                    catch_ast.get("statements")
+                )
+        return [statement]
+
+    def __prune_if(self, if_ast):
+        if_ast.dict["statements"] = self.__prune_statements(if_ast.get("statements"))
+        if if_ast.get("else_statements") is not None:
+            if_ast.dict["else_statements"] = self.__prune_statements(
+                if_ast.get("else_statements")
+            )
+        condition = if_ast.get("condition")
+        if condition.elem_type != InterpreterBase.BOOL_NODE:
+            return [if_ast]
+
+        old_count = count_nodes(if_ast)
+        if condition.get("val"):
+            taken = if_ast.get("statements")
+        else:
+            taken = if_ast.get("else_statements") or []
+        if any(s.elem_type == InterpreterBase.VAR_DEF_NODE for s in taken):
+            # the branch needs its own scope, so keep it in an if (true) block
+            if_ast.dict["condition"] = self.__literal_node(Type.BOOL, True, condition)
+            if_ast.dict["statements"] = taken
+            if_ast.dict["else_statements"] = None
+            self.stats["removed"] += old_count - count_nodes(if_ast)
+            return [if_ast]
+        self.stats["removed"] += old_count - count_nodes(taken)
+        return taken
+
+    # true if running the statement can never fall through to the next one
+    def always_exits(self, statement):
+        elem_type = statement.elem_type
+        if elem_type in (InterpreterBase.RETURN_NODE, InterpreterBase.RAISE_NODE):
+            return True
+        if elem_type == InterpreterBase.IF_NODE:
+            else_statements = statement.get("else_statements")
+            return (
+                else_statements is not None
+                and self.__list_exits(statement.get("statements"))
+                and self.__list_exits(else_statements)
+            )
+        if elem_type == InterpreterBase.TRY_NODE:
+            return self.__list_exits(statement.get("statements")) and all(
+                self.__list_exits(catch_ast.get("statements"))
+                for catch_ast in statement.get("catchers")
+            )
+        return False
+
+    def __list_exits(self, statements):
+        return any(self.always_exits(statement) for statement in statements)
+
+    def __collect_reads(self, node, reads):
+        if isinstance(node, list):
+            for item in node:
+                self.__collect_reads(item, reads)
+        elif isinstance(node, Element):
+            if node.elem_type == InterpreterBase.VAR_NODE:
+                reads.add(node.get("name").split(".")[0])
+            elif node.elem_type == "=" and "." in node.get("name"):
+                # assigning a field reads the variable holding the object
+                reads.add(node.get("name").split(".")[0])
+            for value in node.dict.values():
+                self.__collect_reads(value, reads)
+
+    def __collect_assigned(self, node, assigned):
+        if isinstance(node, list):
+            for item in node:
+                self.__collect_assigned(item, assigned)
+        elif isinstance(node, Element):
+            if node.elem_type == "=":
+                assigned.add(node.get("name").split(".")[0])
+            for value in node.dict.values():
+                self.__collect_assigned(value, assigned)
+
+    # lazy assignments to variables that are never read have no observable effect, as
+    # long as the variable is known to be defined (otherwise the assignment would fail)
+    def __drop_unused_assignments(self, statements, reads, defined):
+        defined = set(defined)
+        kept = []
+        for statement in statements:
+            elem_type = statement.elem_type
+            if elem_type == InterpreterBase.VAR_DEF_NODE:
+                defined.add(statement.get("name"))
+            elif elem_type == "=":
+                name = statement.get("name")
+                if name not in reads and name in defined:
+                    self.stats["removed"] += count_nodes(statement)
+                    continue
+            elif elem_type == InterpreterBase.IF_NODE:
+                self.__drop_unused_assignments(
+                    statement.get("statements"), reads, defined
+                )
+                if statement.get("else_statements") is not None:
+                    self.__drop_unused_assignments(
+                        statement.get("else_statements"), reads, defined
+                    )
+            elif elem_type == InterpreterBase.FOR_NODE:
+                self.__drop_unused_assignments(
+                    statement.get("statements"), reads, defined
+                )
+            elif elem_type == InterpreterBase.TRY_NODE:
+                self.__drop_unused_assignments(
+                    statement.get("statements"), reads, defined
+                )
+                for catch_ast in statement.get("catchers"):
+                    self.__drop_unused_assignments(
+                        catch_ast.get("statements"), reads, defined
+                    )
+            kept.append(statement)
+        statements[:] = kept
+
+    # a definition of a variable that is never read or assigned can go, unless it is
+    # a duplicate definition that the interpreter must still report
+    def __drop_unused_var_defs(self, statements, used):
+        names = [
+            s.get("name")
+            for s in statements
+            if s.elem_type == InterpreterBase.VAR_DEF_NODE
+        ]
+        kept = []
+        for statement in statements:
+            elem_type = statement.elem_type
+            if elem_type == InterpreterBase.VAR_DEF_NODE:
+                name = statement.get("name")
+                if name not in used and names.count(name) == 1:
+                    self.stats["removed"] += 1
+                    continue
+            elif elem_type == InterpreterBase.IF_NODE:
+                self.__drop_unused_var_defs(statement.get("statements"), used)
+                if statement.get("else_statements") is not None:
+                    self.__drop_unused_var_defs(statement.get("else_statements"), used)
+            elif elem_type == InterpreterBase.FOR_NODE:
+                self.__drop_unused_var_defs(statement.get("statements"), used)
+            elif elem_type == InterpreterBase.TRY_NODE:
+                self.__drop_unused_var_defs(statement.get("statements"), used)
+                for catch_ast in statement.get("catchers"):
+                    self.__drop_unused_var_defs(catch_ast.get("statements"), used)
+            kept.append(statement)
+        statements[:] = kept
+
+    # substitutes calls to small, non-recursive functions whose body is a single
+    # return statement. Arguments are lazy, so an argument is only substituted where
+    # its parameter is used, and is copied to several uses only if it is a small
+    # expression without calls (evaluating it twice cannot be observed).
+    def __inline_functions(self, func_asts):
+        func_table = {}
+        for func_ast in func_asts:
+            func_table[(func_ast.get("name"), len(func_ast.get("args")))] = func_ast
+        callees = {
+            key: self.__called_funcs(func_ast, func_table)
+            for key, func_ast in func_table.items()
+        }
+
+        # visit callees before callers so inlined bodies are already fully inlined
+        order = []
+        visited = set()
+
+        def visit(key):
+            if key in visited:
+                return
+            visited.add(key)
+            for callee in callees[key]:
+                visit(callee)
+            order.append(key)
+
+        for key in func_table:
+            visit(key)
+
+        self.__inline_targets = {}
+        for key in order:
+            func_ast = func_table[key]
+            self.__rewrite_statements(func_ast.get("statements"), self.__inline_expr)
+            if self.__is_inlinable(key, func_ast, callees):
+                self.__inline_targets[key] = func_ast
+
+    def __called_funcs(self, func_ast, func_table):
+        called = set()
+        pending = [func_ast.get("statements")]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(node)
+            elif isinstance(node, Element):
+                if node.elem_type == InterpreterBase.FCALL_NODE:
+                    key = (node.get("name"), len(node.get("args")))
+                    if key in func_table and key[0] not in Optimizer.BUILTIN_FUNCS:
+                        called.add(key)
+                pending.extend(node.dict.values())
+        return called
+
+    def __is_inlinable(self, key, func_ast, callees):
+        statements = func_ast.get("statements")
+        if key[0] in Optimizer.BUILTIN_FUNCS or len(statements) != 1:
+            return False
+        if statements[0].elem_type != InterpreterBase.RETURN_NODE:
+            return False
+        expr_ast = statements[0].get("expression")
+        if expr_ast is None or count_nodes(expr_ast) > Optimizer.INLINE_MAX_NODES:
+            return False
+        # the body may only see its parameters, otherwise substituting it into the
+        # caller would capture the caller's variables
+        params = {arg_ast.get("name") for arg_ast in func_ast.get("args")}
+        reads = set()
+        self.__collect_var_names(expr_ast, reads)
+        if not reads <= params:
+            return False
+        return not self.__reaches(key, key, callees)
+
+    def __reaches(self, start, target, callees):
+        seen = set()
+        pending = list(callees[start])
+        while pending:
+            key = pending.pop()
+            if key == target:
+                return True
+            if key not in seen:
+                seen.add(key)
+                pending.extend(callees[key])
+        return False
+
+    def __collect_var_names(self, node, names):
+        if isinstance(node, list):
+            for item in node:
+                self.__collect_var_names(item, names)
+        elif isinstance(node, Element):
+            if node.elem_type == InterpreterBase.VAR_NODE:
+                names.add(node.get("name"))
+            for value in node.dict.values():
+                self.__collect_var_names(value, names)
+
+    def __inline_expr(self, expr_ast):
+        for key, value in expr_ast.dict.items():
+            if isinstance(value, Element):
+                expr_ast.dict[key] = self.__inline_expr(value)
+            elif isinstance(value, list):
+                for index, item in enumerate(value):
+                    if isinstance(item, Element):
+                        value[index] = self.__inline_expr(item)
+        if expr_ast.elem_type != InterpreterBase.FCALL_NODE:
+            return expr_ast
+
+        args = expr_ast.get("args")
+        func_ast = self.__inline_targets.get((expr_ast.get("name"), len(args)))
+        if func_ast is None:
+            return expr_ast
+        body = func_ast.get("statements")[0].get("expression")
+        bindings = {}
+        for arg_ast, actual_ast in zip(func_ast.get("args"), args):
+            uses = count_var_uses(body, arg_ast.get("name"))
+            if uses > 1 and not self.__is_duplicable(actual_ast):
+                return expr_ast
+            bindings[arg_ast.get("name")] = actual_ast
+        self.stats["inlined"] += 1
+        return self.fold_expr(substitute(body, bindings))
+
+    # a new expression is not duplicable either: each copy would make its own struct
+    def __is_duplicable(self, expr_ast):
+        if count_nodes(expr_ast) > Optimizer.INLINE_MAX_DUPLICATED_ARG_NODES:
+            return False
+        return not self.__contains_call(expr_ast)
+
+    def __contains_call(self, node):
+        if isinstance(node, list):
+            return any(self.__contains_call(item) for item in node)
+        if not isinstance(node, Element):
+            return False
+        if node.elem_type in (InterpreterBase.FCALL_NODE, InterpreterBase.NEW_NODE):
+            return True
+        return any(self.__contains_call(value) for value in node.dict.values())
+
+    def __literal_node(self, t, val, source_ast):
+        node_type = Optimizer.NODE_FOR_TYPE[t]
+        if t == Type.NIL:
+            node = Element(node_type)
+        else:
+            node = Element(node_type, val=val)
+        return node.set_position(source_ast.line_num, source_ast.col_num)
+
+    def __literal(self, value_obj, source_ast):
+        self.stats["folded"] += 1
+        val = value_obj.value()
+        if value_obj.type() == Type.STRING:
+            val = str(val)  # flatten a rope into a plain literal
+        return self.__literal_node(value_obj.type(), val, source_ast)
+
+
+# number of times the variable name is read in an expression
+def count_var_uses(expr_ast, name):
+    if isinstance(expr_ast, list):
+        return sum(count_var_uses(item, name) for item in expr_ast)
+    if not isinstance(expr_ast, Element):
+        return 0
+    uses = (
+        1
+        if expr_ast.elem_type == InterpreterBase.VAR_NODE
+        and expr_ast.get("name") == name
+        else 0
+    )
+    return uses + sum(count_var_uses(value, name) for value in expr_ast.dict.values())
+
+
+# a copy of expr_ast in which variables named in bindings are replaced by (copies of)
+# the bound expressions
+def substitute(expr_ast, bindings):
+    if isinstance(expr_ast, list):
+        return [substitute(item, bindings) for item in expr_ast]
+    if not isinstance(expr_ast, Element):
+        return expr_ast
+    if (
+        expr_ast.elem_type == InterpreterBase.VAR_NODE
+        and expr_ast.get("name") in bindings
+    ):
+        return substitute(bindings[expr_ast.get("name")], {})
+    node = Element(expr_ast.elem_type)
+    for key, value in expr_ast.dict.items():
+        node.dict[key] = substitute(value, bindings)
+    return node.set_position(expr_ast.line_num, expr_ast.col_num)
+
+
+# number of ast nodes in a subtree (or in a list of subtrees)
+def count_nodes(node):
+    if isinstance(node, list):
+        return sum(count_nodes(item) for item in node)
+    if not isinstance(node, Element):
+        return 0
+    return 1 + sum(count_nodes(value) for value in node.dict.values())
@@ -0,0 +1,77 @@
+# The Scheduler runs many Brewin programs in one thread. Each job is a StackMachine
+# generator (see StackMachine.run_slices); the scheduler takes the ready jobs in turn and
+# lets each run one slice of quota steps before moving on, so a long program cannot hold
+# up the others. A job that needs input waits, without taking turns, until
+# feed_input() gives it a line.
+
+from collections import deque
+
+from stack_machine import MachineStatus, StackMachine
+
+
+class Job:
+    def __init__(self, name, machine, program, quota):
+        self.name = name
+        self.machine = machine
+        self.status = MachineStatus.PAUSED
+        self.error = None  # message of the error the program stopped with
+        self.slices = 0
+        self.__generator = machine.run_slices(program, quota)
+
+    # run one slice and return the status the job stopped in
+    def step(self):
+        self.slices += 1
+        try:
+            self.status = next(self.__generator)
+        except StopIteration:
+            self.status = MachineStatus.DONE
+        except Exception as e:
+            self.status = MachineStatus.DONE
+            self.error = str(e)
+        return self.status
+
+    def get_output(self):
+        return self.machine.get_output()
+
+    def get_error_type_and_line(self):
+        return self.machine.get_error_type_and_line()
+
+
+class Scheduler:
+    QUOTA = 1000
+
+    def __init__(self, quota=QUOTA):
+        self.quota = quota
+        self.jobs = []
+        self.__ready = deque()
+
+    # queue program as a new job; inputs are lines it can read before feed_input()
+    def add(self, program, inputs=None, name=None, optimize=True, max_steps=None):
+        machine = StackMachine(
+            console_output=False,
+            inp=list(inputs) if inputs else None,
+            optimize=optimize,
+            max_steps=max_steps,
+            pause_on_input=True,
+        )
+        if name is None:
+            name = f"job{len(self.jobs)}"
+        job = Job(name, machine, program, self.quota)
+        self.jobs.append(job)
+        self.__ready.append(job)
+        return job
+
+    def feed_input(self, job, line):
+        job.machine.feed_input(line)
+        if job.status == MachineStatus.WAITING_INPUT:
+            job.status = MachineStatus.PAUSED
+            self.__ready.append(job)
+
+    # round-robin over the ready jobs until every job has ended or waits for input
+    def run(self):
+        ready = self.__ready
+        while ready:
+            job = ready.popleft()
+            if job.step() == MachineStatus.PAUSED:
+                ready.append(job)
+        return [job for job in self.jobs if job.status != MachineStatus.DONE]
@@ -0,0 +1,237 @@
+# The BrewinServer keeps interpreters warm for many short runs. The parent process
+# imports the interpreter (which builds PLY's parser tables) once and forks a pool of
+# workers; each worker accepts connections on a shared Unix domain socket and runs one
+# program per connection, so a request pays none of Python's startup, the parser's
+# setup or the interpreter's operator tables.
+#
+# A request and its response are each a JSON object preceded by its length as a 4-byte
+# big-endian integer:
+#   request:  {"program": str, "inputs": [str], "max_steps": int, "timeout": float,
+#              "memory_quota": int, "optimize": bool}  (all but program optional)
+#   response: {"output": [str], "error_type": "NAME_ERROR" | ... | null,
+#              "error_line": int | null, "message": str | null}
+# error_type is null and message set when the run failed with a Python exception
+# rather than a Brewin error (e.g. inputi() after the inputs ran out).
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+from interpreterv4 import Interpreter
+
+HEADER = struct.Struct(">I")
+LIMITS = ("max_steps", "timeout", "memory_quota")
+
+
+def send_message(conn, obj):
+    data = json.dumps(obj).encode("utf-8")
+    conn.sendall(HEADER.pack(len(data)) + data)
+
+
+def receive_message(conn):
+    header = receive_exactly(conn, HEADER.size)
+    if header is None:
+        return None
+    data = receive_exactly(conn, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+def receive_exactly(conn, size):
+    chunks = []
+    while size > 0:
+        chunk = conn.recv(min(size, 1 << 16))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+# send one program to a running server and return its response
+def run_remote(socket_path, program, inputs=None, **options):
+    request = {"program": program, "inputs": inputs, **options}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        send_message(conn, request)
+        response = receive_message(conn)
+    if response is None:
+        raise ConnectionError("Server closed the connection without a response")
+    return response
+
+
+class BrewinServer:
+    # the limits given here are the defaults for requests that set none and the most a
+    # request may ask for; a worker exits after max_requests runs and is replaced, which
+    # bounds what a long-lived process can accumulate
+    def __init__(
+        self,
+        socket_path,
+        workers=4,
+        max_steps=None,
+        timeout=None,
+        memory_quota=None,
+        max_requests=None,
+    ):
+        self.socket_path = socket_path
+        self.num_workers = workers
+        self.limits = {
+            "max_steps": max_steps,
+            "timeout": timeout,
+            "memory_quota": memory_quota,
+        }
+        self.max_requests = max_requests
+        self.__workers = set()
+        self.__sock = None
+
+    # bind the socket, fork the workers and replace any that exit until the server is
+    # interrupted or terminated
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__sock.bind(self.socket_path)
+        self.__sock.listen(128)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            for _ in range(self.num_workers):
+                self.__spawn_worker()
+            while True:
+                pid, _ = os.wait()
+                if pid in self.__workers:
+                    self.__workers.remove(pid)
+                    self.__spawn_worker()
+        finally:
+            self.__stop_workers()
+            self.__sock.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def __spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.__workers.add(pid)
+            return
+        status = 0
+        try:
+            self.__worker_loop()
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    def __stop_workers(self):
+        for pid in self.__workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.__workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.__workers.clear()
+
+    def __worker_loop(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # a program must never wait on the console: with its inputs used up, input()
+        # fails right away instead
+        sys.stdin = open(os.devnull)
+        sys.setrecursionlimit(10000)
+        interpreters = {}
+        served = 0
+        while self.max_requests is None or served < self.max_requests:
+            conn, _ = self.__sock.accept()
+            with conn:
+                try:
+                    request = receive_message(conn)
+                    if request is None:
+                        continue
+                    response = self.__run_request(interpreters, request)
+                except (ValueError, TypeError, KeyError) as e:
+                    response = self.__failure(f"Bad request: {e}")
+                try:
+                    send_message(conn, response)
+                except OSError:
+                    pass  # the client went away
+            served += 1
+
+    # run one request on the worker's interpreter for its optimize setting
+    def __run_request(self, interpreters, request):
+        program = request["program"]
+        if not isinstance(program, str):
+            raise TypeError("program must be a string")
+        optimize = bool(request.get("optimize", True))
+        interpreter = interpreters.get(optimize)
+        if interpreter is None:
+            interpreter = Interpreter(console_output=False, optimize=optimize)
+            interpreters[optimize] = interpreter
+        interpreter.reset()
+        interpreter.inp = request.get("inputs") or []
+        for name in LIMITS:
+            setattr(interpreter, name, self.__limit(name, request.get(name)))
+        message = None
+        try:
+            interpreter.run(program)
+        except RecursionError:
+            message = "RecursionError: maximum recursion depth exceeded"
+        except Exception as e:
+            message = str(e) if interpreter.error_type else f"{type(e).__name__}: {e}"
+        error_type, error_line = interpreter.get_error_type_and_line()
+        return {
+            "output": [str(line) for line in interpreter.get_output()],
+            "error_type": error_type.name if error_type else None,
+            "error_line": error_line,
+            "message": message,
+        }
+
+    # the limit a request runs under: what it asked for, capped by the server's
+    def __limit(self, name, requested):
+        cap = self.limits[name]
+        if requested is None:
+            return cap
+        if cap is None:
+            return requested
+        return min(requested, cap)
+
+    def __failure(self, message):
+        return {
+            "output": [],
+            "error_type": None,
+            "error_line": None,
+            "message": message,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Brewin programs over a socket")
+    parser.add_argument("socket_path")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--max-steps", type=int)
+    parser.add_argument("--timeout", type=float)
+    parser.add_argument("--memory-quota", type=int)
+    parser.add_argument("--max-requests", type=int)
+    args = parser.parse_args()
+    server = BrewinServer(
+        args.socket_path,
+        workers=args.workers,
+        max_steps=args.max_steps,
+        timeout=args.timeout,
+        memory_quota=args.memory_quota,
+        max_requests=args.max_requests,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# The Speculator evaluates calls of pure, expensive functions on a pool of worker
+# processes before the interpreter gets to them. A function is pure when nothing it can
+# call reads input or prints, and expensive when it loops or is recursive (or calls a
+# function that is). The calls of such functions that appear in one expression form a
+# group, like the two calls in combine(slow(a), slow(b)) or slow(a) + slow(b). When
+# the interpreter evaluates a call of a group, it first sends the calls after it whose
+# arguments are already known values (see Interpreter.__probe) to the workers, which
+# run them with Interpreter.run_function, and then evaluates its own call. A call that
+# was sent takes the worker's result, keyed by its node and argument values: since the
+# function is pure, that is the value evaluating it would give. A call the worker
+# could not finish (it raised, failed or ran out of steps) or had not started yet is
+# evaluated by the interpreter instead, so errors and raises happen where they would
+# without speculation.
+
+import concurrent.futures
+import multiprocessing
+
+from element import Element
+from intbase import InterpreterBase
+from natives import NATIVES
+from type_valuev4 import StringRope, Value
+
+
+# finds the pure and the expensive functions of a program's function table
+class PurityAnalysis:
+    IMPURE_BUILTINS = {"print", "inputi", "inputs"}
+
+    def __init__(self, func_table):
+        functions = [
+            func_ast
+            for overloads in func_table.values()
+            for func_ast in overloads.values()
+        ]
+        self.__callees = {}  # id(func_ast) -> ids of the user functions it calls
+        impure = set()
+        expensive = set()
+        for func_ast in functions:
+            callees, calls_impure, loops = self.__scan(func_ast, func_table)
+            self.__callees[id(func_ast)] = callees
+            if calls_impure:
+                impure.add(id(func_ast))
+            if loops:
+                expensive.add(id(func_ast))
+        # a function calling an impure function is impure, and one calling an expensive
+        # function (or itself, through any chain of calls) is expensive
+        self.pure = {id(func_ast) for func_ast in functions} - self.__callers_of(impure)
+        self.expensive = self.__callers_of(expensive) | {
+            id(func_ast) for func_ast in functions if self.__recursive(id(func_ast))
+        }
+
+    # ids of the user functions func_ast calls, whether it assigns a struct field,
+    # calls a builtin that does I/O, an impure native or a function that does not
+    # exist, and whether it has a loop
+    def __scan(self, func_ast, func_table):
+        callees = set()
+        calls_impure = False
+        loops = False
+        pending = list(func_ast.get("statements"))
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(node)
+                continue
+            if not isinstance(node, Element):
+                continue
+            if node.elem_type == InterpreterBase.FOR_NODE:
+                loops = True
+            elif node.elem_type == "=" and "." in node.get("name"):
+                calls_impure = True  # assigning a field changes a struct others see
+            elif node.elem_type == InterpreterBase.FCALL_NODE:
+                name = node.get("name")
+                target = func_table.get(name, {}).get(len(node.get("args")))
+                native = NATIVES.get(name, len(node.get("args")))
+                if target is not None:
+                    callees.add(id(target))
+                elif native is not None and name not in PurityAnalysis.IMPURE_BUILTINS:
+                    calls_impure = calls_impure or not native.pure
+                elif name in PurityAnalysis.IMPURE_BUILTINS or name not in func_table:
+                    calls_impure = True
+            pending.extend(node.dict.values())
+        return callees, calls_impure, loops
+
+    # func_ids plus every function that can reach one of them through calls
+    def __callers_of(self, func_ids):
+        found = set(func_ids)
+        changed = True
+        while changed:
+            changed = False
+            for caller, callees in self.__callees.items():
+                if caller not in found and callees & found:
+                    found.add(caller)
+                    changed = True
+        return found
+
+    def __recursive(self, func_id):
+        seen = set()
+        pending = list(self.__callees[func_id])
+        while pending:
+            callee = pending.pop()
+            if callee == func_id:
+                return True
+            if callee not in seen:
+                seen.add(callee)
+                pending.extend(self.__callees[callee])
+        return False
+
+
+class Speculator:
+    EXPRESSION_NODES = {
+        InterpreterBase.FCALL_NODE,
+        InterpreterBase.NEG_NODE,
+        InterpreterBase.NOT_NODE,
+        "+",
+        "-",
+        "*",
+        "/",
+        "==",
+        "!=",
+        ">",
+        ">=",
+        "<",
+        "<=",
+        "||",
+        "&&",
+    }
+    # steps a worker may spend on one call, so calls the program never forces cannot
+    # keep a worker busy for long
+    MAX_STEPS = 20_000_000
+
+    def __init__(self, workers, max_steps=MAX_STEPS):
+        self.workers = workers
+        self.max_steps = max_steps
+        self.__pool = None
+        self.__program = None
+        self.__optimize = None
+        self.__pending = {}  # (id(call node), argument values) -> future
+        self.__counts = self.__empty_counts()
+
+    # the calls to speculate on: (call node, (call node, function) for each call of its
+    # group after it) for every call of a pure, expensive function whose expression has
+    # two or more of them
+    def plan(self, ast, func_table):
+        analysis = PurityAnalysis(func_table)
+        candidates = analysis.pure & analysis.expensive
+        sites = []
+        pending = [ast]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(node)
+            elif isinstance(node, Element):
+                if node.elem_type not in Speculator.EXPRESSION_NODES:
+                    pending.extend(node.dict.values())
+                    continue
+                group = self.__group(node, candidates)
+                calls = [(call_ast, call_ast.cache) for call_ast in group]
+                if len(calls) >= 2:
+                    for index, call_ast in enumerate(group):
+                        sites.append((call_ast, tuple(calls[index + 1 :])))
+        return sites
+
+    # the calls of candidate functions in an expression, in evaluation order
+    def __group(self, expr_ast, candidates):
+        group = []
+        pending = [expr_ast]
+        while pending:
+            node = pending.pop()
+            if node.elem_type == InterpreterBase.FCALL_NODE:
+                if node.cache.__class__ is Element and id(node.cache) in candidates:
+                    group.append(node)
+                pending.extend(reversed(node.get("args")))
+            else:
+                for key in ("op2", "op1"):
+                    if node.get(key) is not None:
+                        pending.append(node.get(key))
+        return group
+
+    def start(self, program, optimize):
+        self.__program = program
+        self.__optimize = optimize
+        self.__counts = self.__empty_counts()
+
+    # send the call call_ast makes of func_ast on raw argument values to a worker,
+    # unless it was already sent
+    def submit(self, call_ast, func_ast, args):
+        key = self.__key(call_ast, args)
+        if key in self.__pending:
+            return
+        if self.__pool is None:
+            # the workers are forked from this process, which has the parser tables
+            self.__pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("fork")
+            )
+        self.__pending[key] = self.__pool.submit(
+            evaluate_call,
+            self.__program,
+            self.__optimize,
+            func_ast.get("name"),
+            list(key[1]),
+            self.max_steps,
+        )
+        self.__counts["submitted"] += 1
+
+    # the Value a worker found for the call, or None if the interpreter has to evaluate
+    # it: it was not sent, the worker did not finish it or had not started on it
+    def take(self, call_ast, args):
+        future = self.__pending.pop(self.__key(call_ast, args), None)
+        if future is None:
+            return None
+        if future.cancel():
+            # still queued: evaluating it here is quicker than waiting for a worker
+            self.__counts["evaluated_here"] += 1
+            return None
+        try:
+            result = future.result()
+        except Exception:
+            result = None  # the pool broke, e.g. a worker was killed
+        if result is None:
+            self.__counts["failed"] += 1
+            return None
+        self.__counts["used"] += 1
+        return Value(*result)
+
+    # drop the calls the program did not force
+    def finish(self):
+        for future in self.__pending.values():
+            future.cancel()
+        self.__counts["unused"] += len(self.__pending)
+        self.__pending = {}
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.shutdown(cancel_futures=True)
+            self.__pool = None
+
+    def report(self):
+        return dict(self.__counts)
+
+    def __key(self, call_ast, args):
+        return (
+            id(call_ast),
+            tuple(str(arg) if arg.__class__ is StringRope else arg for arg in args),
+        )
+
+    def __empty_counts(self):
+        return {
+            "submitted": 0,  # calls sent to a worker
+            "used": 0,  # calls that took the worker's result
+            "failed": 0,  # calls the worker could not finish, evaluated here
+            "evaluated_here": 0,  # calls reached before a worker took them
+            "unused": 0,  # calls the program never reached
+        }
+
+
+# worker processes keep one Interpreter per (optimize, max_steps)
+WORKER_INTERPRETERS = {}
+
+
+# runs in a worker: (type, raw value) of the call, or None if it did not finish
+def evaluate_call(program, optimize, name, args, max_steps):
+    # imported here: interpreterv4 imports this module
+    from interpreterv4 import Interpreter
+
+    interpreter = WORKER_INTERPRETERS.get((optimize, max_steps))
+    if interpreter is None:
+        interpreter = Interpreter(
+            console_output=False, optimize=optimize, max_steps=max_steps
+        )
+        WORKER_INTERPRETERS[(optimize, max_steps)] = interpreter
+    interpreter.reset()
+    try:
+        value_obj = interpreter.run_function(program, name, args)
+    except Exception:
+        return None
+    raw = value_obj.value()
+    if raw.__class__ is StringRope:
+        raw = str(raw)
+    if raw.__class__ not in Interpreter.RAW_TYPES:
+        return None  # a struct would come back as a copy, not the same struct
+    return (value_obj.type(), raw)
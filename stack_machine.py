@@ -0,0 +1,909 @@
+# The StackMachine runs Brewin programs with the same semantics as the Interpreter, but
+# keeps its position in the program on an explicit stack of frames instead of on the
+# Python call stack. A run can therefore stop at any statement boundary (when a slice's
+# step quota runs out, or when inputi/inputs needs a line nobody has fed yet), be
+# resumed later, and be checkpointed to bytes and restored in another process.
+#
+# Each frame is a tuple whose first item names the handler that continues it; the
+# values computed by expressions are passed between frames on a separate value stack.
+
+import functools
+import pickle
+import sys
+import time
+import zlib
+from enum import Enum
+
+from brewparse import parse_program
+from element import Element
+from env_v4 import EnvironmentManager
+from intbase import InterpreterBase, ErrorType
+from interpreterv4 import Interpreter
+from natives import NATIVES, NativeError
+from optimizer import Optimizer
+from structs import FieldPath, bind_field_reads, build_layouts, capture_fields
+from type_valuev4 import Type, PRINT_FORMATTERS, Value, Thunk, get_printable
+
+
+# raised by a lazy native's argument that has to be forced before the native can go on
+class NeedsForcing(Exception):
+    def __init__(self, val):
+        super().__init__()
+        self.val = val
+
+
+def forced_value(val):
+    if val.type() == Type.THUNK:
+        raise NeedsForcing(val)
+    return val.value()
+
+
+class MachineStatus(Enum):
+    PAUSED = 1  # the slice's step quota ran out; resume() continues
+    WAITING_INPUT = 2  # inputi/inputs needs a line; feed_input() then resume()
+    DONE = 3
+
+
+# Checkpoints store the state's object graph as a flat table, so that pickle never
+# recurses into it: a chain of thunks whose snapshots hold the previous thunk can be
+# far deeper than the C stack allows. Each entry describes one object and names the
+# objects it refers to by their index in the table; AST nodes are stored as their
+# index in the program, so a checkpoint holds only the run's state and its source.
+ATOM, NODE, LIST, TUPLE, DICT, VALUE, VALUE_OF, OBJECT = range(8)
+ATOM_CLASSES = {str, int, float, bool, type(None), MachineStatus}
+
+
+def flatten_state(root, node_ids):
+    table = []
+    index_of = {}
+    pending = []
+
+    def ref(obj):
+        index = index_of.get(id(obj))
+        if index is None:
+            index = index_of[id(obj)] = len(table)
+            table.append(None)
+            pending.append(obj)
+        return index
+
+    ref(root)
+    while pending:
+        obj = pending.pop()
+        cls = obj.__class__
+        index = index_of[id(obj)]
+        if cls is dict:
+            # keys are variable names and exception types, so they are kept inline
+            items = []
+            for key, value in obj.items():
+                items.append(key)
+                items.append(ref(value))
+            table[index] = (DICT, items)
+        elif cls is Value:
+            # most values hold a plain int, string, bool or nil, kept inline
+            raw = obj.value()
+            if raw.__class__ in ATOM_CLASSES:
+                table[index] = (VALUE, obj.type(), raw)
+            else:
+                table[index] = (VALUE_OF, obj.type(), ref(raw))
+        elif cls is list:
+            table[index] = (LIST, [ref(item) for item in obj])
+        elif cls is tuple:
+            table[index] = (TUPLE, [ref(item) for item in obj])
+        elif cls is Element:
+            table[index] = (NODE, node_ids[id(obj)])
+        elif cls in ATOM_CLASSES:
+            table[index] = (ATOM, obj)
+        else:
+            # Thunk, StringRope and EnvironmentManager: the attributes pickle itself
+            # would save, including __slots__
+            state = obj.__reduce_ex__(2)[2]
+            if isinstance(state, tuple):
+                state = {**(state[0] or {}), **state[1]}
+            attrs = [(name, ref(value)) for name, value in state.items()]
+            table[index] = (OBJECT, cls, attrs)
+    return table
+
+
+def unflatten_state(table, nodes):
+    objs = [None] * len(table)
+    for index, entry in enumerate(table):
+        kind = entry[0]
+        if kind == DICT:
+            objs[index] = {}
+        elif kind == VALUE:
+            objs[index] = Value(entry[1], entry[2])
+        elif kind == VALUE_OF:
+            objs[index] = Value(entry[1])
+        elif kind == LIST:
+            objs[index] = []
+        elif kind == NODE:
+            objs[index] = nodes[entry[1]]
+        elif kind == ATOM:
+            objs[index] = entry[1]
+        elif kind == OBJECT:
+            objs[index] = entry[1].__new__(entry[1])
+
+    # tuples are immutable, so each is built once its items exist; frames never nest
+    # deeply, so building them recursively is fine
+    def build_tuple(index):
+        if objs[index] is None:
+            items = []
+            for item in table[index][1]:
+                if table[item][0] == TUPLE:
+                    build_tuple(item)
+                items.append(objs[item])
+            objs[index] = tuple(items)
+
+    for index, entry in enumerate(table):
+        if entry[0] == TUPLE:
+            build_tuple(index)
+    for index, entry in enumerate(table):
+        kind = entry[0]
+        if kind == DICT:
+            target = objs[index]
+            items = entry[1]
+            for i in range(0, len(items), 2):
+                target[items[i]] = objs[items[i + 1]]
+        elif kind == VALUE_OF:
+            objs[index].set_value_type(objs[entry[2]], entry[1])
+        elif kind == LIST:
+            objs[index].extend([objs[item] for item in entry[1]])
+        elif kind == OBJECT:
+            target = objs[index]
+            for name, value in entry[2]:
+                object.__setattr__(target, name, objs[value])
+    return objs[0]
+
+
+class StackMachine(Interpreter):
+    CHECKPOINT_VERSION = 2
+    PROGRAM_CACHE_SIZE = 64
+    __programs = {}  # (source, optimize) -> (function table, nodes, node ids)
+    LITERAL_TYPES = {
+        InterpreterBase.INT_NODE: Type.INT,
+        InterpreterBase.STRING_NODE: Type.STRING,
+        InterpreterBase.BOOL_NODE: Type.BOOL,
+    }
+
+    # pause_on_input makes inputi/inputs pause the machine when no fed line is left,
+    # instead of reading from the console; timeout bounds each call to resume()
+    def __init__(
+        self,
+        console_output=True,
+        inp=None,
+        optimize=True,
+        max_steps=None,
+        timeout=None,
+        pause_on_input=False,
+    ):
+        super().__init__(
+            console_output, inp, optimize=optimize, max_steps=max_steps, timeout=timeout
+        )
+        self.pause_on_input = pause_on_input
+        self.status = None
+        self.source = None
+        self.steps_taken = 0
+        self.__deadline = None
+        self.__slice_left = 0
+        self.__ops = {
+            "block": self.__op_block,
+            "eval": self.__op_eval,
+            "force": self.__op_force,
+            "forced": self.__op_forced,
+            "binop": self.__op_binop,
+            "apply": self.__op_apply,
+            "unary": self.__op_unary,
+            "if": self.__op_if,
+            "for": self.__op_for,
+            "for_update": self.__op_for_update,
+            "field": self.__op_field,
+            "try": self.__op_try,
+            "raise": self.__op_raise,
+            "call_return": self.__op_call_return,
+            "pop_value": self.__op_pop_value,
+            "print": self.__op_print,
+            "input": self.__op_input,
+            "read_input": self.__op_read_input,
+            "native": self.__op_native,
+            "lazy_native": self.__op_lazy_native,
+        }
+
+    # run a program to completion, like Interpreter.run
+    def run(self, program):
+        self.start(program)
+        self.resume()
+
+    # parse program and stop in front of its first statement
+    def start(self, program):
+        self.reset()
+        self.__prepare(program)
+        self.env = EnvironmentManager()
+        self.steps_taken = 0
+        self.__stack = [("pop_value",)]
+        self.__values = []
+        main_ast = self.__find_function("main", 0)
+        self.__call_user(main_ast, [])
+        self.status = MachineStatus.PAUSED
+
+    # run until the program ends, pauses for input, or (when quota is given) has taken
+    # about quota more steps; returns the MachineStatus it stopped in
+    def resume(self, quota=None):
+        if self.status == MachineStatus.DONE:
+            return self.status
+        self.__slice_left = sys.maxsize if quota is None else quota
+        self.__deadline = None
+        if self.timeout is not None:
+            self.__deadline = time.monotonic() + self.timeout
+        stack = self.__stack
+        ops = self.__ops
+        while stack:
+            frame = stack.pop()
+            status = ops[frame[0]](frame)
+            if status is not None:
+                self.status = status
+                return status
+        self.status = MachineStatus.DONE
+        return self.status
+
+    # run program as a generator that yields the MachineStatus every time the machine
+    # stops: PAUSED after each slice of quota steps, so it yields at statement
+    # boundaries, and WAITING_INPUT when inputi/inputs needs a line, which may be passed
+    # in with send(); the generator returns when the program ends
+    def run_slices(self, program, quota):
+        self.start(program)
+        status = self.resume(quota)
+        while status != MachineStatus.DONE:
+            line = yield status
+            if line is not None:
+                self.feed_input(line)
+            status = self.resume(quota)
+
+    # make a line of input available to inputi/inputs
+    def feed_input(self, line):
+        if self.inp is None or self.input_cursor == len(self.inp):
+            # every line fed so far has been read, so a long session keeps none of them
+            self.inp = []
+            self.input_cursor = 0
+        self.inp.append(line)
+
+    # the machine's whole state as compressed bytes: the source, the frame and value
+    # stacks, the environment with every thunk and snapshot, the input read so far and
+    # the output produced so far
+    def checkpoint(self):
+        state = {
+            "stack": self.__stack,
+            "values": self.__values,
+            "env": self.env,
+            "inp": self.inp,
+            "input_cursor": self.input_cursor,
+            "output_log": self.output_log,
+            "steps_taken": self.steps_taken,
+            "status": self.status,
+        }
+        header = {
+            "version": StackMachine.CHECKPOINT_VERSION,
+            "source": self.source,
+            "optimize": self.optimize,
+            "max_steps": self.max_steps,
+            "timeout": self.timeout,
+            "pause_on_input": self.pause_on_input,
+        }
+        return zlib.compress(
+            pickle.dumps(
+                (header, flatten_state(state, self.__node_ids)),
+                pickle.HIGHEST_PROTOCOL,
+            )
+        )
+
+    # rebuild a machine from checkpoint bytes; it continues where the checkpoint was
+    # taken on the next resume()
+    @classmethod
+    def restore(cls, data, console_output=True):
+        header, table = pickle.loads(zlib.decompress(data))
+        if header["version"] != StackMachine.CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {header['version']}")
+        machine = cls(
+            console_output,
+            optimize=header["optimize"],
+            max_steps=header["max_steps"],
+            timeout=header["timeout"],
+            pause_on_input=header["pause_on_input"],
+        )
+        nodes = machine.__prepare(header["source"])
+        state = unflatten_state(table, nodes)
+        machine.__stack = state["stack"]
+        machine.__values = state["values"]
+        machine.env = state["env"]
+        machine.inp = state["inp"]
+        machine.input_cursor = state["input_cursor"]
+        machine.output_log = state["output_log"]
+        machine.steps_taken = state["steps_taken"]
+        machine.status = state["status"]
+        return machine
+
+    def save_checkpoint(self, path):
+        with open(path, "wb") as file:
+            file.write(self.checkpoint())
+
+    @classmethod
+    def load_checkpoint(cls, path, console_output=True):
+        with open(path, "rb") as file:
+            return cls.restore(file.read(), console_output)
+
+    # parse and optimize program and number its nodes; the numbering only depends on
+    # the source, so a restored machine maps checkpointed node ids to the same nodes.
+    # Machines running the same source share one parse: nodes are only read while
+    # running, apart from the catch index a try keeps in its cache and the layouts a
+    # FieldPath caches, which are the same for every run
+    def __prepare(self, program):
+        self.source = program
+        key = (program, self.optimize)
+        prepared = StackMachine.__programs.get(key)
+        if prepared is None:
+            prepared = self.__parse(program)
+            if len(StackMachine.__programs) >= StackMachine.PROGRAM_CACHE_SIZE:
+                del StackMachine.__programs[next(iter(StackMachine.__programs))]
+            StackMachine.__programs[key] = prepared
+        self.func_name_to_ast, nodes, self.__node_ids = prepared
+        return nodes
+
+    def __parse(self, program):
+        ast = parse_program(program)
+        if self.optimize:
+            ast = Optimizer(self.op_to_lambda).optimize(ast)
+        func_name_to_ast = {}
+        for func_def in ast.get("functions"):
+            num_params = len(func_def.get("args"))
+            func_name_to_ast.setdefault(func_def.get("name"), {})
+            func_name_to_ast[func_def.get("name")][num_params] = func_def
+        # struct sites are bound like the Interpreter binds them (see structs.py)
+        layouts = build_layouts(ast)
+        nodes = []
+        pending = [ast]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(reversed(node))
+            elif isinstance(node, Element):
+                nodes.append(node)
+                if node.elem_type == InterpreterBase.NEW_NODE:
+                    node.cache = layouts.get(node.get("var_type"))
+                elif node.elem_type in (InterpreterBase.VAR_NODE, "="):
+                    if "." in node.get("name"):
+                        node.cache = FieldPath(node.get("name"), layouts.values())
+                pending.extend(reversed(list(node.dict.values())))
+        if layouts:
+            bind_field_reads(ast)
+        node_ids = {id(node): index for index, node in enumerate(nodes)}
+        return func_name_to_ast, nodes, node_ids
+
+    def __find_function(self, name, num_params, line_num=None):
+        if name not in self.func_name_to_ast:
+            super().error(ErrorType.NAME_ERROR, f"Function {name} not found", line_num)
+        candidate_funcs = self.func_name_to_ast[name]
+        if num_params not in candidate_funcs:
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Function {name} taking {num_params} params not found",
+                line_num,
+            )
+        return candidate_funcs[num_params]
+
+    # steps are counted exactly like the Interpreter counts them: one per statement
+    # run from a block and one per expression evaluated
+    def __count_step(self):
+        self.steps_taken += 1
+        self.__slice_left -= 1
+        if self.max_steps is not None and self.steps_taken > self.max_steps:
+            super().error(
+                ErrorType.TIMEOUT_ERROR,
+                f"Step budget of {self.max_steps} steps exceeded",
+            )
+        if (
+            self.__deadline is not None
+            and self.steps_taken % Interpreter.STEP_CHECK_INTERVAL == 0
+            and time.monotonic() > self.__deadline
+        ):
+            super().error(
+                ErrorType.TIMEOUT_ERROR,
+                f"Time limit of {self.timeout} seconds exceeded",
+            )
+
+    # statements
+
+    def __push_block(self, statements):
+        self.env.push_block()
+        self.__stack.append(("block", statements, 0))
+
+    # ("block", statements, index of the next statement to run)
+    def __op_block(self, frame):
+        statements = frame[1]
+        index = frame[2]
+        if index == len(statements):
+            self.env.pop_block()
+            return None
+        if self.__slice_left <= 0:
+            self.__stack.append(frame)
+            return MachineStatus.PAUSED
+        self.__count_step()
+        self.__stack.append(("block", statements, index + 1))
+        self.__run_statement(statements[index])
+        return None
+
+    def __run_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            # a call statement never forces the value the call returns
+            self.__stack.append(("pop_value",))
+            self.__start_call(statement)
+        elif kind == "=":
+            self.__assign(statement)
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            if not self.env.create(statement.get("name"), Interpreter.NIL_VALUE):
+                super().error(
+                    ErrorType.NAME_ERROR,
+                    f"Duplicate definition for variable {statement.get('name')}",
+                    statement.line_num,
+                )
+        elif kind == InterpreterBase.RETURN_NODE:
+            self.__do_return(statement)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__stack.append(("if", statement))
+            self.__eval(statement.get("condition"))
+        elif kind == InterpreterBase.FOR_NODE:
+            # assigning a field pushes frames, which must run before the condition
+            self.__stack.append(("for", statement))
+            self.__stack.append(("eval", statement.get("condition")))
+            self.__assign(statement.get("init"))
+        elif kind == InterpreterBase.TRY_NODE:
+            self.__do_try(statement)
+        elif kind == InterpreterBase.RAISE_NODE:
+            self.__stack.append(("raise", statement))
+            self.__eval(statement.get("exception_type"))
+
+    def __assign(self, assign_ast):
+        if assign_ast.cache is not None:
+            self.__start_field(assign_ast)
+            return
+        var_name = assign_ast.get("name")
+        value_obj = self.__thunk(assign_ast.get("expression"), self.env.curr_env_ptr)
+        if not self.env.set(var_name, value_obj):
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Undefined variable {var_name} in assignment",
+                assign_ast.line_num,
+            )
+
+    def __check_condition(self, cond_ast, result, statement_name):
+        if result.type() != Type.BOOL:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for {statement_name} condition",
+                cond_ast.line_num,
+            )
+        return result.value()
+
+    # ("if", if node): its condition is on the value stack
+    def __op_if(self, frame):
+        if_ast = frame[1]
+        result = self.__values.pop()
+        if self.__check_condition(if_ast.get("condition"), result, "if"):
+            self.__push_block(if_ast.get("statements"))
+        elif if_ast.get("else_statements") is not None:
+            self.__push_block(if_ast.get("else_statements"))
+
+    # ("for", for node): its condition is on the value stack
+    def __op_for(self, frame):
+        for_ast = frame[1]
+        result = self.__values.pop()
+        if self.__check_condition(for_ast.get("condition"), result, "for"):
+            self.__stack.append(("for_update", for_ast))
+            self.__push_block(for_ast.get("statements"))
+
+    # ("for_update", for node): the body finished, update and check again
+    def __op_for_update(self, frame):
+        for_ast = frame[1]
+        self.__stack.append(("for", for_ast))
+        self.__stack.append(("eval", for_ast.get("condition")))
+        self.__assign(for_ast.get("update"))
+
+    def __do_return(self, return_ast):
+        expr_ast = return_ast.get("expression")
+        if expr_ast is None:
+            value_obj = Interpreter.NIL_VALUE
+        else:
+            value_obj = self.__thunk(expr_ast, self.env.environment)
+        # unwind to the frame of the call being returned from
+        while True:
+            frame = self.__stack.pop()
+            kind = frame[0]
+            if kind == "block":
+                self.env.pop_block()
+            elif kind == "try":
+                del self.env.handlers[frame[1] :]
+            elif kind == "call_return":
+                break
+        self.env.pop_func()
+        self.__values.append(value_obj)
+
+    # try statements index their catchers and keep them on env.handlers exactly like
+    # the Interpreter does; ("try", handler depth, value stack height) marks where a
+    # raise caught by this try unwinds to
+    def __do_try(self, try_ast):
+        catchers = try_ast.cache
+        if catchers is None:
+            catchers = try_ast.cache = {}
+            for catch_ast in try_ast.get("catchers"):
+                catchers.setdefault(catch_ast.get("exception_type"), catch_ast)
+        self.__stack.append(("try", len(self.env.handlers), len(self.__values)))
+        self.env.handlers.append(catchers)
+        self.__push_block(try_ast.get("statements"))
+
+    # the try block finished without a raise
+    def __op_try(self, frame):
+        del self.env.handlers[frame[1] :]
+
+    # ("raise", raise node): the exception value is on the value stack
+    def __op_raise(self, frame):
+        value_obj = self.__values.pop()
+        if value_obj.type() != Type.STRING:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                "Raise condition does not evaluate to a string",
+                frame[1].line_num,
+            )
+        self.__raise(value_obj, frame[1].line_num)
+
+    # unwind to the innermost try that catches value_obj and run its catch block
+    def __raise(self, value_obj, line_num=None):
+        exception_type = str(value_obj.value())
+        handlers = self.env.handlers
+        depth = len(handlers) - 1
+        while depth >= 0 and exception_type not in handlers[depth]:
+            depth -= 1
+        if depth < 0:
+            super().error(
+                ErrorType.FAULT_ERROR, "Raise condition is not caught", line_num
+            )
+        catch_ast = handlers[depth][exception_type]
+        while True:
+            frame = self.__stack.pop()
+            kind = frame[0]
+            if kind == "block":
+                self.env.pop_block()
+            elif kind == "call_return":
+                self.env.pop_func()
+            elif kind == "forced":
+                self.env.curr_env_ptr = frame[2]
+            elif kind == "try" and frame[1] == depth:
+                break
+        del self.__values[frame[2] :]
+        del handlers[depth:]
+        self.__push_block(catch_ast.get("statements"))
+
+    # calls
+
+    def __start_call(self, call_ast):
+        name = call_ast.get("name")
+        args = call_ast.get("args")
+        if name == "print":
+            self.__stack.append(("print", len(args), call_ast.line_num))
+            for arg in reversed(args):
+                self.__stack.append(("eval", arg))
+        elif name == "inputi" or name == "inputs":
+            if len(args) > 1:
+                super().error(
+                    ErrorType.NAME_ERROR,
+                    "No inputi() function that takes > 1 parameter",
+                    call_ast.line_num,
+                )
+            self.__stack.append(("input", name, len(args)))
+            if args:
+                self.__stack.append(("eval", args[0]))
+        else:
+            # the program's own functions shadow natives
+            native = NATIVES.get(name, len(args))
+            if native is not None and len(args) not in self.func_name_to_ast.get(
+                name, {}
+            ):
+                self.__start_native(native, args, call_ast.line_num)
+                return
+            func_ast = self.__find_function(name, len(args), call_ast.line_num)
+            self.__call_user(func_ast, args)
+
+    # a strict native gets the values of its arguments, a lazy one thunks of them
+    def __start_native(self, native, args, line_num):
+        if not native.strict:
+            thunks = tuple(self.__thunk(arg, self.env.curr_env_ptr) for arg in args)
+            self.__stack.append(("lazy_native", native.name, thunks, line_num))
+            return
+        self.__stack.append(("native", native.name, len(args), line_num))
+        for arg in reversed(args):
+            self.__stack.append(("eval", arg))
+
+    def __call_user(self, func_ast, actual_args):
+        args = {}
+        for formal_ast, actual_ast in zip(func_ast.get("args"), actual_args):
+            args[formal_ast.get("name")] = self.__thunk(
+                actual_ast, self.env.curr_env_ptr
+            )
+        self.env.push_func()
+        for arg_name, value in args.items():
+            self.env.create(arg_name, value)
+        self.__stack.append(("call_return",))
+        self.__push_block(func_ast.get("statements"))
+
+    # the function body finished without a return
+    def __op_call_return(self, frame):
+        self.env.pop_func()
+        self.__values.append(Interpreter.NIL_VALUE)
+
+    def __op_pop_value(self, frame):
+        self.__values.pop()
+
+    # ("print", number of arguments, line number): the arguments are on the value stack
+    def __op_print(self, frame):
+        count = frame[1]
+        values = self.__values
+        args = values[len(values) - count :]
+        del values[len(values) - count :]
+        fragments = []
+        for v in args:
+            formatter = PRINT_FORMATTERS.get(v.type())
+            if formatter is None:
+                super().error(
+                    ErrorType.TYPE_ERROR, f"Cannot print a {v.type()}", frame[2]
+                )
+            fragments.append(formatter(v.value()))
+        self.output("".join(fragments))
+        values.append(Interpreter.NIL_VALUE)
+
+    # ("native", name, number of arguments, line number): the arguments are on the value
+    # stack. The frame names the native rather than holding it, so checkpoints can be
+    # pickled
+    def __op_native(self, frame):
+        native = NATIVES.get(frame[1], frame[2])
+        values = self.__values
+        args = values[len(values) - frame[2] :]
+        del values[len(values) - frame[2] :]
+        try:
+            native.check_types([value_obj.type() for value_obj in args])
+            values.append(native.call([value_obj.value() for value_obj in args]))
+        except NativeError as e:
+            super().error(e.error_type, e.message, frame[3])
+
+    # ("lazy_native", name, argument thunks, line number). A lazy native forces its
+    # arguments from Python as it runs, which cannot wait for frames; so when it needs
+    # an argument that is not forced yet it stops, the argument is forced on the stack,
+    # and the native runs again from the start, now getting that argument's value
+    def __op_lazy_native(self, frame):
+        native = NATIVES.get(frame[1], len(frame[2]))
+        try:
+            result = native.call(
+                [functools.partial(forced_value, val) for val in frame[2]]
+            )
+        except NeedsForcing as e:
+            self.__stack.append(frame)
+            self.__stack.append(("pop_value",))
+            self.__force(e.val)
+            return
+        except NativeError as e:
+            super().error(e.error_type, e.message, frame[3])
+        self.__values.append(result)
+
+    # ("input", builtin name, number of arguments): the prompt is on the value stack
+    def __op_input(self, frame):
+        if frame[2] == 1:
+            self.output(get_printable(self.__values.pop()))
+        self.__stack.append(("read_input", frame[1]))
+
+    # ("read_input", builtin name)
+    def __op_read_input(self, frame):
+        if self.pause_on_input and (
+            self.inp is None or self.input_cursor >= len(self.inp)
+        ):
+            self.__stack.append(frame)
+            return MachineStatus.WAITING_INPUT
+        inp = self.get_input()
+        if frame[1] == "inputi":
+            self.__values.append(Value(Type.INT, int(inp)))
+        else:
+            self.__values.append(Value(Type.STRING, inp))
+        return None
+
+    # expressions
+
+    # evaluate expr_ast; its value ends up on the value stack once the frames pushed
+    # here have run
+    def __eval(self, expr_ast):
+        self.__count_step()
+        kind = expr_ast.elem_type
+        if kind in StackMachine.LITERAL_TYPES:
+            self.__values.append(
+                Value(StackMachine.LITERAL_TYPES[kind], expr_ast.get("val"))
+            )
+        elif kind == InterpreterBase.NIL_NODE:
+            self.__values.append(Interpreter.NIL_VALUE)
+        elif kind == InterpreterBase.VAR_NODE:
+            if expr_ast.cache is not None:
+                self.__start_field(expr_ast)
+                return
+            val = self.env.get(expr_ast.get("name"))
+            if val is None:
+                super().error(
+                    ErrorType.NAME_ERROR,
+                    f"Variable {expr_ast.get('name')} not found",
+                    expr_ast.line_num,
+                )
+            self.__force(val)
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__stack.append(("force",))
+            self.__start_call(expr_ast)
+        elif kind in Interpreter.BIN_OPS:
+            self.__stack.append(("binop", expr_ast))
+            self.__eval(expr_ast.get("op1"))
+        elif kind in Interpreter.UNARY_OPS:
+            self.__stack.append(("unary", expr_ast))
+            self.__eval(expr_ast.get("op1"))
+        elif kind == InterpreterBase.NEW_NODE:
+            layout = expr_ast.cache
+            if layout is None:
+                super().error(
+                    ErrorType.TYPE_ERROR,
+                    f"Unknown struct type {expr_ast.get('var_type')}",
+                    expr_ast.line_num,
+                )
+            self.__values.append(Value(Type.STRUCT, layout.new()))
+        else:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Unsupported expression {kind}",
+                expr_ast.line_num,
+            )
+
+    def __op_eval(self, frame):
+        self.__eval(frame[1])
+
+    # structs
+
+    # read or assign the field a dotted name (a variable or = node whose cache is its
+    # FieldPath) names, forcing every value along the way like the Interpreter does.
+    # The frames name the node rather than the path, so checkpoints can refer to it
+    def __start_field(self, node):
+        if node.elem_type == InterpreterBase.VAR_NODE:
+            # a field the running thunk captured when it was made (see structs.py)
+            val = self.env.get(node.get("name"))
+            if val is not None:
+                self.__force(val)
+                return
+        path = node.cache
+        value_obj = self.env.get(path.variable)
+        if value_obj is None:
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Variable {path.variable} not found",
+                node.line_num,
+            )
+        self.__stack.append(("field", node, 0))
+        self.__force(value_obj)
+
+    # ("field", variable or = node, index): the value holding the index-th field of
+    # the node's path is on the value stack
+    def __op_field(self, frame):
+        node = frame[1]
+        index = frame[2]
+        path = node.cache
+        struct = self.__as_struct(self.__values.pop(), path, index, node.line_num)
+        offset = path.offset(index, struct)
+        if offset is None:
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Struct {struct.layout.name} has no field {path.names[index]}",
+                node.line_num,
+            )
+        if index < len(path.names) - 1:
+            self.__stack.append(("field", node, index + 1))
+            self.__force(struct.fields[offset])
+        elif node.elem_type == "=":
+            struct.fields[offset] = self.__thunk(
+                node.get("expression"), self.env.curr_env_ptr
+            )
+        else:
+            self.__force(struct.fields[offset])
+
+    # the struct value_obj holds, whose index-th field of path is accessed next
+    def __as_struct(self, value_obj, path, index, line_num):
+        if value_obj.type() == Type.STRUCT:
+            return value_obj.value()
+        if value_obj.type() == Type.NIL:
+            super().error(
+                ErrorType.FAULT_ERROR,
+                f"Dereference of nil {path.prefix(index)}",
+                line_num,
+            )
+        super().error(
+            ErrorType.TYPE_ERROR, f"{path.prefix(index)} is not a struct", line_num
+        )
+
+    # a thunk of expr_ast in env, with the fields it reads captured
+    def __thunk(self, expr_ast, env):
+        thunk = Thunk(expr_ast, env)
+        if expr_ast.field_reads is not None:
+            capture_fields(expr_ast.field_reads, thunk.env_snapshot())
+        return Value(Type.THUNK, thunk)
+
+    # evaluate a thunk in its snapshot; ("forced", thunk value, environment to return to)
+    # stores the result in the thunk when it is done
+    def __force(self, val):
+        if val.type() != Type.THUNK:
+            self.__values.append(val)
+            return
+        thunk = val.value()
+        self.__stack.append(("forced", val, self.env.curr_env_ptr))
+        self.env.curr_env_ptr = thunk.env_snapshot()
+        self.__stack.append(("eval", thunk.expr()))
+
+    # ("force",): force the value a call returned
+    def __op_force(self, frame):
+        self.__force(self.__values.pop())
+
+    def __op_forced(self, frame):
+        result = self.__values.pop()
+        self.env.curr_env_ptr = frame[2]
+        val = frame[1]
+        val.set_value_type(result.value(), result.type())
+        self.__values.append(val)
+
+    # ("binop", operator node): the left operand is on the value stack
+    def __op_binop(self, frame):
+        arith_ast = frame[1]
+        operator = arith_ast.elem_type
+        left = self.__values[-1]
+        if left.type() == Type.BOOL:
+            # short circuit
+            if operator == "&&" and left.value() == False:
+                self.__values[-1] = Value(Type.BOOL, False)
+                return
+            if operator == "||" and left.value() == True:
+                self.__values[-1] = Value(Type.BOOL, True)
+                return
+        self.__stack.append(("apply", arith_ast))
+        self.__eval(arith_ast.get("op2"))
+
+    # ("apply", operator node): both operands are on the value stack
+    def __op_apply(self, frame):
+        arith_ast = frame[1]
+        operator = arith_ast.elem_type
+        right = self.__values.pop()
+        left = self.__values.pop()
+        if operator not in Interpreter.EQUALITY_OPS and left.type() != right.type():
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible types {left.type()} {right.type()} for {operator} operation",
+                arith_ast.line_num,
+            )
+        if operator not in self.op_to_lambda[left.type()]:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible operator {operator} for type {left.type()}",
+                arith_ast.line_num,
+            )
+        try:
+            result = self.op_to_lambda[left.type()][operator](left, right)
+        except ZeroDivisionError:
+            self.__raise(Value(Type.STRING, "div0"), arith_ast.line_num)
+            return
+        self.__values.append(result)
+
+    # ("unary", operator node): the operand is on the value stack
+    def __op_unary(self, frame):
+        arith_ast = frame[1]
+        t, f = Interpreter.UNARY_OPS[arith_ast.elem_type]
+        value_obj = self.__values.pop()
+        if value_obj.type() != t:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for {arith_ast.elem_type} operation",
+                arith_ast.line_num,
+            )
+        self.__values.append(Value(t, f(value_obj.value())))
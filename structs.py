@@ -0,0 +1,172 @@
+# Structs are stored compactly. Each struct type has a StructLayout, built when the
+# program is loaded, which gives every field an offset; a struct is just its layout and
+# a list of field Values indexed by those offsets. Every dotted name in the program
+# (p.next.val, as read or assigned) is split once at load time into a FieldPath, which
+# remembers for each field the layout it last saw and the field's offset in it. A
+# field that only one struct type has is resolved at load time; any other is resolved
+# by the first struct it is read from, so accessing a field only compares layouts.
+#
+# Fields are shared and mutable, but a thunk must see the fields its expression reads
+# as they were when it was made, the way it sees variables through its environment
+# snapshot: otherwise p.x = p.x + 1 would make p.x read itself. So a thunk's snapshot
+# gets one more scope holding the field Values its expression reads, under their
+# dotted names (which no variable can have), and a read of a dotted name looks there
+# before following the path.
+
+from element import Element
+from intbase import InterpreterBase
+from type_valuev4 import Type, Value
+
+# Value a field of each type starts with; fields of other types start as nil
+FIELD_DEFAULTS = {
+    Type.INT: Value(Type.INT, 0),
+    Type.BOOL: Value(Type.BOOL, False),
+    Type.STRING: Value(Type.STRING, ""),
+}
+NIL_DEFAULT = Value(Type.NIL, None)
+
+
+# name -> StructLayout of every struct type ast defines
+def build_layouts(ast):
+    layouts = {}
+    for struct_ast in ast.get("structs"):
+        field_defs = [
+            (field_ast.get("name"), field_ast.get("var_type"))
+            for field_ast in struct_ast.get("fields")
+        ]
+        name = struct_ast.get("name")
+        layouts[name] = StructLayout(name, field_defs)
+    return layouts
+
+
+# set field_reads on every expression of ast a thunk is made of (an assigned value, a
+# returned value or a call argument) that reads struct fields: the (dotted name,
+# FieldPath) of each read, in the node's cache by then
+def bind_field_reads(ast):
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, Element):
+            if node.elem_type in ("=", InterpreterBase.RETURN_NODE):
+                roots = [node.get("expression")]
+            elif node.elem_type == InterpreterBase.FCALL_NODE:
+                roots = node.get("args")
+            else:
+                roots = []
+            for root in roots:
+                if root is not None:
+                    reads = find_field_reads(root)
+                    root.field_reads = tuple(reads.items()) if reads else None
+            pending.extend(node.dict.values())
+
+
+# dotted name -> FieldPath of every field expr_ast reads
+def find_field_reads(expr_ast):
+    reads = {}
+    pending = [expr_ast]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, Element):
+            if node.elem_type == InterpreterBase.VAR_NODE and node.cache is not None:
+                reads[node.get("name")] = node.cache
+            pending.extend(node.dict.values())
+    return reads
+
+
+# add the scope of captured fields to snapshot, a new thunk's environment snapshot.
+# A field is captured when every value on its path is already a struct, so finding it
+# runs nothing; a read already captured by the snapshot (the thunk is made while
+# another is forced) keeps that Value. Fields that are not captured are read when the
+# thunk is forced
+def capture_fields(field_reads, snapshot):
+    scopes = snapshot[-1]
+    captured = {}
+    for name, path in field_reads:
+        if lookup(scopes, name) is not None:
+            continue
+        value_obj = lookup(scopes, path.variable)
+        for index in range(len(path.names)):
+            if value_obj is None or value_obj.type() != Type.STRUCT:
+                value_obj = None
+                break
+            struct = value_obj.value()
+            offset = path.offset(index, struct)
+            value_obj = None if offset is None else struct.fields[offset]
+        if value_obj is not None:
+            captured[name] = value_obj
+    if captured:
+        scopes.append(captured)
+
+
+def lookup(scopes, name):
+    for scope in reversed(scopes):
+        if name in scope:
+            return scope[name]
+    return None
+
+
+class StructLayout:
+    __slots__ = ("name", "offsets", "defaults")
+
+    # field_defs is a list of (field name, type name); a repeated field keeps its
+    # first offset and its last type
+    def __init__(self, name, field_defs):
+        self.name = name
+        self.offsets = {}
+        defaults = []
+        for field_name, type_name in field_defs:
+            default = FIELD_DEFAULTS.get(type_name, NIL_DEFAULT)
+            if field_name in self.offsets:
+                defaults[self.offsets[field_name]] = default
+                continue
+            self.offsets[field_name] = len(defaults)
+            defaults.append(default)
+        # the defaults are never thunks, so every struct can share their Values
+        self.defaults = tuple(defaults)
+
+    def new(self):
+        return Struct(self, list(self.defaults))
+
+
+class Struct:
+    __slots__ = ("layout", "fields")
+
+    def __init__(self, layout, fields):
+        self.layout = layout
+        self.fields = fields
+
+
+class FieldPath:
+    __slots__ = ("variable", "names", "layouts", "offsets")
+
+    # layouts are the program's StructLayouts
+    def __init__(self, dotted_name, layouts):
+        names = dotted_name.split(".")
+        self.variable = names[0]
+        self.names = tuple(names[1:])
+        self.layouts = [None] * len(self.names)
+        self.offsets = [0] * len(self.names)
+        for index, name in enumerate(self.names):
+            having = [layout for layout in layouts if name in layout.offsets]
+            if len(having) == 1:
+                self.layouts[index] = having[0]
+                self.offsets[index] = having[0].offsets[name]
+
+    # offset of the index-th field in struct, or None if its type has no such field
+    def offset(self, index, struct):
+        layout = struct.layout
+        if layout is self.layouts[index]:
+            return self.offsets[index]
+        offset = layout.offsets.get(self.names[index])
+        if offset is not None:
+            self.layouts[index] = layout
+            self.offsets[index] = offset
+        return offset
+
+    # the dotted name of the value holding the index-th field, for error messages
+    def prefix(self, index):
+        return ".".join((self.variable,) + self.names[:index])
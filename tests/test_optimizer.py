@@ -0,0 +1,304 @@
+# Differential tests for the Optimizer and the passes that build on it: every program
+# must print the same output and end with the same error whether it runs with
+# optimize=True or optimize=False.
+
+import random
+
+import pytest
+
+from interpreterv4 import Interpreter
+
+
+# run program and return its output and the ErrorType it ended with, or None; any
+# other exception is a bug in the interpreter and fails the test
+def run_program(program, optimize, inp=None):
+    interpreter = Interpreter(console_output=False, inp=inp, optimize=optimize)
+    try:
+        interpreter.run(program)
+    except Exception:
+        if interpreter.get_error_type_and_line()[0] is None:
+            raise
+    return interpreter.get_output(), interpreter.get_error_type_and_line()[0]
+
+
+def assert_same_behavior(program, inp=None):
+    expected = run_program(program, False, inp)
+    assert run_program(program, True, inp) == expected, program
+
+
+CORPUS = [
+    # constant folding: arithmetic, floor division, strings, comparisons across types
+    """
+    func main() {
+        print(3 * 4 + 1, -7 / 2, 7 / -2, "a" + "b", !true, -(-3));
+        print(1 == true, nil == nil, "1" == 1, 2 != "x", true == !false);
+        print(3 < 4, "b" == "b", 5 >= 5 && 2 <= 1, false || 3 > 2);
+    }
+    """,
+    # division by zero is only raised when the division runs
+    """
+    func main() {
+        var x;
+        x = 1 / 0;
+        print("lazy");
+        try { print(10 / (2 - 2)); } catch "div0" { print("caught"); }
+        print(x);
+    }
+    """,
+    # short circuits must not evaluate the right operand
+    """
+    func boom() { print("boom"); return true; }
+    func main() {
+        print(false && boom(), true || boom(), true && boom(), false || boom());
+        print(false && 1 / 0 == 1, true || "a" + 1);
+    }
+    """,
+    # constant conditions that fold to a type error still fail at runtime
+    """
+    func main() {
+        if (false) { print(1 + "a"); }
+        print("before");
+        if (1 + 2) { print("no"); }
+    }
+    """,
+    # dead code after return and raise, constant if and for
+    """
+    func f(x) {
+        if (true) { return x + 1; } else { print("never"); }
+        print("never");
+    }
+    func main() {
+        var i;
+        for (i = 0; false; i = i + 1) { print("never"); }
+        print(i, f(i));
+        if (false) { var i; i = 5; } else { var i; i = 7; print(i); }
+        print(i);
+        raise "done";
+        print("never");
+    }
+    """,
+    # unused assignments are lazy, so removing them must not hide anything
+    """
+    func main() {
+        var unused;
+        unused = 1 / 0;
+        unused = inputi();
+        print("ok");
+    }
+    """,
+    # inlining: argument laziness, side effects in arguments and shadowed names
+    """
+    func sq(x) { return x * x; }
+    func add(a, b) { return a + b; }
+    func first(a, b) { return a; }
+    func say(s) { print(s); return 1; }
+    func main() {
+        var x;
+        x = 3;
+        print(sq(x + 1), add(sq(2), x), first(5, 1 / 0), first(1, say("skipped")));
+        print(add(say("one"), say("two")));
+        print(sq("a"));
+    }
+    """,
+    # a raise inside an inlined function and catches in callers
+    """
+    func check(n) { if (n < 0) { raise "neg"; } return n; }
+    func main() {
+        try { print(check(1)); print(check(-1)); print("never"); }
+        catch "neg" { print("neg"); }
+        catch "div0" { print("div0"); }
+        try { raise "x" + "y"; } catch "xy" { print("xy"); }
+    }
+    """,
+    # specialized operators that later see other operand types
+    """
+    func plus(a, b) { return a + b; }
+    func main() {
+        var i;
+        for (i = 0; i < 5; i = i + 1) { print(plus(i, i)); }
+        print(plus("a", "b"));
+        print(plus(true, 1));
+    }
+    """,
+    # recursion is never inlined
+    """
+    func fact(n) { if (n <= 1) { return 1; } return n * fact(n - 1); }
+    func main() { print(fact(10)); print(fact(inputi())); }
+    """,
+    # nil and void results
+    """
+    func nothing() { return; }
+    func main() { print(nothing() == nil, nothing()); print(nothing() + 1); }
+    """,
+    # structs keep their fields through every pass
+    """
+    struct point { x: int; y: int; }
+    func main() {
+        var p: point;
+        p = new point;
+        p.x = 2 + 3;
+        p.y = p.x * 2;
+        print(p.x, p.y, p == nil);
+        p = nil;
+        print(p.x);
+    }
+    """,
+    # a field updated from its own value reads the value it had before
+    """
+    struct node { val: int; next: node; }
+    func inc(v) { return v + 1; }
+    func main() {
+        var n: node;
+        var i;
+        var t;
+        n = new node;
+        n.next = new node;
+        n.val = 1;
+        n.next.val = 1;
+        for (i = 0; i < 4; i = i + 1) {
+            n.val = n.val + 1;
+            n.next.val = inc(n.next.val * 2);
+        }
+        t = n.val + 1;
+        n.val = t;
+        print(n.val, n.next.val, t);
+    }
+    """,
+]
+
+
+@pytest.mark.parametrize("program", CORPUS)
+def test_corpus(program):
+    assert_same_behavior(program, inp=["4"])
+
+
+# Random programs over int, bool and string variables. Expressions are mostly well
+# typed, with occasional mismatches, zero divisors, nil and cross-type comparisons so
+# the error paths are covered too. Loops have fixed bounds and functions only call
+# functions defined before them, so every program ends.
+class ProgramGenerator:
+    TYPES = ("int", "bool", "string")
+    VARIABLES = {"int": ("i0", "i1"), "bool": ("b0",), "string": ("s0",)}
+    NUM_HELPERS = 3
+    MAX_DEPTH = 3
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.tries = 0  # how many try statements the next statement is in
+
+    def program(self):
+        functions = [
+            self.helper(index) for index in range(ProgramGenerator.NUM_HELPERS)
+        ]
+        self.helpers = ProgramGenerator.NUM_HELPERS
+        self.loop_vars = 0
+        body = self.declarations() + self.statements(6, 0)
+        loop_decls = "".join(f"var k{n}; " for n in range(self.loop_vars))
+        functions.append(f"func main() {{ {loop_decls}{body} }}")
+        return "\n".join(functions)
+
+    # helper h<index> takes two ints and returns an int; it may call earlier helpers
+    def helper(self, index):
+        self.helpers = index
+        self.loop_vars = 0
+        body = self.declarations() + self.statements(3, 1)
+        body += f"return {self.expr('int', 0, ('x', 'y'))};"
+        loop_decls = "".join(f"var k{n}; " for n in range(self.loop_vars))
+        return f"func h{index}(x, y) {{ {loop_decls}{body} }}"
+
+    def declarations(self):
+        self.declared = False
+        code = ""
+        for t, names in ProgramGenerator.VARIABLES.items():
+            for name in names:
+                code += f"var {name}; {name} = {self.leaf(t, ())}; "
+        self.declared = True
+        return code
+
+    def statements(self, count, depth):
+        return " ".join(self.statement(depth) for _ in range(count))
+
+    def statement(self, depth):
+        rng = self.rng
+        choice = rng.random()
+        if depth < 2 and choice < 0.15:
+            return (
+                f"if ({self.expr('bool', 0)}) {{ {self.statements(2, depth + 1)} }}"
+                f" else {{ {self.statements(1, depth + 1)} }}"
+            )
+        if depth < 2 and choice < 0.25:
+            k = f"k{self.loop_vars}"
+            self.loop_vars += 1
+            return (
+                f"for ({k} = 0; {k} < {rng.randint(0, 3)}; {k} = {k} + 1)"
+                f" {{ {self.statements(2, depth + 1)} }}"
+            )
+        if depth < 2 and choice < 0.33:
+            self.tries += 1
+            body = self.statements(2, depth + 1)
+            self.tries -= 1
+            return (
+                f"try {{ {body} }}"
+                f' catch "div0" {{ print("div0"); }}'
+                f' catch "e" {{ print("e"); }}'
+            )
+        if choice < (0.36 if self.tries else 0.335):
+            return f'if ({self.expr("bool", 0)}) {{ raise "e"; }}'
+        if choice < 0.65:
+            t = rng.choice(ProgramGenerator.TYPES)
+            return f"{rng.choice(ProgramGenerator.VARIABLES[t])} = {self.expr(t, 0)};"
+        args = ", ".join(
+            self.expr(rng.choice(ProgramGenerator.TYPES), 0)
+            for _ in range(rng.randint(1, 3))
+        )
+        return f"print({args});"
+
+    def expr(self, t, depth, params=()):
+        rng = self.rng
+        if rng.random() < 0.005:
+            # a deliberate type mismatch
+            t = rng.choice(ProgramGenerator.TYPES + ("nil",))
+        if depth >= ProgramGenerator.MAX_DEPTH or rng.random() < 0.3:
+            return self.leaf(t, params)
+        sub = lambda sub_t: self.expr(sub_t, depth + 1, params)
+        choice = rng.random()
+        if t == "int":
+            if self.helpers and choice < 0.15:
+                name = f"h{rng.randrange(self.helpers)}"
+                return f"{name}({sub('int')}, {sub('int')})"
+            if choice < 0.25:
+                return f"-{sub('int')}"
+            return f"({sub('int')} {rng.choice('+-*+-*+-/')} {sub('int')})"
+        if t == "bool":
+            if choice < 0.2:
+                return f"!{sub('bool')}"
+            if choice < 0.45:
+                return f"({sub('bool')} {rng.choice(['&&', '||'])} {sub('bool')})"
+            if choice < 0.7:
+                operator = rng.choice(["<", "<=", ">", ">="])
+                return f"({sub('int')} {operator} {sub('int')})"
+            left = rng.choice(ProgramGenerator.TYPES + ("nil",))
+            right = left if rng.random() < 0.7 else rng.choice(ProgramGenerator.TYPES)
+            return f"({sub(left)} {rng.choice(['==', '!='])} {sub(right)})"
+        if t == "string":
+            return f"({sub('string')} + {sub('string')})"
+        return "nil"
+
+    def leaf(self, t, params):
+        rng = self.rng
+        if t != "nil" and rng.random() < 0.4 and (params or self.declared):
+            if t == "int" and params:
+                return rng.choice(params)
+            return rng.choice(ProgramGenerator.VARIABLES[t])
+        if t == "int":
+            return str(rng.randint(-2, 5))
+        if t == "bool":
+            return rng.choice(["true", "false"])
+        if t == "string":
+            return rng.choice(['"a"', '"b"', '""'])
+        return "nil"
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_random_programs(seed):
+    assert_same_behavior(ProgramGenerator(seed).program())
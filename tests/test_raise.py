@@ -0,0 +1,52 @@
+from intbase import ErrorType
+from interpreterv4 import Interpreter
+
+
+def run(program):
+    interpreter = Interpreter(console_output=False)
+    try:
+        interpreter.run(program)
+    except Exception:
+        if interpreter.get_error_type_and_line()[0] is None:
+            raise
+    return interpreter.get_output(), interpreter.get_error_type_and_line()
+
+
+# a division by zero outside every try is a FAULT_ERROR on the division's line
+def test_uncaught_div0_reports_the_division_line():
+    program = """func main() {
+    print(1);
+    print(1 / 0);
+}
+"""
+    assert run(program) == (["1"], (ErrorType.FAULT_ERROR, 3))
+
+
+# the division's line, not the line of the try or of the forcing statement
+def test_div0_passing_a_try_reports_the_division_line():
+    program = """func f(x) {
+    return x / 0;
+}
+func main() {
+    var y;
+    y = f(2);
+    try {
+        print(y);
+    } catch "other" {
+        print("other");
+    }
+}
+"""
+    assert run(program) == ([], (ErrorType.FAULT_ERROR, 2))
+
+
+def test_div0_is_caught_by_a_div0_catch():
+    program = """func main() {
+    try {
+        try { print(4 / (2 - 2)); } catch "x" { print("x"); }
+    } catch "div0" {
+        print("div0");
+    }
+}
+"""
+    assert run(program) == (["div0"], (None, None))
@@ -0,0 +1,42 @@
+import pytest
+
+from intbase import ErrorType
+from interpreterv4 import Interpreter
+
+# x is bound only by run_function, so its type is not known ahead of time
+PROGRAM = """
+func f(x) { var y; y = 1; if (x == x) { y = x; } return y + 1; }
+func main() { print(f(1)); }
+"""
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_entry_parameters_keep_their_type_checks(optimize):
+    interpreter = Interpreter(console_output=False, optimize=optimize)
+    assert interpreter.run_function(PROGRAM, "f", [3]).value() == 4
+    for arg in (True, "ab"):
+        interpreter = Interpreter(console_output=False, optimize=optimize)
+        with pytest.raises(Exception):
+            interpreter.run_function(PROGRAM, "f", [arg])
+        assert interpreter.get_error_type_and_line()[0] == ErrorType.TYPE_ERROR
+
+
+# rows the BatchEvaluator cannot evaluate run like run_function
+def test_batch_fallback_rows_keep_their_type_checks():
+    np = pytest.importorskip("numpy")
+    interpreter = Interpreter(console_output=False)
+    results = interpreter.run_batch(PROGRAM, "f", [np.array([1, 2, 3])])
+    assert results.tolist() == [2, 3, 4]
+    for column in (np.array([True]), np.array([3, "ab"], dtype=object)):
+        interpreter = Interpreter(console_output=False)
+        with pytest.raises(Exception):
+            interpreter.run_batch(PROGRAM, "f", [column])
+        assert interpreter.get_error_type_and_line()[0] == ErrorType.TYPE_ERROR
+
+
+# an argument with no Brewin type is a TYPE_ERROR, not a Python exception
+def test_unsupported_argument_type():
+    interpreter = Interpreter(console_output=False)
+    with pytest.raises(Exception):
+        interpreter.run_function(PROGRAM, "f", [1.5])
+    assert interpreter.get_error_type_and_line()[0] == ErrorType.TYPE_ERROR
@@ -0,0 +1,25 @@
+import multiprocessing
+
+from interpreterv4 import Interpreter
+
+PROGRAM = """
+func slow(n) {
+    var i;
+    var s;
+    s = 0;
+    for (i = 0; i < n; i = i + 1) { s = s + i; }
+    return s;
+}
+func main() { print(slow(50) + slow(60)); }
+"""
+
+
+# the worker processes outlive a run and exit when the interpreter is closed
+def test_close_stops_the_workers():
+    with Interpreter(console_output=False, speculation_workers=2) as interpreter:
+        interpreter.run(PROGRAM)
+        assert interpreter.get_output() == [str(1225 + 1770)]
+        assert interpreter.speculation.report()["submitted"] == 1
+        assert multiprocessing.active_children()
+        interpreter.run(PROGRAM)
+    assert not multiprocessing.active_children()
@@ -0,0 +1,87 @@
+import pytest
+
+from interpreterv4 import Interpreter
+from stack_machine import MachineStatus, StackMachine
+from test_optimizer import CORPUS
+
+STRUCT_PROGRAM = """
+struct node { val: int; next: node; }
+struct point { x: int; y: int; }
+func main() {
+    var p: point;
+    var n: node;
+    var i;
+    p = new point;
+    p.x = 2 + 3;
+    p.y = p.x * 2;
+    print(p.x, p.y, p == nil);
+    n = new node;
+    n.next = new node;
+    for (i = 0; i < 3; i = i + 1) { n.next.val = i * 10; }
+    print(n.next.val, n.val, n.next.next == nil);
+    for (p.x = 0; p.x < 2; p.x = i) { print(p.x); i = i + 1; }
+    for (i = 0; i < 5; i = i + 1) { p.x = p.x + 1; }
+    for (p.y = 0; p.y < 3; p.y = p.y + 1) { print(p.y); }
+    n.next.val = 3;
+    for (i = 0; i < 3; i = i + 1) { n.next.val = n.next.val * 2; }
+    print(p.x, n.next.val);
+    n.next.val = 1 / 0;
+    try { print(n.next.val); } catch "div0" { print("div0"); }
+    print(n.next.next.val);
+}
+"""
+
+# a lazy native forces its arguments on the machine's stack, only when it needs them
+NATIVE_PROGRAM = """
+func f(x) { print("f", x); return x; }
+func main() {
+    var y;
+    y = nil;
+    print(coalesce(5, 1 / 0), coalesce(f(nil), f(3)), strlen(to_str(y == nil)));
+    print(coalesce(coalesce(y, f(nil)), coalesce(f(y), "d")));
+    try { print(coalesce(nil, 1 / 0)); } catch "div0" { print("div0"); }
+    print(coalesce(y, inputi()) + 1);
+}
+"""
+
+STRUCT_ERRORS = [
+    "struct a { x: int; } func main() { var q; q = new a; print(q); }",
+    "struct a { x: int; } func main() { var q; q = new a; print(q.y); }",
+    "struct a { x: int; } func main() { var q; q = 5; q.x = 1; }",
+    "struct a { x: int; } func main() { var q; q.x = 1; }",
+    "func main() { var q; q = new b; }",
+]
+
+
+def run(cls, program, optimize):
+    machine = cls(console_output=False, inp=["4"], optimize=optimize)
+    try:
+        machine.run(program)
+    except Exception:
+        if machine.get_error_type_and_line()[0] is None:
+            raise
+    return machine.get_output(), machine.get_error_type_and_line()
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+@pytest.mark.parametrize(
+    "program", CORPUS + [STRUCT_PROGRAM, NATIVE_PROGRAM] + STRUCT_ERRORS
+)
+def test_runs_like_the_interpreter(program, optimize):
+    expected = run(Interpreter, program, optimize)
+    assert run(StackMachine, program, optimize) == expected
+
+
+# a run restored from a checkpoint at every pause ends like one that was not paused
+@pytest.mark.parametrize("program", CORPUS + [STRUCT_PROGRAM, NATIVE_PROGRAM])
+def test_checkpoint_at_every_pause(program):
+    expected = run(StackMachine, program, True)
+    machine = StackMachine(console_output=False, inp=["4"])
+    machine.start(program)
+    try:
+        while machine.resume(quota=5) == MachineStatus.PAUSED:
+            machine = StackMachine.restore(machine.checkpoint(), console_output=False)
+    except Exception:
+        if machine.get_error_type_and_line()[0] is None:
+            raise
+    assert (machine.get_output(), machine.get_error_type_and_line()) == expected
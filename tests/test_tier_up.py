@@ -0,0 +1,48 @@
+import pytest
+
+from interpreterv4 import Interpreter
+from test_optimizer import CORPUS
+
+# calls that tier up, take a lazy argument that would divide by zero and deopt on a
+# new argument type
+HOT_PROGRAM = """
+func step(n) { if (n / 2 * 2 == n) { return n / 2; } return 3 * n + 1; }
+func pick(c, a, b) { if (c) { return a; } return b; }
+func main() {
+    var i;
+    var n;
+    n = 27;
+    for (i = 0; i < 30; i = i + 1) { n = step(n); print(n, pick(i < 40, i, 1 / 0)); }
+    print(step("a"));
+}
+"""
+
+# raises out of compiled code, and a division by zero in an argument it forces
+RAISE_PROGRAM = """
+func check(n) { if (n > 20) { raise "big"; } return n * 2; }
+func main() {
+    var i;
+    for (i = 15; i < 25; i = i + 1) {
+        try { print(check(i)); } catch "big" { print("big"); }
+    }
+    print(check(1 / (i - 25)));
+}
+"""
+
+
+def run(program, threshold):
+    interpreter = Interpreter(
+        console_output=False, inp=["4"], tier_up_threshold=threshold
+    )
+    try:
+        interpreter.run(program)
+    except Exception:
+        if interpreter.get_error_type_and_line()[0] is None:
+            raise
+    return interpreter.get_output(), interpreter.get_error_type_and_line()
+
+
+@pytest.mark.parametrize("threshold", [1, 3])
+@pytest.mark.parametrize("program", CORPUS + [HOT_PROGRAM, RAISE_PROGRAM])
+def test_tiered_runs_like_the_tree_walker(program, threshold):
+    assert run(program, threshold) == run(program, None)
@@ -0,0 +1,44 @@
+from interpreterv4 import Interpreter
+
+
+def record_events(program, event, functions, optimize):
+    events = []
+    interpreter = Interpreter(console_output=False, optimize=optimize)
+    interpreter.add_hook(
+        event, lambda *args: events.append(args[:3]), functions=functions
+    )
+    interpreter.run(program)
+    return events
+
+
+# the optimizer would inline sq, which would hide its calls and returns from the hooks
+def test_hooks_see_calls_of_inlinable_functions():
+    program = """
+    func sq(x) { return x * x; }
+    func main() { print(sq(3)); print(sq(4)); }
+    """
+    for event in ("call", "return"):
+        expected = record_events(program, event, ["sq"], False)
+        assert len(expected) == 2
+        assert record_events(program, event, ["sq"], True) == expected
+
+
+# a division by zero is reported where it happens, whether or not it is caught
+def test_raise_hook_sees_div0_on_the_division_line():
+    program = """func f(x) {
+    return 1 / x;
+}
+func main() {
+    try { print(f(0)); } catch "div0" { print("caught"); }
+    raise "done";
+}
+"""
+    events = []
+    interpreter = Interpreter(console_output=False)
+    interpreter.add_hook("raise", lambda *args: events.append(args[2:]))
+    try:
+        interpreter.run(program)
+    except Exception:
+        pass
+    assert events == [(2, "div0"), (6, "done")]
+    assert interpreter.get_output() == ["caught"]
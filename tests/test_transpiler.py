@@ -0,0 +1,59 @@
+# Differential tests for the compiled backend: CompiledInterpreter must print the same
+# output and end with the same error, on the same line, as the tree walker.
+
+import pytest
+
+from interpreterv4 import Interpreter
+from test_optimizer import CORPUS
+from transpiler import CompiledInterpreter
+
+DIV0_PROGRAMS = [
+    # an uncaught division by zero, proven int operands and not
+    """func main() {
+    var x;
+    x = 0;
+    print(4 / x);
+}
+""",
+    """func f(x) {
+    return 4 / x;
+}
+func main() {
+    print(f(0));
+}
+""",
+    # passing a try without a div0 catch
+    """func main() {
+    var y;
+    y = 1 / 0;
+    try {
+        print(y);
+    } catch "x" {
+        print("x");
+    }
+}
+""",
+    """func main() {
+    try {
+        try { print(1 / 0); } catch "x" { print("x"); }
+    } catch "div0" {
+        print("div0");
+    }
+}
+""",
+]
+
+
+def run(cls, program):
+    interpreter = cls(console_output=False, inp=["4"])
+    try:
+        interpreter.run(program)
+    except Exception:
+        if interpreter.get_error_type_and_line()[0] is None:
+            raise
+    return interpreter.get_output(), interpreter.get_error_type_and_line()
+
+
+@pytest.mark.parametrize("program", CORPUS + DIV0_PROGRAMS)
+def test_compiles_like_the_interpreter(program):
+    assert run(CompiledInterpreter, program) == run(Interpreter, program)
@@ -0,0 +1,78 @@
+# The ThunkStats class records the lifecycle of every thunk created while a program
+# runs: where it was created, whether it was ever forced, how often its cached value
+# was reused, and how much memory its environment snapshot holds on to.
+
+
+class ThunkStats:
+    # sites where the interpreter creates thunks
+    ASSIGN_SITE = "assign"
+    ARGUMENT_SITE = "argument"
+    RETURN_SITE = "return"
+    SITES = (ASSIGN_SITE, ARGUMENT_SITE, RETURN_SITE)
+
+    def __init__(self):
+        self.__sites = {site: self.__empty_counts() for site in ThunkStats.SITES}
+        # site -> bytes held by the snapshots of the thunks forced so far
+        self.__forced_bytes = dict.fromkeys(ThunkStats.SITES, 0)
+
+    # called right after a thunk Value is created. The counts are kept as the program
+    # runs and the Value carries its own [site, snapshot bytes, cache hits or None
+    # until forced], so collecting stats keeps no thunk or snapshot alive
+    def record_create(self, site, value_obj):
+        snapshot_bytes = value_obj.value().snapshot_bytes()
+        counts = self.__sites[site]
+        counts["created"] += 1
+        counts["snapshot_bytes"] += snapshot_bytes
+        value_obj.thunk_record = [site, snapshot_bytes, None]
+
+    # called when a thunk Value is evaluated for the first time
+    def record_force(self, value_obj):
+        record = getattr(value_obj, "thunk_record", None)
+        if record is not None:
+            site, snapshot_bytes, _ = record
+            self.__sites[site]["forced"] += 1
+            self.__forced_bytes[site] += snapshot_bytes
+            record[2] = 0
+
+    # called when an already evaluated Value is read again
+    def record_read(self, value_obj):
+        record = getattr(value_obj, "thunk_record", None)
+        if record is not None and record[2] is not None:
+            counts = self.__sites[record[0]]
+            if record[2] == 0:
+                counts["reused"] += 1
+            counts["cache_hits"] += 1
+            record[2] += 1
+
+    # build the structured report: per-site counts plus totals across all sites
+    def report(self):
+        sites = {site: dict(counts) for site, counts in self.__sites.items()}
+        for site, counts in sites.items():
+            counts["discarded"] = counts["created"] - counts["forced"]
+            counts["retained_bytes"] = (
+                counts["snapshot_bytes"] - self.__forced_bytes[site]
+            )
+
+        total = self.__empty_counts()
+        for counts in sites.values():
+            for key, value in counts.items():
+                total[key] += value
+            counts["forced_ratio"] = self.__ratio(counts["forced"], counts["created"])
+        total["forced_ratio"] = self.__ratio(total["forced"], total["created"])
+        return {"sites": sites, "total": total}
+
+    def __empty_counts(self):
+        return {
+            "created": 0,  # thunks created at this site
+            "forced": 0,  # thunks evaluated at least once
+            "discarded": 0,  # thunks never evaluated before the program ended
+            "reused": 0,  # thunks whose cached value was read more than once
+            "cache_hits": 0,  # reads served from a cached value
+            "snapshot_bytes": 0,  # bytes held by all snapshots at creation time
+            "retained_bytes": 0,  # bytes held by snapshots of never-forced thunks
+        }
+
+    def __ratio(self, part, whole):
+        if whole == 0:
+            return 0.0
+        return part / whole
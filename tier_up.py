@@ -0,0 +1,259 @@
+# The TierUp class drives profile-guided tier-up for an Interpreter. It counts the calls
+# of each function and, once a function has been called threshold times, compiles the
+# program with the Transpiler, adding a copy of that function specialized to the
+# argument types its calls had. An argument's type is known at a call when finding its
+# value runs nothing observable (see Interpreter.__probe). From then on the interpreter
+# enters the compiled function whenever the arguments it is specialized on are values
+# of those types (the guard), and runs every other call on the tree walker (a deopt).
+# A function that deopts more often than it runs compiled goes back to the tree walker
+# for good.
+#
+# Inside compiled code every call is compiled too. The tree walker sees the calls that
+# cross into compiled code, the thunks passed in as arguments, which compiled code
+# forces through the tree walker, and the lazy results that come back out. While
+# compiled code runs, COMPILED_CODE sits on the tree walker's handler stack: a raise in
+# tree-walker code it forces unwinds to it and continues as a BrewinRaise, so the
+# compiled try statements in between see it.
+
+import copy
+import time
+
+from brewparse import parse_program
+from interpreterv4 import Interpreter, RaiseSignal
+from optimizer import Optimizer
+from transpiler import (
+    RUNTIME,
+    TYPE_OF,
+    BrewinError,
+    BrewinRaise,
+    Lazy,
+    Transpiler,
+    UnsupportedProgram,
+)
+from type_inference import TypeInference
+from type_valuev4 import Thunk, Type, Value
+
+
+# a handler that takes every exception type
+class CompiledCode:
+    def __contains__(self, exception_type):
+        return True
+
+
+COMPILED_CODE = CompiledCode()
+
+
+# the lazy result of a compiled function, forced by the tree walker like any thunk
+class CompiledThunk(Thunk):
+    def __init__(self, lazy, profile):
+        self.lazy = lazy
+        self.profile = profile
+
+    def snapshot_bytes(self):
+        return 0
+
+
+class FunctionProfile:
+    def __init__(self, name, num_args):
+        self.name = name
+        self.num_args = num_args
+        self.calls = 0
+        # tuple of argument types (None where unknown) -> calls that had them
+        self.signatures = {}
+        self.arg_types = None  # the types the compiled code is specialized to
+        self.entry = None  # the compiled function while it is in use
+        self.deoptimized = False
+        self.compiled_calls = 0
+        self.deopts = 0
+        self.walked_time = 0.0
+        self.walked_timed = 0  # tree-walker calls that ran no compiled code
+        self.compiled_time = 0.0
+
+    # whether the compiled function takes these argument values
+    def accepts(self, args):
+        for arg, t in zip(args, self.arg_types):
+            if t is None:
+                continue
+            if arg is Interpreter.UNPROBED or TYPE_OF[arg.__class__] != t:
+                return False
+        return True
+
+    def record_walked(self, seconds):
+        self.walked_time += seconds
+        self.walked_timed += 1
+
+    def report(self):
+        walked = self.__per_call(self.walked_time, self.walked_timed)
+        compiled = self.__per_call(self.compiled_time, self.compiled_calls)
+        return {
+            "function": self.name,
+            "args": self.num_args,
+            "arg_types": list(self.arg_types),
+            "calls": self.calls,
+            "compiled_calls": self.compiled_calls,
+            "deopts": self.deopts,
+            "deoptimized": self.deoptimized,
+            # mean seconds per call, not counting the forcing of the lazy result
+            "walked_time_per_call": walked,
+            "compiled_time_per_call": compiled,
+            "speedup": walked / compiled if walked and compiled else None,
+        }
+
+    def __per_call(self, seconds, calls):
+        if calls == 0:
+            return None
+        return seconds / calls
+
+
+class TierUp:
+    # interpreter supplies output/get_input for compiled code, error to report a
+    # Brewin error and its environment's handler stack; raise_exception(exception type,
+    # line) sends a raise to the tree walker's try statements and force(value_obj)
+    # forces a tree-walker thunk
+    def __init__(
+        self, program, optimize, threshold, interpreter, raise_exception, force
+    ):
+        self.threshold = threshold
+        self.compiled_runs = 0  # times compiled code was entered from the tree walker
+        self.__program = program
+        self.__optimize = optimize
+        self.__interpreter = interpreter
+        self.__raise_exception = raise_exception
+        self.__force = force
+        self.__profiles = {}  # id(func_ast) -> FunctionProfile
+        self.__tiered = []  # profiles with compiled code, in the order they got it
+        self.__failed = False  # the program cannot be compiled
+
+    def profile(self, func_ast):
+        profile = self.__profiles.get(id(func_ast))
+        if profile is None:
+            profile = FunctionProfile(func_ast.get("name"), len(func_ast.get("args")))
+            self.__profiles[id(func_ast)] = profile
+        return profile
+
+    # count a call that runs on the tree walker; args are its argument values, UNPROBED
+    # where they were not known at the call
+    def record_call(self, profile, args):
+        profile.calls += 1
+        signature = tuple(
+            None if arg is Interpreter.UNPROBED else TYPE_OF[arg.__class__]
+            for arg in args
+        )
+        profile.signatures[signature] = profile.signatures.get(signature, 0) + 1
+        if (
+            profile.calls >= self.threshold
+            and profile.arg_types is None
+            and not self.__failed
+        ):
+            self.__tier_up(profile)
+
+    def record_deopt(self, profile):
+        profile.calls += 1
+        profile.deopts += 1
+        if profile.deopts > self.threshold and profile.deopts > profile.compiled_calls:
+            profile.entry = None
+            profile.deoptimized = True
+
+    # run profile's compiled function on argument values and return its result Value
+    def call(self, profile, args):
+        profile.calls += 1
+        profile.compiled_calls += 1
+        start = time.perf_counter()
+        result = self.__run(profile.entry, args)
+        profile.compiled_time += time.perf_counter() - start
+        return self.__to_value(result, profile)
+
+    def force(self, thunk):
+        return self.__to_value(self.__run(thunk.lazy.force, ()), thunk.profile)
+
+    # the Lazy compiled code gets for a tree-walker thunk
+    def lazy_argument(self, value_obj):
+        return Lazy(lambda: self.__force_argument(value_obj))
+
+    def __force_argument(self, value_obj):
+        handlers = self.__interpreter.env.handlers
+        try:
+            return self.__force(value_obj).value()
+        except RaiseSignal as signal:
+            if handlers[signal.handler_depth] is not COMPILED_CODE:
+                raise
+            exception_type = str(signal.value_obj.value())
+            raise BrewinRaise(exception_type, signal.line_num) from None
+
+    # one entry per function that tiered up, in the order they did
+    def report(self):
+        return [profile.report() for profile in self.__tiered]
+
+    def __run(self, f, args):
+        self.compiled_runs += 1
+        handlers = self.__interpreter.env.handlers
+        depth = len(handlers)
+        handlers.append(COMPILED_CODE)
+        try:
+            return f(*args)
+        except BrewinError as e:
+            del handlers[depth:]
+            self.__interpreter.error(e.error_type, e.message, e.line_num)
+        except BrewinRaise as e:
+            del handlers[depth:]
+            self.__raise_exception(e.exception_type, e.line_num)
+        finally:
+            del handlers[depth:]
+
+    def __to_value(self, result, profile):
+        if result.__class__ is Lazy:
+            return Value(Type.THUNK, CompiledThunk(result, profile))
+        return Value(TYPE_OF[result.__class__], result)
+
+    # specialize profile's function to the argument types it was called with most
+    # often and recompile the program with it and the earlier specializations
+    def __tier_up(self, profile):
+        signatures = profile.signatures
+        profile.arg_types = max(signatures, key=signatures.get)
+        self.__tiered.append(profile)
+        scope = self.__compile()
+        if scope is None:
+            self.__failed = True
+            for tiered in self.__tiered:
+                tiered.entry = None
+            return
+        for tiered in self.__tiered:
+            if not tiered.deoptimized:
+                tiered.entry = scope[f"f_{tiered.name}_{tiered.num_args}"]
+
+    # the globals of the compiled program, or None if it cannot be compiled. The program
+    # is parsed again so the annotations of the specialized copies do not reach the
+    # tree walker's ast
+    def __compile(self):
+        interpreter = self.__interpreter
+        ast = parse_program(self.__program)
+        if self.__optimize:
+            ast = Optimizer(interpreter.op_to_lambda).optimize(ast)
+        functions = ast.get("functions")
+        func_table = {}
+        for func_ast in functions:
+            func_table[(func_ast.get("name"), len(func_ast.get("args")))] = func_ast
+        # a copy's name cannot be called from Brewin code, so only the given types
+        # reach its parameters
+        copies = {}
+        param_types = {}
+        for profile in self.__tiered:
+            if not any(profile.arg_types):
+                continue  # nothing to specialize on
+            key = (profile.name, profile.num_args)
+            specialized_ast = copy.deepcopy(func_table[key])
+            specialized_ast.dict["name"] = f"{profile.name}#"
+            copies[key] = (profile.arg_types, specialized_ast)
+            param_types[(f"{profile.name}#", profile.num_args)] = profile.arg_types
+        functions.extend(specialized_ast for _, specialized_ast in copies.values())
+        TypeInference(interpreter.find_quick_op).annotate(ast, param_types)
+        del functions[len(functions) - len(copies) :]
+        try:
+            code = compile(Transpiler().transpile(ast, copies), "<brewin>", "exec")
+        except (UnsupportedProgram, SyntaxError, RecursionError, MemoryError):
+            return None
+        scope = dict(RUNTIME)
+        scope["output"] = interpreter.output
+        scope["get_input"] = interpreter.get_input
+        exec(code, scope)
+        return scope
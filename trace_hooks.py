@@ -0,0 +1,86 @@
+# The TraceHooks class holds the functions an Interpreter reports events to while a
+# program runs. A hook is called as hook(event, function, line_num, data), where
+# function is the name of the Brewin function the event belongs to and data depends on
+# the event:
+#   call       the function being called; data is the list of argument expressions
+#   return     the function returning normally; data is its return Value, which may be
+#              an unforced thunk
+#   raise      the function running when an exception is raised (a raise statement or
+#              a division by zero); data is the exception type
+#   statement  the function running the statement; data is the statement node
+#   force      the function running when a thunk is forced; data is the forced Value
+# Hooks must not force thunks or change the Values they are given, or the program
+# would run differently than without them. A hook registered with functions only gets
+# the events of those functions.
+
+
+class TraceHooks:
+    CALL = "call"
+    RETURN = "return"
+    RAISE = "raise"
+    STATEMENT = "statement"
+    FORCE = "force"
+    EVENTS = (CALL, RETURN, RAISE, STATEMENT, FORCE)
+
+    def __init__(self):
+        # event -> list of (hook, set of function names or None for every function)
+        self.__hooks = {event: [] for event in TraceHooks.EVENTS}
+        self.prepare()
+
+    def __bool__(self):
+        return any(self.__hooks.values())
+
+    # register hook for event; returns a handle for remove()
+    def add(self, event, hook, functions=None):
+        if event not in self.__hooks:
+            raise ValueError(f"Unknown trace event {event}")
+        entry = (hook, None if functions is None else frozenset(functions))
+        self.__hooks[event].append(entry)
+        return (event, entry)
+
+    def remove(self, handle):
+        event, entry = handle
+        self.__hooks[event].remove(entry)
+
+    # called at the start of a run. Each on_<event> is the function the interpreter
+    # calls with (function, line_num, data), or None when no hook is registered for the
+    # event, so a run without hooks only tests for None; function is the name of the
+    # running Brewin function, kept by the interpreter while active
+    def prepare(self):
+        self.on_call = self.__dispatcher(TraceHooks.CALL)
+        self.on_return = self.__dispatcher(TraceHooks.RETURN)
+        self.on_raise = self.__dispatcher(TraceHooks.RAISE)
+        self.on_statement = self.__dispatcher(TraceHooks.STATEMENT)
+        self.on_force = self.__dispatcher(TraceHooks.FORCE)
+        self.active = bool(self)
+        self.function = None
+
+    def __dispatcher(self, event):
+        entries = tuple(self.__hooks[event])
+        if not entries:
+            return None
+        if len(entries) == 1 and entries[0][1] is None:
+            hook = entries[0][0]
+            return lambda function, line_num, data: hook(
+                event, function, line_num, data
+            )
+
+        def dispatch(function, line_num, data):
+            for hook, functions in entries:
+                if functions is None or function in functions:
+                    hook(event, function, line_num, data)
+
+        return dispatch
+
+
+# the hook trace_output installs for every event: one short line per event
+def print_event(event, function, line_num, data):
+    if event == TraceHooks.STATEMENT:
+        detail = data.elem_type
+    elif event == TraceHooks.CALL:
+        detail = f"{len(data)} args"
+    elif event == TraceHooks.RAISE:
+        detail = data
+    else:
+        detail = data.type()
+    print(f"{event} {function} line {line_num}: {detail}")
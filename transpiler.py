@@ -0,0 +1,676 @@
+# The Transpiler translates a program's AST into Python source, which
+# CompiledInterpreter compiles once per program and runs with exec. The generated code
+# keeps the tree walker's semantics:
+# - a variable holds a plain Python value (int, bool, str or StringRope, None for nil)
+#   or a Lazy, a memoizing closure; a closure binds the variables it reads through
+#   default arguments, which is the snapshot the tree walker's thunks take
+# - a Brewin raise is a BrewinRaise exception and a try a Python try statement; integer
+#   division is floor division, and dividing by zero raises "div0" from the division's
+#   line
+# - Brewin errors are BrewinError exceptions carrying the error type, message and line,
+#   which CompiledInterpreter reports through InterpreterBase.error
+# Operators whose operand types TypeInference proved become plain Python operators; the
+# others call binary_op, which makes the tree walker's type checks.
+
+from brewparse import parse_program
+from intbase import InterpreterBase, ErrorType
+from interpreterv4 import Interpreter
+from natives import NATIVES, NativeError
+from optimizer import Optimizer
+from type_inference import TypeInference
+from type_valuev4 import Type, PRINT_FORMATTERS, StringRope, concat_strings
+
+
+class BrewinError(Exception):
+    def __init__(self, error_type, message, line_num=None):
+        super().__init__(message)
+        self.error_type = error_type
+        self.message = message
+        self.line_num = line_num
+
+
+class BrewinRaise(Exception):
+    def __init__(self, exception_type, line_num=None):
+        super().__init__(exception_type)
+        self.exception_type = exception_type
+        self.line_num = line_num
+
+
+# raised by the Transpiler for programs it cannot translate (structs, new and field
+# access)
+class UnsupportedProgram(Exception):
+    pass
+
+
+class Lazy:
+    __slots__ = ("thunk", "value")
+
+    def __init__(self, thunk):
+        self.thunk = thunk
+        self.value = None
+
+    def force(self):
+        thunk = self.thunk
+        if thunk is not None:
+            # a thunk that fails stays unforced, like a tree walker thunk
+            self.value = thunk()
+            self.thunk = None
+        return self.value
+
+
+# runtime support for the generated code
+
+TYPE_OF = {
+    int: Type.INT,
+    bool: Type.BOOL,
+    str: Type.STRING,
+    StringRope: Type.STRING,
+    type(None): Type.NIL,
+}
+
+
+def show(value):
+    return PRINT_FORMATTERS[TYPE_OF[value.__class__]](value)
+
+
+def same_type_equal(x, y):
+    return TYPE_OF[x.__class__] == TYPE_OF[y.__class__] and x == y
+
+
+# the tree walker's op_to_lambda on raw values
+RAW_OPS = {
+    Type.INT: {
+        "+": lambda x, y: x + y,
+        "-": lambda x, y: x - y,
+        "*": lambda x, y: x * y,
+        "/": lambda x, y: x // y,
+        "==": same_type_equal,
+        "!=": lambda x, y: not same_type_equal(x, y),
+        "<": lambda x, y: x < y,
+        "<=": lambda x, y: x <= y,
+        ">": lambda x, y: x > y,
+        ">=": lambda x, y: x >= y,
+    },
+    Type.STRING: {
+        "+": concat_strings,
+        "==": lambda x, y: x == y,
+        "!=": lambda x, y: x != y,
+    },
+    Type.BOOL: {
+        "&&": lambda x, y: x and y,
+        "||": lambda x, y: x or y,
+        "==": same_type_equal,
+        "!=": lambda x, y: not same_type_equal(x, y),
+    },
+    Type.NIL: {
+        "==": same_type_equal,
+        "!=": lambda x, y: not same_type_equal(x, y),
+    },
+}
+
+
+def binary_op(operator, x, y, line_num):
+    left_type = TYPE_OF[x.__class__]
+    right_type = TYPE_OF[y.__class__]
+    if operator not in Interpreter.EQUALITY_OPS and left_type != right_type:
+        raise BrewinError(
+            ErrorType.TYPE_ERROR,
+            f"Incompatible types {left_type} {right_type} for {operator} operation",
+            line_num,
+        )
+    f = RAW_OPS[left_type].get(operator)
+    if f is None:
+        raise BrewinError(
+            ErrorType.TYPE_ERROR,
+            f"Incompatible operator {operator} for type {left_type}",
+            line_num,
+        )
+    if operator == "/" and y == 0:
+        raise BrewinRaise("div0", line_num)
+    return f(x, y)
+
+
+def divide(x, y, line_num):
+    if y == 0:
+        raise BrewinRaise("div0", line_num)
+    return x // y
+
+
+def negate(value, line_num):
+    if value.__class__ is not int:
+        raise BrewinError(
+            ErrorType.TYPE_ERROR,
+            f"Incompatible type for {InterpreterBase.NEG_NODE} operation",
+            line_num,
+        )
+    return -value
+
+
+def logical_not(value, line_num):
+    if value.__class__ is not bool:
+        raise BrewinError(
+            ErrorType.TYPE_ERROR,
+            f"Incompatible type for {InterpreterBase.NOT_NODE} operation",
+            line_num,
+        )
+    return not value
+
+
+def condition(value, statement_name, line_num):
+    if value.__class__ is not bool:
+        raise BrewinError(
+            ErrorType.TYPE_ERROR,
+            f"Incompatible type for {statement_name} condition",
+            line_num,
+        )
+    return value
+
+
+def brewin_raise(value, line_num):
+    if TYPE_OF[value.__class__] != Type.STRING:
+        raise BrewinError(
+            ErrorType.TYPE_ERROR,
+            "Raise condition does not evaluate to a string",
+            line_num,
+        )
+    return BrewinRaise(str(value), line_num)
+
+
+def fail(error_type, message, line_num):
+    raise BrewinError(error_type, message, line_num)
+
+
+# call the native name on the values of its arguments, or for a lazy native on what
+# the arguments are bound to
+def call_native(name, args, line_num):
+    native = NATIVES.get(name, len(args))
+    try:
+        if native.strict:
+            native.check_types([TYPE_OF[arg.__class__] for arg in args])
+            return native.call(args).value()
+        return native.call([native_argument(arg) for arg in args]).value()
+    except NativeError as e:
+        raise BrewinError(e.error_type, e.message, line_num) from None
+
+
+def native_argument(binding):
+    if binding.__class__ is Lazy:
+        return binding.force
+    return lambda: binding
+
+
+# the names generated code uses besides output and get_input
+RUNTIME = {
+    "Lazy": Lazy,
+    "BrewinRaise": BrewinRaise,
+    "ErrorType": ErrorType,
+    "show": show,
+    "binary_op": binary_op,
+    "divide": divide,
+    "negate": negate,
+    "logical_not": logical_not,
+    "condition": condition,
+    "brewin_raise": brewin_raise,
+    "fail": fail,
+    "call_native": call_native,
+    "concat_strings": concat_strings,
+    "StringRope": StringRope,
+}
+
+
+class Transpiler:
+    LITERAL_CODE = {
+        InterpreterBase.INT_NODE: repr,
+        InterpreterBase.STRING_NODE: repr,
+        InterpreterBase.BOOL_NODE: repr,
+    }
+    INT_OPERATORS = {
+        "+": "+",
+        "-": "-",
+        "*": "*",
+        "==": "==",
+        "!=": "!=",
+        "<": "<",
+        "<=": "<=",
+        ">": ">",
+        ">=": ">=",
+    }
+
+    # code that holds when a parameter has the type
+    TYPE_GUARDS = {
+        Type.INT: "{}.__class__ is int",
+        Type.BOOL: "{}.__class__ is bool",
+        Type.STRING: "{}.__class__ in (str, StringRope)",
+        Type.NIL: "{} is None",
+    }
+
+    # Python source for ast; it defines f_<name>_<number of args> for each Brewin
+    # function and brewin_main(), which runs main the way the tree walker starts a
+    # program. specializations maps (name, number of args) to (parameter types, copy of
+    # the function annotated for those types): f_ then runs the copy, s_<name>_<number
+    # of args>, whenever its arguments are values of those types
+    def transpile(self, ast, specializations=None):
+        if ast.get("structs"):
+            raise UnsupportedProgram("structs")
+        self.__lines = []
+        self.__names = 0
+        # same resolution as the interpreter's function table: the last definition wins
+        self.__functions = {}
+        for func_ast in ast.get("functions"):
+            key = (func_ast.get("name"), len(func_ast.get("args")))
+            self.__functions[key] = func_ast
+        self.__function_names = {name for name, _ in self.__functions}
+        specializations = specializations or {}
+        for (name, num_args), func_ast in self.__functions.items():
+            specialization = specializations.get((name, num_args))
+            if specialization is None:
+                self.__function(func_ast, f"f_{name}_{num_args}")
+                continue
+            param_types, specialized_ast = specialization
+            specialized_name = f"s_{name}_{num_args}"
+            self.__function(
+                func_ast, f"f_{name}_{num_args}", (specialized_name, param_types)
+            )
+            self.__function(specialized_ast, specialized_name)
+        self.__emit(0, "def brewin_main():")
+        self.__emit(1, self.__call("main", [], [], None))
+        return "\n".join(self.__lines) + "\n"
+
+    def __emit(self, depth, line):
+        self.__lines.append("    " * depth + line)
+
+    def __new_name(self, prefix):
+        self.__names += 1
+        return f"{prefix}{self.__names}"
+
+    # guard is (name of the specialized function, parameter types) or None
+    def __function(self, func_ast, python_name, guard=None):
+        arg_names = [arg_ast.get("name") for arg_ast in func_ast.get("args")]
+        params = {}
+        param_names = []
+        for position, arg_name in enumerate(arg_names):
+            # a repeated parameter name binds the last argument, as in the tree walker
+            if arg_name in arg_names[position + 1 :]:
+                param_names.append(self.__new_name("unused"))
+            else:
+                params[arg_name] = self.__new_name(f"v_{arg_name}_")
+                param_names.append(params[arg_name])
+        self.__emit(0, f"def {python_name}({', '.join(param_names)}):")
+        if guard is not None:
+            specialized_name, param_types = guard
+            checks = [
+                Transpiler.TYPE_GUARDS[t].format(param_name)
+                for param_name, t in zip(param_names, param_types)
+                if t in Transpiler.TYPE_GUARDS
+            ]
+            call = f"{specialized_name}({', '.join(param_names)})"
+            if checks:
+                self.__emit(1, f"if {' and '.join(checks)}:")
+                self.__emit(2, f"return {call}")
+            else:
+                self.__emit(1, f"return {call}")
+        self.__block(func_ast.get("statements"), [params], 1)
+        self.__emit(0, "")
+
+    # blocks
+
+    def __block(self, statements, scopes, depth):
+        scopes = scopes + [{}]
+        start = len(self.__lines)
+        for statement in statements:
+            self.__statement(statement, scopes, depth)
+        if len(self.__lines) == start:
+            self.__emit(depth, "pass")
+
+    def __statement(self, statement, scopes, depth):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__emit(depth, self.__call_node(statement, scopes))
+        elif kind == "=":
+            self.__assign(statement, scopes, depth)
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            name = statement.get("name")
+            if name in scopes[-1]:
+                self.__emit(
+                    depth,
+                    self.__fail(
+                        ErrorType.NAME_ERROR,
+                        f"Duplicate definition for variable {name}",
+                        statement.line_num,
+                    ),
+                )
+            else:
+                scopes[-1][name] = self.__new_name(f"v_{name}_")
+                self.__emit(depth, f"{scopes[-1][name]} = None")
+        elif kind == InterpreterBase.RETURN_NODE:
+            expr_ast = statement.get("expression")
+            if expr_ast is None:
+                self.__emit(depth, "return None")
+            else:
+                self.__emit(depth, f"return {self.__binding(expr_ast, scopes)}")
+        elif kind == InterpreterBase.IF_NODE:
+            self.__emit(depth, f"if {self.__condition(statement, 'if', scopes)}:")
+            self.__block(statement.get("statements"), scopes, depth + 1)
+            if statement.get("else_statements") is not None:
+                self.__emit(depth, "else:")
+                self.__block(statement.get("else_statements"), scopes, depth + 1)
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__assign(statement.get("init"), scopes, depth)
+            self.__emit(depth, f"while {self.__condition(statement, 'for', scopes)}:")
+            self.__block(statement.get("statements"), scopes, depth + 1)
+            self.__assign(statement.get("update"), scopes, depth + 1)
+        elif kind == InterpreterBase.TRY_NODE:
+            self.__try(statement, scopes, depth)
+        elif kind == InterpreterBase.RAISE_NODE:
+            value = self.__expr(statement.get("exception_type"), scopes)
+            self.__emit(depth, f"raise brewin_raise({value}, {statement.line_num!r})")
+
+    def __assign(self, assign_ast, scopes, depth):
+        name = assign_ast.get("name")
+        if "." in name:
+            raise UnsupportedProgram("field access")
+        target = lookup(scopes, name)
+        if target is None:
+            self.__emit(
+                depth,
+                self.__fail(
+                    ErrorType.NAME_ERROR,
+                    f"Undefined variable {name} in assignment",
+                    assign_ast.line_num,
+                ),
+            )
+            return
+        binding = self.__binding(assign_ast.get("expression"), scopes)
+        self.__emit(depth, f"{target} = {binding}")
+
+    def __condition(self, node, statement_name, scopes):
+        cond_ast = node.get("condition")
+        code = self.__expr(cond_ast, scopes)
+        if node.cache is True:
+            # TypeInference proved the condition is a bool
+            return code
+        return f"condition({code}, {statement_name!r}, {cond_ast.line_num!r})"
+
+    # the first catch for an exception type wins; an exception no catch handles keeps
+    # propagating
+    def __try(self, try_ast, scopes, depth):
+        self.__emit(depth, "try:")
+        self.__block(try_ast.get("statements"), scopes, depth + 1)
+        catchers = {}
+        for catch_ast in try_ast.get("catchers"):
+            catchers.setdefault(catch_ast.get("exception_type"), catch_ast)
+        caught = self.__new_name("e")
+        kind = self.__new_name("k")
+        self.__emit(depth, f"except BrewinRaise as {caught}:")
+        self.__emit(depth + 1, f"{kind} = {caught}.exception_type")
+        keyword = "if"
+        for exception_type, catch_ast in catchers.items():
+            self.__emit(depth + 1, f"{keyword} {kind} == {exception_type!r}:")
+            self.__block(catch_ast.get("statements"), scopes, depth + 2)
+            keyword = "elif"
+        if catchers:
+            self.__emit(depth + 1, "else:")
+            self.__emit(depth + 2, "raise")
+        else:
+            self.__emit(depth + 1, "raise")
+
+    # expressions
+
+    # code for a call; a user function's result is left unforced
+    def __call_node(self, call_ast, scopes):
+        return self.__call(
+            call_ast.get("name"), call_ast.get("args"), scopes, call_ast.line_num
+        )
+
+    def __call(self, name, args, scopes, line_num):
+        if name == "print":
+            parts = [f"show({self.__expr(arg, scopes)})" for arg in args]
+            if len(parts) == 1:
+                return f"output({parts[0]})"
+            # format each argument once and join the fragments in a single copy
+            return f"output(''.join(({', '.join(parts)},)))"
+        if name == "inputi" or name == "inputs":
+            if len(args) > 1:
+                return self.__fail(
+                    ErrorType.NAME_ERROR,
+                    "No inputi() function that takes > 1 parameter",
+                    line_num,
+                )
+            read = "int(get_input())" if name == "inputi" else "get_input()"
+            if args:
+                return f"(output(show({self.__expr(args[0], scopes)})), {read})[1]"
+            return read
+        if (name, len(args)) not in self.__functions:
+            native = NATIVES.get(name, len(args))
+            if native is not None:
+                if native.strict:
+                    values = [self.__expr(arg, scopes) for arg in args]
+                else:
+                    values = [self.__binding(arg, scopes) for arg in args]
+                # the trailing commas keep a single argument a tuple
+                args_code = "".join(f"{value}, " for value in values)
+                return f"call_native({name!r}, ({args_code}), {line_num!r})"
+            if name not in self.__function_names:
+                message = f"Function {name} not found"
+            else:
+                message = f"Function {name} taking {len(args)} params not found"
+            return self.__fail(ErrorType.NAME_ERROR, message, line_num)
+        bindings = [self.__binding(arg, scopes) for arg in args]
+        return f"f_{name}_{len(args)}({', '.join(bindings)})"
+
+    def __fail(self, error_type, message, line_num):
+        return f"fail(ErrorType.{error_type.name}, {message!r}, {line_num!r})"
+
+    # code for what a variable is bound to when it is assigned expr_ast (or an argument
+    # or return value is): a value when that costs nothing to find, else a Lazy
+    def __binding(self, expr_ast, scopes):
+        kind = expr_ast.elem_type
+        if kind in Transpiler.LITERAL_CODE or kind == InterpreterBase.NIL_NODE:
+            return self.__expr(expr_ast, scopes)
+        if kind == InterpreterBase.VAR_NODE:
+            target = lookup(scopes, expr_ast.get("name"))
+            if target is not None:
+                # forcing a thunk of a variable just forces the variable
+                return target
+        captured = sorted(
+            {
+                lookup(scopes, name)
+                for name in read_names(expr_ast)
+                if lookup(scopes, name) is not None
+            }
+        )
+        params = ", ".join(f"{name}={name}" for name in captured)
+        lazy = f"Lazy(lambda {params}: {self.__expr(expr_ast, scopes)})"
+        if not self.__pure(expr_ast, scopes):
+            return lazy
+        # a proven expression that cannot fail or call anything gives the same value
+        # whenever it runs, so once every variable it reads is forced it runs now
+        eager = self.__expr(expr_ast, scopes, forced=True)
+        if not captured:
+            return eager
+        guard = " and ".join(f"{name}.__class__ is not Lazy" for name in captured)
+        return f"({eager} if {guard} else {lazy})"
+
+    def __pure(self, expr_ast, scopes):
+        kind = expr_ast.elem_type
+        if kind in Transpiler.LITERAL_CODE or kind == InterpreterBase.NIL_NODE:
+            return True
+        if kind == InterpreterBase.VAR_NODE:
+            return lookup(scopes, expr_ast.get("name")) is not None
+        if kind in Interpreter.UNARY_OPS:
+            return expr_ast.cache is True and self.__pure(expr_ast.get("op1"), scopes)
+        if kind in Interpreter.BIN_OPS:
+            quick = expr_ast.cache
+            return (
+                quick is not None
+                and quick[4] is None
+                and kind != "/"
+                and self.__pure(expr_ast.get("op1"), scopes)
+                and self.__pure(expr_ast.get("op2"), scopes)
+            )
+        return False
+
+    # code for the forced value of expr_ast; with forced set, the variables it reads
+    # are known to hold values rather than Lazys
+    def __expr(self, expr_ast, scopes, forced=False):
+        kind = expr_ast.elem_type
+        if kind in Transpiler.LITERAL_CODE:
+            return Transpiler.LITERAL_CODE[kind](expr_ast.get("val"))
+        if kind == InterpreterBase.NIL_NODE:
+            return "None"
+        if kind == InterpreterBase.VAR_NODE:
+            name = expr_ast.get("name")
+            if "." in name:
+                raise UnsupportedProgram("field access")
+            target = lookup(scopes, name)
+            if target is None:
+                return self.__fail(
+                    ErrorType.NAME_ERROR,
+                    f"Variable {name} not found",
+                    expr_ast.line_num,
+                )
+            if forced:
+                return target
+            # a forced variable is rebound to its value, so it is forced only once
+            return (
+                f"({target} if {target}.__class__ is not Lazy "
+                f"else ({target} := {target}.force()))"
+            )
+        if kind == InterpreterBase.FCALL_NODE:
+            call = self.__call_node(expr_ast, scopes)
+            if expr_ast.get("name") in Interpreter.BUILTIN_FUNCS:
+                return call
+            result = self.__new_name("t")
+            return (
+                f"({result} if ({result} := {call}).__class__ is not Lazy "
+                f"else {result}.force())"
+            )
+        if kind in Interpreter.UNARY_OPS:
+            operand = self.__expr(expr_ast.get("op1"), scopes, forced)
+            if expr_ast.cache is True:
+                if kind == InterpreterBase.NEG_NODE:
+                    return f"(-{operand})"
+                return f"(not {operand})"
+            if kind == InterpreterBase.NEG_NODE:
+                return f"negate({operand}, {expr_ast.line_num!r})"
+            return f"logical_not({operand}, {expr_ast.line_num!r})"
+        if kind in Interpreter.BIN_OPS:
+            return self.__binary(expr_ast, scopes, forced)
+        raise UnsupportedProgram(kind)
+
+    def __binary(self, arith_ast, scopes, forced):
+        operator = arith_ast.elem_type
+        left = self.__expr(arith_ast.get("op1"), scopes, forced)
+        right = self.__expr(arith_ast.get("op2"), scopes, forced)
+        quick = arith_ast.cache
+        line_num = arith_ast.line_num
+        if quick is not None and quick[4] is None:
+            # operand types proven by TypeInference
+            left_type, right_type = quick[0], quick[1]
+            if operator == "&&":
+                return f"({left} and {right})"
+            if operator == "||":
+                return f"({left} or {right})"
+            if left_type != right_type:
+                # values of different types are never equal
+                return f"({left}, {right}, {operator == '!='})[2]"
+            if left_type == Type.INT:
+                if operator == "/":
+                    return f"divide({left}, {right}, {line_num!r})"
+                return f"({left} {Transpiler.INT_OPERATORS[operator]} {right})"
+            if operator == "+":
+                return f"concat_strings({left}, {right})"
+            return f"({left} {operator} {right})"
+        if operator == "&&" or operator == "||":
+            # short circuit on a bool left operand, as the tree walker does
+            stop = "False" if operator == "&&" else "True"
+            value = self.__new_name("t")
+            return (
+                f"({stop} if ({value} := {left}) is {stop} "
+                f"else binary_op({operator!r}, {value}, {right}, {line_num!r}))"
+            )
+        return f"binary_op({operator!r}, {left}, {right}, {line_num!r})"
+
+
+def lookup(scopes, name):
+    for scope in reversed(scopes):
+        if name in scope:
+            return scope[name]
+    return None
+
+
+# names of the variables expr_ast reads
+def read_names(expr_ast):
+    names = set()
+    pending = [expr_ast]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif node is not None and hasattr(node, "elem_type"):
+            if node.elem_type == InterpreterBase.VAR_NODE:
+                names.add(node.get("name"))
+            pending.extend(node.dict.values())
+    return names
+
+
+class CompiledInterpreter(Interpreter):
+    PROGRAM_CACHE_SIZE = 64
+    # (source, optimize) -> code object, or None for a program the tree walker runs
+    __programs = {}
+
+    # runs programs as Python code generated by the Transpiler; programs it cannot
+    # translate run on the tree walker. Step, time and memory limits are not counted
+    # in generated code, so a run that needs them should use Interpreter
+    def __init__(self, console_output=True, inp=None, optimize=True):
+        super().__init__(console_output, inp, optimize=optimize)
+        self.compiled = None  # whether the last run used generated code
+
+    def run(self, program):
+        code = self.compile(program)
+        if code is None:
+            self.compiled = False
+            return super().run(program)
+        self.compiled = True
+        scope = dict(RUNTIME)
+        scope["output"] = self.output
+        scope["get_input"] = self.get_input
+        exec(code, scope)
+        try:
+            scope["brewin_main"]()
+        except BrewinError as e:
+            super().error(e.error_type, e.message, e.line_num)
+        except BrewinRaise as e:
+            super().error(
+                ErrorType.FAULT_ERROR, "Raise condition is not caught", e.line_num
+            )
+
+    # the code object for program, compiled the first time it is seen
+    def compile(self, program):
+        key = (program, self.optimize)
+        if key in CompiledInterpreter.__programs:
+            return CompiledInterpreter.__programs[key]
+        source = self.transpile(program)
+        code = None
+        if source is not None:
+            try:
+                code = compile(source, "<brewin>", "exec")
+            except (SyntaxError, RecursionError, MemoryError):
+                # nesting deeper than Python's parser allows
+                code = None
+        cache = CompiledInterpreter.__programs
+        if len(cache) >= CompiledInterpreter.PROGRAM_CACHE_SIZE:
+            del cache[next(iter(cache))]
+        cache[key] = code
+        return code
+
+    # the Python source for program, or None if the Transpiler cannot translate it
+    def transpile(self, program):
+        ast = parse_program(program)
+        if self.optimize:
+            ast = Optimizer(self.op_to_lambda).optimize(ast)
+            TypeInference(self.find_quick_op).annotate(ast)
+        try:
+            return Transpiler().transpile(ast)
+        except UnsupportedProgram:
+            return None
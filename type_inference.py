@@ -0,0 +1,335 @@
+# The TypeInference pass proves the types of expressions before the program runs, so
+# the interpreter can drop the runtime type checks on operators and conditions whose
+# operand types are already known. It follows literals, assignments, call arguments and
+# return values through each function; anything it cannot follow is unknown and keeps
+# its runtime checks.
+#
+# The var_type/return_type annotations are not used: the interpreter never enforces
+# them (a variable declared int starts out nil and may be assigned any value), so they
+# prove nothing about the values a program actually computes.
+
+from element import Element
+from intbase import InterpreterBase
+from natives import NATIVES
+from type_valuev4 import Type
+
+# a type of None means "unknown"; NOTHING means no value has been seen yet, which is
+# what a parameter of a function that is never called holds
+NOTHING = "nothing"
+
+
+def join_types(a, b):
+    if a == NOTHING:
+        return b
+    if b == NOTHING or a == b:
+        return a
+    return None
+
+
+def is_known(t):
+    return t is not None and t != NOTHING
+
+
+class TypeInference:
+    LITERAL_TYPES = {
+        InterpreterBase.INT_NODE: Type.INT,
+        InterpreterBase.STRING_NODE: Type.STRING,
+        InterpreterBase.BOOL_NODE: Type.BOOL,
+        InterpreterBase.NIL_NODE: Type.NIL,
+    }
+    # builtins shadow user functions, so their result types are always known
+    BUILTIN_RESULT_TYPES = {
+        "print": Type.NIL,
+        "inputi": Type.INT,
+        "inputs": Type.STRING,
+    }
+    BOOL_RESULT_OPS = {"==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    ARITH_OPS = {"+", "-", "*", "/"}
+    BINARY_OPS = BOOL_RESULT_OPS | ARITH_OPS
+    UNARY_OPERAND_TYPES = {
+        InterpreterBase.NEG_NODE: Type.INT,
+        InterpreterBase.NOT_NODE: Type.BOOL,
+    }
+
+    # find_quick_op(operator, left type, right type) returns the interpreter's
+    # (result type, function on raw values) for those operands, or None if the
+    # operation is a type error
+    def __init__(self, find_quick_op):
+        self.find_quick_op = find_quick_op
+        self.report = None
+
+    # mark every operator and condition of ast whose operand types are proven:
+    # an operator's cache becomes (left type, right type, result type, function, None)
+    # and a unary operator's or an if/for node's cache becomes True. param_types maps
+    # (name, number of args) to the types a function's parameters start out with
+    def annotate(self, ast, param_types=None):
+        functions = ast.get("functions")
+        # same resolution as the interpreter's function table: the last definition wins
+        self.__func_table = {}
+        for func_ast in functions:
+            key = (func_ast.get("name"), len(func_ast.get("args")))
+            self.__func_table[key] = func_ast
+        self.__param_types = {
+            id(func_ast): [NOTHING] * len(func_ast.get("args"))
+            for func_ast in functions
+        }
+        for key, types in (param_types or {}).items():
+            func_ast = self.__func_table.get(key)
+            if func_ast is not None:
+                self.__param_types[id(func_ast)] = list(types)
+        self.__return_types = {id(func_ast): NOTHING for func_ast in functions}
+
+        # parameter and return types flow between functions, so analyze them all until
+        # none of those types changes, then once more to mark what was proven
+        self.__marking = False
+        self.__changed = True
+        while self.__changed:
+            self.__changed = False
+            for func_ast in functions:
+                self.__analyze_function(func_ast)
+        self.__marking = True
+        self.__eliminated = 0
+        for func_ast in functions:
+            self.__analyze_function(func_ast)
+
+        checks = count_checks(ast)
+        self.report = {
+            "checks": checks,
+            "eliminated": self.__eliminated,
+            "fraction": self.__eliminated / checks if checks else 0.0,
+        }
+        return ast
+
+    def __analyze_function(self, func_ast):
+        params = {}
+        for arg_ast, t in zip(func_ast.get("args"), self.__param_types[id(func_ast)]):
+            params[arg_ast.get("name")] = t
+        self.__func_ast = func_ast
+        env = self.__analyze_block(func_ast.get("statements"), [params])
+        if env is not None:
+            # falling off the end of a function returns nil
+            self.__add_return_type(Type.NIL)
+
+    # an env is the list of scopes of the running function, mapping each variable to
+    # its type; None stands for unreachable code
+    def __analyze_block(self, statements, env):
+        env = copy_env(env)
+        env.append({})
+        for statement in statements:
+            env = self.__analyze_statement(statement, env)
+            if env is None:
+                return None
+        env.pop()
+        return env
+
+    def __analyze_statement(self, statement, env):
+        elem_type = statement.elem_type
+        if elem_type == InterpreterBase.FCALL_NODE:
+            self.__infer(statement, env)
+        elif elem_type == "=":
+            t = self.__infer(statement.get("expression"), env)
+            assign_type(env, statement.get("name"), t)
+        elif elem_type == InterpreterBase.VAR_DEF_NODE:
+            env[-1][statement.get("name")] = Type.NIL
+        elif elem_type == InterpreterBase.RETURN_NODE:
+            expr_ast = statement.get("expression")
+            if expr_ast is None:
+                self.__add_return_type(Type.NIL)
+            else:
+                self.__add_return_type(self.__infer(expr_ast, env))
+            return None
+        elif elem_type == InterpreterBase.RAISE_NODE:
+            self.__infer(statement.get("exception_type"), env)
+            return None
+        elif elem_type == InterpreterBase.IF_NODE:
+            return self.__analyze_if(statement, env)
+        elif elem_type == InterpreterBase.FOR_NODE:
+            return self.__analyze_for(statement, env)
+        elif elem_type == InterpreterBase.TRY_NODE:
+            return self.__analyze_try(statement, env)
+        return env
+
+    def __analyze_if(self, if_ast, env):
+        self.__check_condition(if_ast, env)
+        then_env = self.__analyze_block(if_ast.get("statements"), env)
+        else_statements = if_ast.get("else_statements")
+        if else_statements is not None:
+            env = self.__analyze_block(else_statements, env)
+        return join_envs(then_env, env)
+
+    def __analyze_for(self, for_ast, env):
+        env = self.__analyze_statement(for_ast.get("init"), env)
+        # find the types that hold every time the condition is checked, then analyze
+        # the loop once more under those types to mark it
+        marking = self.__marking
+        self.__marking = False
+        while True:
+            loop_env = self.__analyze_loop_body(for_ast, env)
+            if loop_env == env:
+                break
+            env = loop_env
+        self.__marking = marking
+        self.__analyze_loop_body(for_ast, env)
+        return env
+
+    # analyze one iteration starting from env and join its result into env
+    def __analyze_loop_body(self, for_ast, env):
+        self.__check_condition(for_ast, env)
+        body_env = self.__analyze_block(for_ast.get("statements"), env)
+        if body_env is not None:
+            body_env = self.__analyze_statement(for_ast.get("update"), body_env)
+        return join_envs(env, body_env)
+
+    def __analyze_try(self, try_ast, env):
+        statements = try_ast.get("statements")
+        result_env = self.__analyze_block(statements, env)
+        # a catch block may start from any point of the try block, so every variable
+        # the try block assigns is unknown there
+        catch_env = copy_env(env)
+        assigned = assigned_names(statements)
+        for scope in catch_env:
+            for name in scope:
+                if name in assigned:
+                    scope[name] = None
+        for catch_ast in try_ast.get("catchers"):
+            end_env = self.__analyze_block(catch_ast.get("statements"), catch_env)
+            result_env = join_envs(result_env, end_env)
+        return result_env
+
+    def __check_condition(self, node, env):
+        t = self.__infer(node.get("condition"), env)
+        if self.__marking and t == Type.BOOL:
+            node.cache = True
+            self.__eliminated += 1
+
+    def __add_return_type(self, t):
+        key = id(self.__func_ast)
+        joined = join_types(self.__return_types[key], t)
+        if joined != self.__return_types[key]:
+            self.__return_types[key] = joined
+            self.__changed = True
+
+    # return the type of expr_ast, marking the operators proven along the way
+    def __infer(self, expr_ast, env):
+        elem_type = expr_ast.elem_type
+        if elem_type in TypeInference.LITERAL_TYPES:
+            return TypeInference.LITERAL_TYPES[elem_type]
+        if elem_type == InterpreterBase.VAR_NODE:
+            return lookup_type(env, expr_ast.get("name"))
+        if elem_type == InterpreterBase.FCALL_NODE:
+            return self.__infer_call(expr_ast, env)
+        if elem_type in TypeInference.UNARY_OPERAND_TYPES:
+            operand_type = TypeInference.UNARY_OPERAND_TYPES[elem_type]
+            if self.__infer(expr_ast.get("op1"), env) == operand_type:
+                if self.__marking:
+                    expr_ast.cache = True
+                    self.__eliminated += 1
+            return operand_type
+        if elem_type in TypeInference.BINARY_OPS:
+            return self.__infer_op(expr_ast, env)
+        return None
+
+    def __infer_op(self, arith_ast, env):
+        operator = arith_ast.elem_type
+        left_type = self.__infer(arith_ast.get("op1"), env)
+        right_type = self.__infer(arith_ast.get("op2"), env)
+        if self.__marking and is_known(left_type) and is_known(right_type):
+            quick = self.find_quick_op(operator, left_type, right_type)
+            if quick is not None:
+                arith_ast.cache = (left_type, right_type, quick[0], quick[1], None)
+                self.__eliminated += 1
+        # an operation that does not fail produces a bool or a value of its left
+        # operand's type
+        if operator in TypeInference.BOOL_RESULT_OPS:
+            return Type.BOOL
+        return left_type
+
+    def __infer_call(self, call_ast, env):
+        name = call_ast.get("name")
+        args = call_ast.get("args")
+        arg_types = [self.__infer(arg, env) for arg in args]
+        if name in TypeInference.BUILTIN_RESULT_TYPES:
+            return TypeInference.BUILTIN_RESULT_TYPES[name]
+        func_ast = self.__func_table.get((name, len(args)))
+        if func_ast is None:
+            # a native declares its result type (None when it varies)
+            native = NATIVES.get(name, len(args))
+            return None if native is None else native.result_type
+        param_types = self.__param_types[id(func_ast)]
+        for index, t in enumerate(arg_types):
+            joined = join_types(param_types[index], t)
+            if joined != param_types[index]:
+                param_types[index] = joined
+                self.__changed = True
+        return self.__return_types[id(func_ast)]
+
+
+def copy_env(env):
+    return [dict(scope) for scope in env]
+
+
+def join_envs(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    joined = []
+    for scope_a, scope_b in zip(a, b):
+        joined.append(
+            {
+                name: join_types(t, scope_b[name]) if name in scope_b else None
+                for name, t in scope_a.items()
+            }
+        )
+    return joined
+
+
+def lookup_type(env, name):
+    if "." in name:
+        return None
+    for scope in reversed(env):
+        if name in scope:
+            return scope[name]
+    return None
+
+
+def assign_type(env, name, t):
+    for scope in reversed(env):
+        if name in scope:
+            scope[name] = t
+            return
+
+
+# names of all the variables assigned anywhere in statements
+def assigned_names(statements):
+    names = set()
+    pending = list(statements)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, Element):
+            if node.elem_type == "=":
+                names.add(node.get("name"))
+            pending.extend(node.dict.values())
+    return names
+
+
+# number of runtime type checks in ast: one per operator and per if/for condition
+def count_checks(ast):
+    checks = 0
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, Element):
+            if (
+                node.elem_type in TypeInference.BINARY_OPS
+                or node.elem_type in TypeInference.UNARY_OPERAND_TYPES
+                or node.elem_type == InterpreterBase.IF_NODE
+                or node.elem_type == InterpreterBase.FOR_NODE
+            ):
+                checks += 1
+            pending.extend(node.dict.values())
+    return checks
@@ -1,3 +1,5 @@
+import sys
+
 from intbase import InterpreterBase
 
 
@@ -8,6 +10,7 @@ class Type:
     STRING = "string"
     NIL = "nil"
     THUNK = "thunk"
+    STRUCT = "struct"  # the value is a structs.Struct
 
 
 # Represents a thunk object, which is an unevaluated object to support lazy evaluation
@@ -22,6 +25,16 @@ class Thunk:
     def env_snapshot(self):
         return self.__env_snapshot
 
+    # approximate number of bytes held by the snapshot's frame lists and scope dicts
+    # (the Value objects themselves are shared with the live environment)
+    def snapshot_bytes(self):
+        total = sys.getsizeof(self.__env_snapshot)
+        for func_block in self.__env_snapshot:
+            total += sys.getsizeof(func_block)
+            for block in func_block:
+                total += sys.getsizeof(block)
+        return total
+
     def custom_copy(self, env):
         ret_env = []
         for func_block in env:
@@ -33,6 +46,61 @@ class Thunk:
         return ret_env
 
 
+# Represents a string built by concatenation. The pieces live in a list that is shared
+# by every rope built from the same prefix, so appending to the newest rope is O(1)
+# amortized; the pieces are only joined when the string is printed or compared
+class StringRope:
+    __slots__ = ("__pieces", "__count", "__length", "__flat")
+
+    def __init__(self, pieces, count, length):
+        self.__pieces = pieces
+        self.__count = count  # this rope is made of pieces[:count]
+        self.__length = length
+        self.__flat = None
+
+    def append(self, piece):
+        pieces = self.__pieces
+        if len(pieces) != self.__count:
+            # a longer rope already extended the shared list, so branch off a copy
+            pieces = pieces[: self.__count]
+        pieces.append(piece)
+        return StringRope(pieces, self.__count + 1, self.__length + len(piece))
+
+    def pieces(self):
+        return self.__pieces
+
+    def __str__(self):
+        if self.__flat is None:
+            self.__flat = "".join(self.__pieces[: self.__count])
+            # continue appending on a private list holding just the joined string
+            self.__pieces = [self.__flat]
+            self.__count = 1
+        return self.__flat
+
+    def __len__(self):
+        return self.__length
+
+    def __eq__(self, other):
+        if not isinstance(other, (str, StringRope)):
+            return NotImplemented
+        return len(self) == len(other) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+# strings shorter than this are concatenated directly rather than through a rope
+ROPE_MIN_LENGTH = 64
+
+
+def concat_strings(left, right):
+    if left.__class__ is StringRope:
+        return left.append(str(right))
+    if len(left) + len(right) < ROPE_MIN_LENGTH:
+        return left + str(right)
+    return StringRope([left], 1, len(left)).append(str(right))
+
+
 # Represents a value, which has a type and its value
 class Value:
     def __init__(self, type, value=None):
@@ -67,16 +135,20 @@ def create_value(val):
         raise ValueError("Unknown value type")
 
 
+# maps each printable type to the function that formats its raw value
+PRINT_FORMATTERS = {
+    Type.INT: str,
+    Type.STRING: str,
+    Type.BOOL: lambda v: "true" if v else "false",
+    Type.NIL: lambda v: InterpreterBase.NIL_DEF,
+}
+
+
 def get_printable(val):
-    if val.type() == Type.INT:
-        return str(val.value())
-    if val.type() == Type.STRING:
-        return val.value()
-    if val.type() == Type.BOOL:
-        if val.value() is True:
-            return "true"
-        return "false"
-    return None
+    formatter = PRINT_FORMATTERS.get(val.type())
+    if formatter is None:
+        return None
+    return formatter(val.value())
 
 
 # def get_printable_debug(val):
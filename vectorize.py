@@ -0,0 +1,327 @@
+# The BatchEvaluator runs one pure Brewin function on many rows of arguments at once,
+# with NumPy. Each argument is a column (an array with one value per row), and every
+# expression of the function is evaluated for all rows together: arithmetic and
+# comparisons become array operations, and an if statement runs both of its blocks,
+# each for the rows whose condition selects it, merging what they assign with masked
+# selection. Along with its values, a column keeps a mask of the rows where it is bad:
+# its value is nil or a string, or finding it was an error, a raise (division by zero)
+# or an int64 overflow. A row whose result is bad, or that reaches a statement the
+# evaluator does not support (for, try, raise, a field, ...), is run again on its own
+# by the interpreter, so every row gets the result, error or raise it would get from
+# Interpreter.run_function. Only values a row actually uses decide whether it is bad,
+# which keeps laziness: an argument or variable that fails is harmless until it is
+# read.
+
+import numpy as np
+
+from intbase import InterpreterBase
+from speculation import PurityAnalysis
+from type_valuev4 import StringRope, Type
+
+INT_MIN = np.iinfo(np.int64).min
+INT_MAX = np.iinfo(np.int64).max
+
+
+class Column:
+    __slots__ = ("type", "values", "bad")
+
+    # type is Type.INT or Type.BOOL, or None when every row is bad (values is then
+    # None); values and bad are arrays, or NumPy scalars standing for every row
+    def __init__(self, value_type, values, bad):
+        self.type = value_type
+        self.values = values
+        self.bad = bad
+
+
+BAD = Column(None, None, np.True_)
+
+
+# the values of one call: its scopes (innermost last) and what it returns so far
+class Frame:
+    __slots__ = ("scopes", "result")
+
+    def __init__(self, scopes):
+        self.scopes = scopes
+        self.result = BAD
+
+
+class BatchEvaluator:
+    COMPARISONS = {
+        "==": np.equal,
+        "!=": np.not_equal,
+        "<": np.less,
+        "<=": np.less_equal,
+        ">": np.greater,
+        ">=": np.greater_equal,
+    }
+    BOOL_COMPARISONS = {"==", "!=", "&&", "||"}
+    # natives evaluated as array operations, on int arguments
+    NATIVES = {("min", 2): np.minimum, ("max", 2): np.maximum}
+    BUILTINS = {"print", "inputi", "inputs"}
+
+    # func_table is the interpreter's function table; vectorize is False when every
+    # row must be run by the interpreter, e.g. to count its steps
+    def __init__(self, func_table, vectorize=True):
+        self.__func_table = func_table
+        self.__vectorize = vectorize
+        self.__running = set()  # ids of the functions being evaluated
+
+    # run func_ast on every row of args, a list of arrays (or scalars) broadcast to
+    # one shape, and return the array of results. run_row(raw argument values) runs
+    # one row on the interpreter and returns the Value it gives
+    def run(self, func_ast, args, run_row):
+        args = np.broadcast_arrays(*[np.asarray(arg) for arg in args])
+        shape = args[0].shape if args else ()
+        columns = [self.__column(arg) for arg in args]
+        if self.__vectorize and id(func_ast) in PurityAnalysis(self.__func_table).pure:
+            result = self.__call(func_ast, columns)
+        else:
+            result = BAD  # an impure function runs row by row, in order
+        bad = np.broadcast_to(result.bad, shape).ravel()
+        rows = np.flatnonzero(bad)
+        flat_args = [arg.ravel() for arg in args]
+        raw_results = []
+        for row in rows.tolist():
+            raw = run_row([arg.item(row) for arg in flat_args]).value()
+            raw_results.append(str(raw) if raw.__class__ is StringRope else raw)
+        if result.type is None:
+            return self.__to_array(raw_results, shape)
+        results = np.array(np.broadcast_to(result.values, shape))
+        fits = int if result.type == Type.INT else bool
+        if any(not self.__fits(raw, fits) for raw in raw_results):
+            results = results.astype(object)
+        results.reshape(-1)[rows] = raw_results
+        return results
+
+    # the column of an argument array; values NumPy cannot hold as int64 or bool
+    # (strings, nil, big ints) are left to the interpreter
+    def __column(self, arg):
+        kind = arg.dtype.kind
+        if kind == "b":
+            return Column(Type.BOOL, arg, np.False_)
+        if kind == "i":
+            return Column(Type.INT, arg.astype(np.int64, copy=False), np.False_)
+        if kind == "u":
+            bad = arg > INT_MAX if arg.dtype.itemsize == 8 else np.False_
+            return Column(Type.INT, arg.astype(np.int64), bad)
+        return BAD
+
+    def __fits(self, raw, fits):
+        if raw.__class__ is not fits:
+            return False
+        return fits is bool or INT_MIN <= raw <= INT_MAX
+
+    # an int64 or bool array of raw_results if they allow one, else an object array
+    def __to_array(self, raw_results, shape):
+        for fits, dtype in ((int, np.int64), (bool, np.bool_)):
+            if all(self.__fits(raw, fits) for raw in raw_results):
+                return np.array(raw_results, dtype=dtype).reshape(shape)
+        results = np.empty(len(raw_results), dtype=object)
+        results[:] = raw_results
+        return results.reshape(shape)
+
+    # statements
+
+    # the column func_ast returns for columns of arguments
+    def __call(self, func_ast, columns):
+        if id(func_ast) in self.__running:
+            return BAD  # recursion depends on the row
+        params = {}
+        for formal_ast, column in zip(func_ast.get("args"), columns):
+            params[formal_ast.get("name")] = column
+        frame = Frame([params])
+        self.__running.add(id(func_ast))
+        try:
+            # a row that runs off the end of the function returns nil, which stays bad
+            self.__run_block(func_ast.get("statements"), frame, np.True_)
+        finally:
+            self.__running.discard(id(func_ast))
+        return frame.result
+
+    # run statements for the rows in active; returns the rows that did not return
+    def __run_block(self, statements, frame, active):
+        frame.scopes.append({})
+        for statement in statements:
+            if not active.any():
+                break
+            active = self.__run_statement(statement, frame, active)
+        frame.scopes.pop()
+        return active
+
+    def __run_statement(self, statement, frame, active):
+        kind = statement.elem_type
+        if kind == InterpreterBase.VAR_DEF_NODE:
+            if statement.get("name") in frame.scopes[-1]:
+                return self.__give_up(frame, active)  # duplicate definition
+            frame.scopes[-1][statement.get("name")] = BAD
+            return active
+        if kind == "=":
+            name = statement.get("name")
+            scope = self.__scope_of(name, frame)
+            if scope is None or "." in name:
+                return self.__give_up(frame, active)
+            value = self.__eval(statement.get("expression"), frame)
+            scope[name] = self.__select(active, value, scope[name])
+            return active
+        if kind == InterpreterBase.IF_NODE:
+            return self.__run_if(statement, frame, active)
+        if kind == InterpreterBase.RETURN_NODE:
+            expr_ast = statement.get("expression")
+            value = BAD if expr_ast is None else self.__eval(expr_ast, frame)
+            frame.result = self.__select(active, value, frame.result)
+            return np.False_
+        if kind == InterpreterBase.FCALL_NODE:
+            # the call does nothing but may fail, so its rows fail when it is bad
+            value = self.__eval(statement, frame)
+            failed = active & value.bad
+            frame.result = self.__select(failed, BAD, frame.result)
+            return active & ~failed
+        return self.__give_up(frame, active)
+
+    def __run_if(self, if_ast, frame, active):
+        condition = self.__eval(if_ast.get("condition"), frame)
+        if condition.type != Type.BOOL:
+            return self.__give_up(frame, active)
+        failed = active & condition.bad
+        frame.result = self.__select(failed, BAD, frame.result)
+        active = active & ~failed
+        then_rows = self.__run_block(
+            if_ast.get("statements"), frame, active & condition.values
+        )
+        else_rows = active & ~condition.values
+        if if_ast.get("else_statements") is not None:
+            else_rows = self.__run_block(
+                if_ast.get("else_statements"), frame, else_rows
+            )
+        return then_rows | else_rows
+
+    # the rows in active return something the interpreter has to find
+    def __give_up(self, frame, active):
+        frame.result = self.__select(active, BAD, frame.result)
+        return np.False_
+
+    def __scope_of(self, name, frame):
+        for scope in reversed(frame.scopes):
+            if name in scope:
+                return scope
+        return None
+
+    # the column that is a in the rows of mask and b in the others; rows whose values
+    # have another type than the column keeps are bad
+    def __select(self, mask, a, b):
+        if a.type is None:
+            if b.type is None:
+                return BAD
+            return Column(b.type, b.values, b.bad | mask)
+        if b.type != a.type:
+            return Column(a.type, a.values, a.bad | ~mask)
+        return Column(
+            a.type, np.where(mask, a.values, b.values), np.where(mask, a.bad, b.bad)
+        )
+
+    # expressions
+
+    def __eval(self, expr_ast, frame):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.INT_NODE:
+            value = expr_ast.get("val")
+            if not INT_MIN <= value <= INT_MAX:
+                return BAD
+            return Column(Type.INT, np.int64(value), np.False_)
+        if kind == InterpreterBase.BOOL_NODE:
+            return Column(Type.BOOL, np.bool_(expr_ast.get("val")), np.False_)
+        if kind == InterpreterBase.VAR_NODE:
+            scope = self.__scope_of(expr_ast.get("name"), frame)
+            return BAD if scope is None else scope[expr_ast.get("name")]
+        if kind == InterpreterBase.FCALL_NODE:
+            return self.__eval_call(expr_ast, frame)
+        if kind == InterpreterBase.NEG_NODE:
+            op1 = self.__eval(expr_ast.get("op1"), frame)
+            if op1.type != Type.INT:
+                return BAD
+            with np.errstate(all="ignore"):
+                return Column(Type.INT, -op1.values, op1.bad | (op1.values == INT_MIN))
+        if kind == InterpreterBase.NOT_NODE:
+            op1 = self.__eval(expr_ast.get("op1"), frame)
+            if op1.type != Type.BOOL:
+                return BAD
+            return Column(Type.BOOL, ~op1.values, op1.bad)
+        if kind in ("&&", "||"):
+            return self.__eval_logical(expr_ast, frame)
+        if kind in BatchEvaluator.COMPARISONS or kind in ("+", "-", "*", "/"):
+            return self.__eval_binary(expr_ast, frame)
+        return BAD  # nil, strings and structs
+
+    def __eval_call(self, call_ast, frame):
+        name = call_ast.get("name")
+        args = call_ast.get("args")
+        if name in BatchEvaluator.BUILTINS:
+            return BAD
+        # the same resolution as the interpreter's: user functions shadow natives
+        func_ast = self.__func_table.get(name, {}).get(len(args))
+        if func_ast is not None:
+            return self.__call(func_ast, [self.__eval(arg, frame) for arg in args])
+        native = BatchEvaluator.NATIVES.get((name, len(args)))
+        if native is None:
+            return BAD
+        columns = [self.__eval(arg, frame) for arg in args]
+        if any(column.type != Type.INT for column in columns):
+            return BAD
+        bad = np.False_
+        for column in columns:
+            bad = bad | column.bad
+        return Column(Type.INT, native(*[column.values for column in columns]), bad)
+
+    # a && b and a || b: b only decides the rows a does not short circuit
+    def __eval_logical(self, expr_ast, frame):
+        op1 = self.__eval(expr_ast.get("op1"), frame)
+        if op1.type != Type.BOOL:
+            return BAD
+        op2 = self.__eval(expr_ast.get("op2"), frame)
+        needs_op2 = op1.values if expr_ast.elem_type == "&&" else ~op1.values
+        if op2.type != Type.BOOL:
+            # the rows that short circuit have op1's value
+            return Column(Type.BOOL, op1.values, op1.bad | needs_op2)
+        if expr_ast.elem_type == "&&":
+            values = op1.values & op2.values
+        else:
+            values = op1.values | op2.values
+        return Column(Type.BOOL, values, op1.bad | (needs_op2 & op2.bad))
+
+    def __eval_binary(self, expr_ast, frame):
+        operator = expr_ast.elem_type
+        op1 = self.__eval(expr_ast.get("op1"), frame)
+        op2 = self.__eval(expr_ast.get("op2"), frame)
+        if op1.type is None or op2.type is None or op1.type != op2.type:
+            return BAD
+        bad = op1.bad | op2.bad
+        x = op1.values
+        y = op2.values
+        if operator in BatchEvaluator.COMPARISONS:
+            if (
+                op1.type == Type.BOOL
+                and operator not in BatchEvaluator.BOOL_COMPARISONS
+            ):
+                return BAD
+            return Column(Type.BOOL, BatchEvaluator.COMPARISONS[operator](x, y), bad)
+        if op1.type != Type.INT:
+            return BAD
+        # int64 wraps around where Brewin's ints do not; those rows are bad
+        with np.errstate(all="ignore"):
+            if operator == "+":
+                values = x + y
+                bad = bad | (((x ^ values) & (y ^ values)) < 0)
+            elif operator == "-":
+                values = x - y
+                bad = bad | (((x ^ y) & (x ^ values)) < 0)
+            elif operator == "*":
+                values = x * y
+                divisor = np.where(x == 0, 1, x)
+                wrapped = (values // divisor != y) | ((x == -1) & (y == INT_MIN))
+                bad = bad | ((x != 0) & wrapped)
+            else:
+                # dividing by zero raises div0
+                divisor = np.where(y == 0, 1, y)
+                values = x // divisor
+                bad = bad | (y == 0) | ((x == INT_MIN) & (y == -1))
+        return Column(Type.INT, values, bad)